@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the parts of the Apify API the app uses, so discovery and enrichment can run offline
+- serve:     run the stand-in on its own; point the app at it with APIFY_API_URL=http://127.0.0.1:<port>
+- roundtrip: start the stand-in and the app's /apify/webhook endpoint locally, then drive
+             run start -> webhook -> dataset fetch through aiter_apify_hashtag_items and
+             call_apify_profile_enrichment_async and check the results (uses DATABASE_URL for ApifyRun rows)
+
+Runs finish after --run-seconds; the stand-in then calls the webhooks registered at start, like Apify does.
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+import httpx
+from flask import Flask, request, jsonify
+from werkzeug.serving import make_server
+
+standin = Flask(__name__)
+standin.config['RUN_SECONDS'] = 2.0
+standin.config['POSTS_PER_HASHTAG'] = 50
+
+_lock = threading.Lock()
+_runs = {}  # run_id -> run object
+_datasets = {}  # dataset_id -> list of items
+
+
+def decode_webhooks(encoded):
+    """Decode the base64 JSON webhook list the Apify client sends with a run start"""
+    if not encoded:
+        return []
+    webhooks = json.loads(base64.b64decode(encoded))
+    return [{'event_types': webhook.get('eventTypes') or webhook.get('event_types') or [],
+             'request_url': webhook.get('requestUrl') or webhook.get('request_url')}
+            for webhook in webhooks]
+
+
+def hashtag_items(run_input):
+    """One dataset item per hashtag with POSTS_PER_HASHTAG posts by distinct owners"""
+    keyword = run_input.get('search', 'standin')
+    base_time = datetime(2025, 1, 1)
+    posts = [
+        {
+            'ownerUsername': f'standin_{keyword}_{i}',
+            'timestamp': (base_time + timedelta(minutes=i)).isoformat() + 'Z',
+            'url': f'https://www.instagram.com/p/standin{i}/',
+            'caption': f'Stand-in caption {i} #{keyword}'
+        }
+        for i in range(standin.config['POSTS_PER_HASHTAG'])
+    ]
+    return [{'id': keyword, 'name': keyword, 'latestPosts': posts}]
+
+
+def profile_items(run_input):
+    """One profile per requested Instagram URL"""
+    items = []
+    for i, url in enumerate(run_input.get('instagram_ids') or []):
+        username = url.rstrip('/').split('/')[-1]
+        items.append({
+            'username': username,
+            'full_name': f'Stand-in {username}',
+            'biography': f'Stand-in profile {i}',
+            'follower_count': 1000 + i,
+            'following_count': 100,
+            'media_count': 10,
+            'is_verified': False,
+            'public_email': f'{username}@example.com' if i % 2 == 0 else ''
+        })
+    return items
+
+
+def finish_run(run_id, webhooks):
+    """Mark a run as succeeded and deliver its webhooks"""
+    with _lock:
+        run = _runs[run_id]
+        run['status'] = 'SUCCEEDED'
+        run['finishedAt'] = datetime.utcnow().isoformat() + 'Z'
+        run = dict(run)
+
+    for webhook in webhooks:
+        if 'ACTOR.RUN.SUCCEEDED' not in webhook['event_types']:
+            continue
+        payload = {'eventType': 'ACTOR.RUN.SUCCEEDED', 'eventData': {'actorRunId': run_id}, 'resource': run}
+        try:
+            httpx.post(webhook['request_url'], json=payload, timeout=10)
+        except httpx.HTTPError as e:
+            print(f"⚠️ Webhook delivery for run {run_id} failed: {e}")
+
+
+@standin.route('/v2/acts/<actor_id>/runs', methods=['POST'])
+def start_run(actor_id):
+    """Start a run: its dataset is produced immediately, its status flips to SUCCEEDED after RUN_SECONDS"""
+    run_input = request.get_json(silent=True) or {}
+    webhooks = decode_webhooks(request.args.get('webhooks'))
+    items = profile_items(run_input) if 'instagram_ids' in run_input else hashtag_items(run_input)
+
+    run_id = uuid.uuid4().hex[:17]
+    dataset_id = uuid.uuid4().hex[:17]
+    run = {
+        'id': run_id,
+        'actId': actor_id,
+        'status': 'RUNNING',
+        'defaultDatasetId': dataset_id,
+        'startedAt': datetime.utcnow().isoformat() + 'Z'
+    }
+    with _lock:
+        _runs[run_id] = run
+        _datasets[dataset_id] = items
+
+    timer = threading.Timer(standin.config['RUN_SECONDS'], finish_run, (run_id, webhooks))
+    timer.daemon = True
+    timer.start()
+    return jsonify({'data': run}), 201
+
+
+@standin.route('/v2/actor-runs/<run_id>')
+def get_run(run_id):
+    """Return the current run object"""
+    with _lock:
+        run = _runs.get(run_id)
+        if run is None:
+            return jsonify({'error': {'type': 'record-not-found'}}), 404
+        return jsonify({'data': dict(run)})
+
+
+@standin.route('/v2/datasets/<dataset_id>/items')
+def list_items(dataset_id):
+    """Return a page of dataset items with the pagination headers the Apify client reads"""
+    with _lock:
+        items = _datasets.get(dataset_id)
+    if items is None:
+        return jsonify({'error': {'type': 'record-not-found'}}), 404
+
+    offset = request.args.get('offset', 0, type=int)
+    limit = request.args.get('limit', 1000, type=int) or 1000
+    page = items[offset:offset + limit]
+    response = jsonify(page)
+    response.headers['X-Apify-Pagination-Total'] = str(len(items))
+    response.headers['X-Apify-Pagination-Offset'] = str(offset)
+    response.headers['X-Apify-Pagination-Count'] = str(len(page))
+    response.headers['X-Apify-Pagination-Limit'] = str(limit)
+    response.headers['X-Apify-Pagination-Desc'] = 'false'
+    return response
+
+
+def serve_in_thread(flask_app, port):
+    """Serve a Flask app from a daemon thread and return the server"""
+    server = make_server('127.0.0.1', port, flask_app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=8765, help='Port of the stand-in')
+    parser.add_argument('--run-seconds', type=float, default=2.0, help='How long each stand-in run takes')
+    parser.add_argument('--posts', type=int, default=50, help='Posts per hashtag dataset item')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    subparsers.add_parser('serve', help='Run the stand-in in the foreground')
+
+    roundtrip_parser = subparsers.add_parser('roundtrip', help='Drive discovery and enrichment runs through the stand-in')
+    roundtrip_parser.add_argument('--app-port', type=int, default=8766, help='Port for the app that receives webhooks')
+    roundtrip_parser.add_argument('--runs', type=int, default=3, help='Concurrent hashtag runs')
+    roundtrip_parser.add_argument('--no-webhook', action='store_true',
+                                  help='Register no webhook, so runs are only noticed by polling')
+    return parser.parse_args()
+
+
+async def drive_roundtrip(args):
+    """Run hashtag searches concurrently, enrich the found profiles and return the number of failed checks"""
+    # main reads its Apify settings at import time
+    os.environ['APIFY_API_URL'] = f'http://127.0.0.1:{args.port}'
+    if args.no_webhook:
+        os.environ.pop('APIFY_WEBHOOK_URL', None)
+    else:
+        os.environ['APIFY_WEBHOOK_URL'] = f'http://127.0.0.1:{args.app_port}/apify/webhook'
+        # A long first poll interval means a run finishing on time can only have been woken by the webhook
+        os.environ.setdefault('APIFY_POLL_INITIAL_SECONDS', str(max(30.0, args.run_seconds * 10)))
+
+    from main import (app, aiter_apify_hashtag_items, abuffer_hashtag_profiles, call_apify_profile_enrichment_async,
+                      provider_clients, DiscoveryBuffer)
+
+    app_server = None if args.no_webhook else serve_in_thread(app, args.app_port)
+    failures = 0
+    try:
+        print(f"🚀 {args.runs} hashtag run(s) of {args.run_seconds:.1f}s each, "
+              f"{'polling only' if args.no_webhook else 'webhook at ' + os.environ['APIFY_WEBHOOK_URL']}")
+
+        async def timed_search(n):
+            started = time.perf_counter()
+            keyword = f'standin{n}'
+            items = aiter_apify_hashtag_items('DrF9mzPPEuVizVF4l', {'search': keyword, 'searchType': 'hashtag',
+                                                                    'searchLimit': 1}, 'standin-token')
+            with DiscoveryBuffer() as buffer:
+                await abuffer_hashtag_profiles(items, keyword, buffer)
+                records = list(buffer.iter_records())
+            return records, time.perf_counter() - started
+
+        started = time.perf_counter()
+        results = await asyncio.gather(*(timed_search(n) for n in range(args.runs)))
+        usernames = []
+        for n, (items, elapsed) in enumerate(results):
+            ok = len(items) == args.posts
+            failures += int(not ok)
+            usernames += [item['username'] for item in items]
+            print(f"   {'✅' if ok else '❌'} #standin{n}: {len(items)}/{args.posts} profiles after {elapsed:.2f}s")
+        print(f"⏱️ Hashtag runs took {time.perf_counter() - started:.2f}s in total")
+
+        started = time.perf_counter()
+        requested = usernames[:args.posts]
+        profiles = await call_apify_profile_enrichment_async(
+            '8WEn9FvZnhE7lM3oA', {'instagram_ids': [f'https://www.instagram.com/{u}' for u in requested]},
+            'standin-token')
+        ok = sorted(profile['username'] for profile in profiles) == sorted(requested)
+        failures += int(not ok)
+        print(f"   {'✅' if ok else '❌'} Enrichment: {len(profiles)}/{len(requested)} profiles "
+              f"after {time.perf_counter() - started:.2f}s")
+    finally:
+        await provider_clients.aclose_loop()
+        if app_server:
+            app_server.shutdown()
+    return failures
+
+
+def main():
+    args = parse_args()
+    standin.config['RUN_SECONDS'] = args.run_seconds
+    standin.config['POSTS_PER_HASHTAG'] = args.posts
+
+    if args.command == 'serve':
+        print(f"🧪 Apify stand-in listening on http://127.0.0.1:{args.port}")
+        standin.run(host='127.0.0.1', port=args.port, threaded=True)
+        return
+
+    standin_server = serve_in_thread(standin, args.port)
+    try:
+        failures = asyncio.run(drive_roundtrip(args))
+    finally:
+        standin_server.shutdown()
+    print("=" * 60)
+    print("✅ Round trip passed" if not failures else f"❌ {failures} check(s) failed")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
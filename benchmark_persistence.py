@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for the persistence paths used during lead generation
+- pairs:   per-pair ORM loop vs bulk upsert for HashtagUsernamePair (uses DATABASE_URL, cleans up after itself)
+- backups: LeadBackup table size for full copies vs change-only LeadBackupDelta on a synthetic history
+"""
+
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from sqlalchemy import create_engine
+from models import LeadBackup, LeadBackupDelta
+
+BENCH_HASHTAG_PREFIX = '__bench__'
+
+
+def build_pairs(count, run_label, caption_suffix=''):
+    """Generate synthetic hashtag-username profiles spread over 10 hashtags"""
+    base_time = datetime(2025, 1, 1)
+    return [
+        {
+            'hashtag': f'{BENCH_HASHTAG_PREFIX}{run_label}_{i % 10}',
+            'username': f'bench_user_{i}',
+            'timestamp': base_time + timedelta(minutes=i),
+            'post_url': f'https://www.instagram.com/p/bench{i}/',
+            'caption': f'Benchmark caption {i} 🌿{caption_suffix}'
+        }
+        for i in range(count)
+    ]
+
+
+def benchmark_pairs(sizes):
+    """Time insert and update passes for both save paths at each size"""
+    from main import app, db, HashtagUsernamePair, save_hashtag_username_pairs, save_hashtag_username_pairs_orm
+
+    def cleanup():
+        with app.app_context():
+            HashtagUsernamePair.query.filter(
+                HashtagUsernamePair.hashtag.like(f'{BENCH_HASHTAG_PREFIX}%')
+            ).delete(synchronize_session=False)
+            db.session.commit()
+
+    def time_call(func, profiles):
+        start = time.perf_counter()
+        func(profiles, set())
+        return time.perf_counter() - start
+
+    with app.app_context():
+        print(f"Database: {db.engine.dialect.name}")
+    print(f"{'pairs':>8} | {'path':<10} | {'insert s':>9} | {'update s':>9} | {'pairs/s':>9}")
+    print("-" * 58)
+
+    for count in sizes:
+        for label, func in (('orm loop', save_hashtag_username_pairs_orm), ('bulk', save_hashtag_username_pairs)):
+            cleanup()
+            run_label = label.replace(' ', '_')
+            insert_seconds = time_call(func, build_pairs(count, run_label))
+            update_seconds = time_call(func, build_pairs(count, run_label, caption_suffix=' (updated)'))
+            throughput = (2 * count) / (insert_seconds + update_seconds)
+            print(f"{count:>8} | {label:<10} | {insert_seconds:>9.2f} | {update_seconds:>9.2f} | {throughput:>9.0f}")
+
+    cleanup()
+
+
+def synthetic_lead(i, rng):
+    """Create a lead-like object with realistic field sizes"""
+    return SimpleNamespace(
+        id=i + 1, username=f'synthetic_{i}', hashtag='biogarten',
+        full_name=f'Synthetic Creator {i}',
+        bio=('Naturliebhaberin 🌿 Garten, Kräuter und nachhaltiges Leben. ' * 3)[:rng.randint(60, 180)],
+        email='', phone='', website=f'https://linktr.ee/synthetic_{i}',
+        followers_count=rng.randint(500, 200000), following_count=rng.randint(100, 3000),
+        posts_count=rng.randint(10, 2000), is_verified=False, is_business=rng.random() < 0.4,
+        profile_pic_url=f'https://scontent.cdninstagram.com/v/t51.2885-19/{i}_{"x" * 120}.jpg',
+        is_duplicate=False, source_timestamp=datetime(2025, 7, 1) + timedelta(minutes=i),
+        source_post_url=f'https://www.instagram.com/p/synthetic{i}/',
+        beitragstext=('Heute im Garten: Ringelblumen, Salbei und Thymian geerntet. ' * 4)[:rng.randint(80, 240)],
+        address_street='', city_name='', zip='', latitude=None, longitude=None,
+        subject=None, email_body=None, sent=False, sent_at=None, selected_product_id=None,
+        created_at=datetime(2025, 7, 1), updated_at=datetime(2025, 7, 1)
+    )
+
+
+def mutate_lead(lead, save_number, rng):
+    """Apply the kind of changes a re-enrichment or drafting pass produces"""
+    if rng.random() < 0.7:
+        lead.followers_count += rng.randint(-50, 500)
+    if rng.random() < 0.5:
+        lead.posts_count += rng.randint(0, 5)
+    if not lead.email and rng.random() < 0.1:
+        lead.email = f'{lead.username}@example.de'
+    if rng.random() < 0.05:
+        lead.bio = lead.bio[::-1]
+    if save_number == 2 and rng.random() < 0.3:
+        lead.subject = 'Kooperationsanfrage: Natürlicher Zeckenschutz für deinen Garten'
+        lead.email_body = ('Hallo, wir sind Kasimir + Liselotte und lieben deine Beiträge rund um den Garten. ' * 8)[:700]
+    lead.updated_at += timedelta(days=7)
+
+
+def full_backup_row(lead):
+    """Column values for a LeadBackup copy of a synthetic lead"""
+    row = {column.name: getattr(lead, column.name, None) for column in LeadBackup.__table__.columns if column.name != 'id'}
+    row.update(original_lead_id=lead.id, original_created_at=lead.created_at,
+               original_updated_at=lead.updated_at, backup_created_at=datetime.utcnow())
+    return row
+
+
+def database_size(rows_by_table):
+    """Write rows into a fresh SQLite file and return its size in bytes after VACUUM"""
+    fd, path = tempfile.mkstemp(suffix='.sqlite')
+    os.close(fd)
+    engine = create_engine(f'sqlite:///{path}')
+    try:
+        with engine.begin() as conn:
+            for table, rows in rows_by_table:
+                table.create(conn)
+                for start in range(0, len(rows), 5000):
+                    conn.execute(table.insert(), rows[start:start + 5000])
+        with engine.connect() as conn:
+            conn.exec_driver_sql('VACUUM')
+        return os.path.getsize(path)
+    finally:
+        engine.dispose()
+        os.remove(path)
+
+
+def benchmark_backups(lead_count, saves, seed):
+    """Compare backup table sizes for the same synthetic history in each backup mode"""
+    rng = random.Random(seed)
+    legacy_rows, full_rows, delta_rows = [], [], []
+
+    for i in range(lead_count):
+        lead = synthetic_lead(i, rng)
+        state = {}
+        version = 0
+        for save_number in range(saves):
+            if save_number:
+                mutate_lead(lead, save_number, rng)
+            row = full_backup_row(lead)
+            full_rows.append(row)
+            # The old save path backed up updated leads twice per save
+            legacy_rows.extend([row, row] if save_number else [row])
+
+            changes = LeadBackupDelta.diff(state, LeadBackupDelta.snapshot(lead))
+            if changes:
+                version += 1
+                state.update(changes)
+                delta_rows.append({
+                    'original_lead_id': lead.id, 'username': lead.username, 'hashtag': lead.hashtag,
+                    'version': version, 'changes': json.dumps(changes, separators=(',', ':')), 'backup_created_at': datetime.utcnow()
+                })
+
+    results = [
+        ('full, 2 copies per update (previous)', len(legacy_rows), database_size([(LeadBackup.__table__, legacy_rows)])),
+        ('full, 1 copy per save', len(full_rows), database_size([(LeadBackup.__table__, full_rows)])),
+        ('delta', len(delta_rows), database_size([(LeadBackupDelta.__table__, delta_rows)]))
+    ]
+
+    baseline = results[0][2]
+    print(f"Synthetic history: {lead_count} leads x {saves} saves")
+    print(f"{'mode':<38} | {'rows':>9} | {'size MB':>9} | {'vs previous':>11}")
+    print("-" * 76)
+    for label, rows, size in results:
+        print(f"{label:<38} | {rows:>9} | {size / 1e6:>9.1f} | {size / baseline:>10.1%}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest='benchmark', required=True)
+
+    pairs_parser = subparsers.add_parser('pairs', help='HashtagUsernamePair save paths')
+    pairs_parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000],
+                              help='Number of pairs per run (default: 1000 10000 100000)')
+
+    backups_parser = subparsers.add_parser('backups', help='LeadBackup table size per backup mode')
+    backups_parser.add_argument('--leads', type=int, default=100000, help='Synthetic leads (default: 100000)')
+    backups_parser.add_argument('--saves', type=int, default=4, help='Saves per lead (default: 4)')
+    backups_parser.add_argument('--seed', type=int, default=42)
+
+    args = parser.parse_args()
+    if args.benchmark == 'pairs':
+        benchmark_pairs(args.sizes)
+    else:
+        benchmark_backups(args.leads, args.saves, args.seed)
@@ -1,121 +1,230 @@
 #!/usr/bin/env python3
 """
-Script to enrich existing leads with Perplexity API
-This will add missing contact information to existing database records
+Script to re-enrich existing leads through the contact resolver cascade
+Streams leads that are missing a wanted contact field, resolves them concurrently,
+commits in batches and records a cursor so an interrupted run resumes where it stopped.
+Leads that fail are recorded in the cursor and retried at the start of the next run.
+
+Shard large tables across processes by ID range, e.g.:
+    python enrich_existing_leads.py --min-id 1 --max-id 50000
+    python enrich_existing_leads.py --min-id 50001 --max-id 100000
 """
 
+import argparse
 import asyncio
+import json
 import os
-import sys
 from datetime import datetime
-from main import app, db, Lead, call_perplexity_api
+from sqlalchemy import or_, update
+from sqlalchemy.orm import Session
+from main import (app, db, Lead, contact_cascade, stored_contact_confidence, provider_clients,
+                  PERPLEXITY_CONCURRENCY)
+
+CONTACT_FIELDS = ('email', 'phone', 'website')
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Re-enrich existing leads with missing contact fields")
+    parser.add_argument('--min-id', type=int, default=None, help="First lead ID of this shard (inclusive)")
+    parser.add_argument('--max-id', type=int, default=None, help="Last lead ID of this shard (inclusive)")
+    parser.add_argument('--concurrency', type=int, default=PERPLEXITY_CONCURRENCY,
+                        help="Leads resolved at once")
+    parser.add_argument('--batch-size', type=int, default=100, help="Leads per commit")
+    parser.add_argument('--cursor-file', default=None,
+                        help="Where progress is recorded (default: one file per ID range)")
+    parser.add_argument('--restart', action='store_true', help="Ignore a recorded cursor and start over")
+    return parser.parse_args()
+
+
+def default_cursor_file(min_id, max_id):
+    """One cursor per shard so parallel processes never overwrite each other's progress"""
+    return f"enrich_existing_leads.{min_id or 'start'}-{max_id or 'end'}.cursor.json"
+
+
+def load_cursor(path, restart=False):
+    """Return the recorded cursor, or a fresh one"""
+    cursor = {'last_id': 0, 'processed': 0, 'paid_lookups': 0, 'updated': 0, 'failed_ids': []}
+    if os.path.exists(path) and not restart:
+        with open(path) as f:
+            cursor.update(json.load(f))
+    return cursor
+
+
+def save_cursor(path, cursor):
+    """Write the cursor atomically so a crash mid-write cannot corrupt it"""
+    cursor['updated_at'] = datetime.utcnow().isoformat()
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(cursor, f)
+    os.replace(tmp_path, path)
+
+
+def leads_missing_contacts(read_session, after_id, max_id, batch_size):
+    """Stream leads past the cursor that are missing a wanted contact field, in ID order"""
+    missing = [or_(getattr(Lead, field).is_(None), getattr(Lead, field) == '')
+               for field in contact_cascade.wanted_fields]
+    query = read_session.query(Lead).filter(Lead.id > after_id, or_(*missing))
+    if max_id is not None:
+        query = query.filter(Lead.id <= max_id)
+    return query.order_by(Lead.id).yield_per(batch_size)
+
+
+def failed_leads(read_session, lead_ids):
+    """Leads whose resolution failed in an earlier run, in ID order"""
+    return read_session.query(Lead).filter(Lead.id.in_(lead_ids)).order_by(Lead.id).all()
+
+
+async def resolve_lead(lead, api_key, semaphore):
+    """Run the cascade for a lead's weak fields.
+
+    Returns (update row or None, whether a paid tier ran, whether a tier failed); what the other tiers
+    found is kept even when one failed.
+    """
+    contacts = stored_contact_confidence(lead)
+    weak_fields = contact_cascade.weak_fields(contacts)
+    if not weak_fields:
+        return None, False, False
+
+    # Known contacts come from the stored entries, not the profile data
+    profile_data = {
+        'username': lead.username,
+        'full_name': lead.full_name or '',
+        'biography': lead.bio or '',
+        'follower_count': lead.followers_count or 0,
+        'following_count': lead.following_count or 0,
+        'media_count': lead.posts_count or 0,
+        'is_verified': lead.is_verified or False
+    }
+    contacts, resolvers_run = await contact_cascade.resolve(
+        profile_data, contacts, fields=weak_fields, api_key=api_key, paid_semaphore=semaphore)
+    paid = any(run_paid for _, run_paid, _ in resolvers_run)
+    failed = any(run_failed for _, _, run_failed in resolvers_run)
+
+    row = {'id': lead.id, 'contact_confidence': json.dumps(contacts)}
+    changes = []
+    for field in CONTACT_FIELDS:
+        value = (contacts.get(field) or {}).get('value')
+        if value and value != (getattr(lead, field) or ''):
+            row[field] = value
+            changes.append(f"{field}={value}")
+    if changes:
+        row['updated_at'] = datetime.utcnow()
+        print(f"  ✅ {lead.username}: {', '.join(changes)}")
+    return row, paid, failed
+
+
+async def process_batch(batch, api_key, semaphore, cursor, retry=False):
+    """Resolve a batch concurrently, write its changes in one transaction and advance the cursor.
+
+    Leads that raised or had a resolver tier fail are added to the cursor's failed_ids and removed again
+    once a retry succeeds; retry batches leave last_id and the processed count alone.
+    """
+    results = await asyncio.gather(*(resolve_lead(lead, api_key, semaphore) for lead in batch),
+                                   return_exceptions=True)
+    rows = []
+    failed_ids = set(cursor['failed_ids'])
+    for lead, result in zip(batch, results):
+        if isinstance(result, Exception):
+            print(f"  ❌ Error processing {lead.username}: {result}")
+            failed_ids.add(lead.id)
+            continue
+        row, paid, failed = result
+        if failed:
+            print(f"  ⚠️ Lookup failed for {lead.username}, retried next run")
+            failed_ids.add(lead.id)
+        else:
+            failed_ids.discard(lead.id)
+        cursor['paid_lookups'] += int(paid)
+        if row:
+            rows.append(row)
+            cursor['updated'] += int('updated_at' in row)
+
+    # Rows have different column sets, so each set goes out as one executemany
+    rows_by_columns = {}
+    for row in rows:
+        rows_by_columns.setdefault(tuple(sorted(row)), []).append(row)
+    for grouped_rows in rows_by_columns.values():
+        db.session.execute(update(Lead), grouped_rows)
+    db.session.commit()
+
+    cursor['failed_ids'] = sorted(failed_ids)
+    if not retry:
+        cursor['last_id'] = batch[-1].id
+        cursor['processed'] += len(batch)
+
+
+async def retry_failed_leads(read_session, api_key, semaphore, cursor, cursor_file, batch_size):
+    """Re-run the leads recorded as failed by earlier runs; IDs of deleted leads are dropped"""
+    retry_ids = list(cursor['failed_ids'])
+    if not retry_ids:
+        return
+    print(f"🔁 Retrying {len(retry_ids)} leads that failed in an earlier run")
+    for start in range(0, len(retry_ids), batch_size):
+        chunk = retry_ids[start:start + batch_size]
+        batch = failed_leads(read_session, chunk)
+        missing = set(chunk) - {lead.id for lead in batch}
+        cursor['failed_ids'] = [lead_id for lead_id in cursor['failed_ids'] if lead_id not in missing]
+        if batch:
+            await process_batch(batch, api_key, semaphore, cursor, retry=True)
+        save_cursor(cursor_file, cursor)
+    print(f"🔁 {len(cursor['failed_ids'])} leads still failing")
+
+
+async def enrich_existing_leads(args):
+    """Re-resolve low-confidence contact fields of existing leads"""
 
-async def enrich_existing_leads():
-    """Enrich all existing leads with Perplexity API"""
-    
     # Check for API key
     api_key = os.environ.get('PERPLEXITY_API_KEY')
     if not api_key:
         print("❌ PERPLEXITY_API_KEY not found in environment variables")
         return
-    
+
+    cursor_file = args.cursor_file or default_cursor_file(args.min_id, args.max_id)
+    cursor = load_cursor(cursor_file, args.restart)
+    after_id = max(cursor['last_id'], (args.min_id or 1) - 1)
+
     print("🔍 Starting enrichment of existing leads...")
+    print(f"   ID range: {args.min_id or 'start'} - {args.max_id or 'end'}, resuming after ID {after_id}")
+    print(f"   Cursor: {cursor_file}")
     print("=" * 60)
-    
+
+    semaphore = asyncio.Semaphore(args.concurrency)
+    started = datetime.utcnow()
+
     with app.app_context():
-        # Get all leads from database
-        leads = Lead.query.all()
-        
-        if not leads:
-            print("No leads found in database")
-            return
-        
-        print(f"Found {len(leads)} leads to process")
-        print()
-        
-        enriched_count = 0
-        updated_count = 0
-        
-        for i, lead in enumerate(leads, 1):
-            print(f"[{i}/{len(leads)}] Processing: {lead.username}")
-            
-            # Show current contact data
-            current_data = {
-                'email': lead.email or '',
-                'phone': lead.phone or '',
-                'website': lead.website or ''
-            }
-            
-            print(f"  Current: Email={current_data['email'] or 'None'}, "
-                  f"Phone={current_data['phone'] or 'None'}, "
-                  f"Website={current_data['website'] or 'None'}")
-            
-            # Prepare profile data for API
-            profile_data = {
-                'username': lead.username,
-                'full_name': lead.full_name or '',
-                'biography': lead.bio or '',
-                'email': lead.email or '',
-                'phone': lead.phone or '',
-                'website': lead.website or '',
-                'follower_count': lead.followers_count or 0,
-                'following_count': lead.following_count or 0,
-                'media_count': lead.posts_count or 0,
-                'is_verified': lead.is_verified or False
-            }
-            
-            try:
-                # Call Perplexity API
-                enriched_data = await call_perplexity_api(profile_data, api_key)
-                enriched_count += 1
-                
-                # Check what's new
-                changes_made = False
-                changes = []
-                
-                # Check email
-                if enriched_data.get('email') and enriched_data['email'] != current_data['email']:
-                    if not current_data['email']:  # Only update if empty
-                        lead.email = enriched_data['email']
-                        changes.append(f"Email: {enriched_data['email']}")
-                        changes_made = True
-                
-                # Check phone
-                if enriched_data.get('phone') and enriched_data['phone'] != current_data['phone']:
-                    if not current_data['phone']:  # Only update if empty
-                        lead.phone = enriched_data['phone']
-                        changes.append(f"Phone: {enriched_data['phone']}")
-                        changes_made = True
-                
-                # Check website
-                if enriched_data.get('website') and enriched_data['website'] != current_data['website']:
-                    if not current_data['website']:  # Only update if empty
-                        lead.website = enriched_data['website']
-                        changes.append(f"Website: {enriched_data['website']}")
-                        changes_made = True
-                
-                if changes_made:
-                    lead.updated_at = datetime.utcnow()
-                    db.session.commit()
-                    updated_count += 1
-                    print(f"  ✅ Updated: {', '.join(changes)}")
-                else:
-                    print(f"  ℹ️  No new data found or all fields already populated")
-                
-                # Add delay to avoid rate limiting
-                await asyncio.sleep(1)
-                
-            except Exception as e:
-                print(f"  ❌ Error processing {lead.username}: {str(e)}")
-            
-            print()
-        
+        # A separate read session keeps the streamed result open while batches are committed
+        with Session(db.engine) as read_session:
+            await retry_failed_leads(read_session, api_key, semaphore, cursor, cursor_file, args.batch_size)
+
+            batch = []
+            for lead in leads_missing_contacts(read_session, after_id, args.max_id, args.batch_size):
+                batch.append(lead)
+                if len(batch) >= args.batch_size:
+                    await process_batch(batch, api_key, semaphore, cursor)
+                    save_cursor(cursor_file, cursor)
+                    print(f"💾 Committed up to ID {cursor['last_id']} ({cursor['processed']} processed, "
+                          f"{cursor['updated']} updated)")
+                    batch = []
+            if batch:
+                await process_batch(batch, api_key, semaphore, cursor)
+                save_cursor(cursor_file, cursor)
+
+        elapsed = (datetime.utcnow() - started).total_seconds()
         print("=" * 60)
         print(f"📊 ENRICHMENT SUMMARY:")
-        print(f"   Total leads processed: {len(leads)}")
-        print(f"   API calls made: {enriched_count}")
-        print(f"   Leads updated: {updated_count}")
-        print(f"   Leads unchanged: {len(leads) - updated_count}")
+        print(f"   Leads processed: {cursor['processed']}")
+        print(f"   Leads with a paid lookup: {cursor['paid_lookups']}")
+        print(f"   Leads updated: {cursor['updated']}")
+        print(f"   Last ID: {cursor['last_id']}")
+        print(f"   Failed, retried next run: {len(cursor['failed_ids'])}")
+        print(f"   Time this run: {elapsed:.0f}s")
+
+async def main():
+    """Run the enrichment and close the pooled HTTP clients before the event loop shuts down"""
+    try:
+        await enrich_existing_leads(parse_args())
+    finally:
+        await provider_clients.aclose_loop()
 
 if __name__ == "__main__":
-    asyncio.run(enrich_existing_leads())
\ No newline at end of file
+    asyncio.run(main())
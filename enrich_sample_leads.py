@@ -5,7 +5,7 @@ Sample enrichment script to demonstrate the process on a few leads
 
 import asyncio
 import os
-from main import app, db, Lead, call_perplexity_api
+from main import app, db, Lead, call_perplexity_api, provider_clients
 
 async def enrich_sample_leads():
     """Enrich a few sample leads to show the process"""
@@ -100,5 +100,12 @@ async def enrich_sample_leads():
         print("\n" + "=" * 60)
         print("ENRICHMENT DEMONSTRATION COMPLETE")
 
+async def main():
+    """Run the enrichment and close the pooled HTTP clients before the event loop shuts down"""
+    try:
+        await enrich_sample_leads()
+    finally:
+        await provider_clients.aclose_loop()
+
 if __name__ == "__main__":
-    asyncio.run(enrich_sample_leads())
\ No newline at end of file
+    asyncio.run(main())
\ No newline at end of file
@@ -1,10 +1,26 @@
+import os
+
 bind = "0.0.0.0:5000"
-workers = 1
-worker_class = "sync"
+# Long runs execute on job workers, so web requests stay short and several workers can serve them
+workers = int(os.environ.get("WEB_CONCURRENCY", 2))  # Job progress is shared through the Job table
+worker_class = "gthread"
+# Sizing: each open event stream (job progress or draft tokens) holds one thread for its lifetime, and
+# main.py refuses streams beyond SSE_MAX_STREAMS per worker with a 503 so clients fall back to polling.
+# Keep threads above SSE_MAX_STREAMS (default 12) to leave threads for normal requests; the cluster serves
+# up to workers * SSE_MAX_STREAMS concurrent streams. A draft stream also runs two short-lived OpenAI threads.
+threads = int(os.environ.get("GUNICORN_THREADS", 16))
 worker_connections = 1000
-timeout = 7200  # 2 hours to accommodate long processing runs with multiple anti-spam pauses
+timeout = 120
 keepalive = 2
 max_requests = 1000
 max_requests_jitter = 50
 preload_app = True
-reload = True
\ No newline at end of file
+reload = True
+
+
+def post_fork(server, worker):
+    # preload_app created the DB pool and HTTP clients in the master; each worker needs its own connections
+    from main import job_queue, reset_after_fork
+    reset_after_fork()
+    # Each web worker also runs JOB_WORKER_THREADS job workers; set it to 0 when dedicated job_worker.py processes run
+    job_queue.start_workers()
@@ -0,0 +1,25 @@
+#!/usr/bin/env python3
+"""
+Standalone job worker
+Claims discovery and enrichment jobs from the database queue; run as many processes or hosts as needed
+"""
+
+import os
+import sys
+import time
+from main import job_queue
+
+
+def main():
+    threads = int(sys.argv[1]) if len(sys.argv) > 1 else int(os.environ.get('JOB_WORKER_THREADS', 1))
+    print(f"🚀 Starting {threads} job worker thread(s) in process {os.getpid()}")
+    job_queue.start_workers(threads)
+    try:
+        while True:
+            time.sleep(60)
+    except KeyboardInterrupt:
+        print("Job worker stopped")
+
+
+if __name__ == "__main__":
+    main()
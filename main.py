@@ -1,17 +1,22 @@
 import os
+import atexit
 import asyncio
+import contextvars
+import threading
 import logging
 import json
 import hashlib
-import random
+import hmac
+import queue
+import re
 import time
+from collections import deque
 from datetime import datetime
-from concurrent.futures import ThreadPoolExecutor
 import httpx
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for, make_response, flash
+from flask import Flask, render_template, request, jsonify, session, redirect, url_for, make_response, flash, stream_with_context
 from functools import wraps
-from openai import OpenAI
-from apify_client import ApifyClient
+from openai import OpenAI, AsyncOpenAI, APIConnectionError, APITimeoutError, InternalServerError, RateLimitError
+from apify_client import ApifyClientAsync
 import csv
 import io
 
@@ -38,18 +43,374 @@ app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
 }
 
 # Initialize database
-from models import db, User, Lead, ProcessingSession, HashtagUsernamePair, LeadBackup, Product, SystemPrompt, UserPrompt, VariableSettings
+from models import db, User, Lead, ProcessingSession, HashtagUsernamePair, LeadBackup, LeadBackupDelta, ProfileSnapshot, ContactLookupCache, ApifyRun, Job, Product, SystemPrompt, UserPrompt, VariableSettings
 db.init_app(app)
 
+# Pooled HTTP clients shared by all provider calls
+PROVIDER_HTTP_SETTINGS = {
+    'perplexity': {'timeout': 60.0, 'max_connections': int(os.environ.get("PERPLEXITY_MAX_CONNECTIONS", 10))},
+    'openai': {'timeout': 60.0, 'max_connections': int(os.environ.get("OPENAI_MAX_CONNECTIONS", 10))},
+}
+PROVIDER_KEEPALIVE_EXPIRY = float(os.environ.get("PROVIDER_KEEPALIVE_EXPIRY", 60))
+# Base URL of the Apify API; point at a local stand-in server for testing
+APIFY_API_URL = os.environ.get("APIFY_API_URL") or None
+try:
+    import h2  # noqa: F401 - HTTP/2 is used when the optional h2 package is installed
+    PROVIDER_HTTP2 = True
+except ImportError:
+    PROVIDER_HTTP2 = False
+
+
+class ProviderClientRegistry:
+    """Owns long-lived, pooled HTTP clients per provider and tracks connection reuse"""
+
+    def __init__(self, settings):
+        self.settings = settings
+        self._lock = threading.Lock()
+        self._async_clients = {}  # (provider, event loop) -> httpx.AsyncClient
+        self._sync_clients = {}  # provider -> httpx.Client
+        self._apify_async_clients = {}  # (token, event loop) -> ApifyClientAsync
+        self._stats = {}
+
+    def _record(self, provider, key):
+        with self._lock:
+            stats = self._stats.setdefault(provider, {'requests': 0, 'new_connections': 0})
+            stats[key] += 1
+
+    def _sync_trace(self, provider):
+        def trace(event_name, info):
+            if event_name == 'connection.connect_tcp.complete':
+                self._record(provider, 'new_connections')
+        return trace
+
+    def _async_trace(self, provider):
+        async def trace(event_name, info):
+            if event_name == 'connection.connect_tcp.complete':
+                self._record(provider, 'new_connections')
+        return trace
+
+    def _client_options(self, provider):
+        settings = self.settings[provider]
+        limits = httpx.Limits(max_connections=settings['max_connections'],
+                              max_keepalive_connections=settings['max_connections'],
+                              keepalive_expiry=PROVIDER_KEEPALIVE_EXPIRY)
+        return {'timeout': settings['timeout'], 'limits': limits, 'http2': PROVIDER_HTTP2}
+
+    def sync_client(self, provider):
+        """Return the shared blocking client for a provider"""
+        with self._lock:
+            client = self._sync_clients.get(provider)
+            if client is None or client.is_closed:
+                trace = self._sync_trace(provider)
+
+                def on_request(request):
+                    request.extensions['trace'] = trace
+                    self._record(provider, 'requests')
+
+                client = httpx.Client(event_hooks={'request': [on_request]}, **self._client_options(provider))
+                self._sync_clients[provider] = client
+            return client
+
+    def async_client(self, provider):
+        """Return the pooled async client for a provider, bound to the running event loop"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            client = self._async_clients.get((provider, loop))
+            if client is None or client.is_closed:
+                trace = self._async_trace(provider)
+
+                async def on_request(request):
+                    request.extensions['trace'] = trace
+                    self._record(provider, 'requests')
+
+                client = httpx.AsyncClient(event_hooks={'request': [on_request]}, **self._client_options(provider))
+                self._async_clients[(provider, loop)] = client
+            return client
+
+    def apify_async_client(self, token):
+        """Return a cached ApifyClientAsync per token, bound to the running event loop"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            client = self._apify_async_clients.get((token, loop))
+            if client is None:
+                client = ApifyClientAsync(token, api_url=APIFY_API_URL)
+                trace = self._async_trace('apify')
+
+                async def on_request(request):
+                    request.extensions['trace'] = trace
+                    self._record('apify', 'requests')
+
+                client.http_client.httpx_async_client.event_hooks['request'].append(on_request)
+                self._apify_async_clients[(token, loop)] = client
+            return client
+
+    async def aclose_loop(self):
+        """Close the async clients bound to the running event loop (call before the loop is closed)"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            keys = [key for key in self._async_clients if key[1] is loop]
+            clients = [self._async_clients.pop(key) for key in keys]
+            apify_keys = [key for key in self._apify_async_clients if key[1] is loop]
+            for key in apify_keys:
+                apify_client = self._apify_async_clients.pop(key)
+                apify_client.http_client.httpx_client.close()
+                clients.append(apify_client.http_client.httpx_async_client)
+        for client in clients:
+            try:
+                await client.aclose()
+            except Exception as e:
+                logger.error(f"Failed to close pooled HTTP client: {e}")
+
+    def reset_after_fork(self):
+        """Forget clients inherited from a forking parent without closing them, their sockets belong to the parent"""
+        self._lock = threading.Lock()
+        self._async_clients = {}
+        self._sync_clients = {}
+        self._apify_async_clients = {}
+        self._stats = {}
+
+    def close(self):
+        """Close all blocking clients, used at interpreter shutdown"""
+        with self._lock:
+            clients = list(self._sync_clients.values())
+            self._sync_clients.clear()
+        for client in clients:
+            try:
+                client.close()
+            except Exception as e:
+                logger.error(f"Failed to close pooled HTTP client: {e}")
+
+    @staticmethod
+    def _open_connections(client):
+        pool = getattr(getattr(client, '_transport', None), '_pool', None)
+        connections = getattr(pool, 'connections', [])
+        return sum(1 for connection in connections if not connection.is_closed())
+
+    def stats(self):
+        """Pool statistics per provider: requests, new connections, reuse ratio and open connections"""
+        with self._lock:
+            stats = {provider: dict(values) for provider, values in self._stats.items()}
+            open_counts = {}
+            for (provider, _), client in self._async_clients.items():
+                open_counts[provider] = open_counts.get(provider, 0) + self._open_connections(client)
+            for provider, client in self._sync_clients.items():
+                open_counts[provider] = open_counts.get(provider, 0) + self._open_connections(client)
+            for client in self._apify_async_clients.values():
+                open_counts['apify'] = open_counts.get('apify', 0) + self._open_connections(client.http_client.httpx_async_client)
+
+        for provider in set(stats) | set(open_counts):
+            entry = stats.setdefault(provider, {'requests': 0, 'new_connections': 0})
+            requests_made = entry['requests']
+            entry['reuse_ratio'] = round(1 - entry['new_connections'] / requests_made, 3) if requests_made else 0.0
+            entry['open_connections'] = open_counts.get(provider, 0)
+        return {'http2': PROVIDER_HTTP2, 'providers': stats}
+
+
+provider_clients = ProviderClientRegistry(PROVIDER_HTTP_SETTINGS)
+atexit.register(provider_clients.close)
+
+# Pacing for upstream calls: sustained rate per minute and burst size per bucket
+PACING_LIMITS = {
+    'apify': (float(os.environ.get("APIFY_RATE_PER_MINUTE", 20)), int(os.environ.get("APIFY_BURST", 5))),
+    'perplexity': (float(os.environ.get("PERPLEXITY_RATE_PER_MINUTE", 40)), int(os.environ.get("PERPLEXITY_BURST", 8))),
+    'openai': (float(os.environ.get("OPENAI_RATE_PER_MINUTE", 300)), int(os.environ.get("OPENAI_BURST", 20))),
+    'instagram_session': (float(os.environ.get("INSTAGRAM_PROFILES_PER_MINUTE", 6)), int(os.environ.get("INSTAGRAM_PROFILE_BURST", 9))),
+}
+PACING_ERROR_WINDOW = 20  # Recent outcomes considered for the error rate
+PACING_ERROR_RATE_THRESHOLD = float(os.environ.get("PACING_ERROR_RATE_THRESHOLD", 0.3))
+PACING_MIN_RATE_FACTOR = 0.1  # Backoff never slows a bucket below 10% of its configured rate
+PACING_RECOVERY_STEP = 0.05  # Rate factor regained per successful call
+PACING_COUNTDOWN_INTERVAL = 5  # Seconds between countdown progress updates
+
+
+class TokenBucket:
+    """Thread-safe token bucket whose rate backs off when upstream errors or blocks rise"""
+
+    def __init__(self, name, rate_per_minute, burst):
+        self.name = name
+        self.base_rate = rate_per_minute / 60.0
+        self.burst = burst
+        self.rate_factor = 1.0
+        self.tokens = float(burst)
+        self.updated_at = time.monotonic()
+        self.outcomes = deque(maxlen=PACING_ERROR_WINDOW)
+        self.waited_seconds = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def rate(self):
+        return self.base_rate * self.rate_factor
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def reserve(self, cost=1):
+        """Take tokens now and return how many seconds the caller must wait before using them"""
+        with self._lock:
+            self._refill(time.monotonic())
+            self.tokens -= cost
+            wait = max(0.0, -self.tokens / self.rate)
+            self.waited_seconds += wait
+            return wait
+
+    def estimate_wait(self, cost):
+        """Seconds until `cost` more tokens would be available, without reserving them"""
+        with self._lock:
+            self._refill(time.monotonic())
+            return max(0.0, (cost - self.tokens) / self.rate)
+
+    async def acquire(self, cost=1, on_wait=None):
+        """Wait asynchronously for tokens, reporting the remaining wait through on_wait(bucket, seconds)"""
+        wait = self.reserve(cost)
+        if wait > 0:
+            logger.info(f"Pacing {self.name}: waiting {wait:.1f}s for {cost} token(s)")
+        deadline = time.monotonic() + wait
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            if on_wait:
+                on_wait(self, remaining)
+            await asyncio.sleep(min(PACING_COUNTDOWN_INTERVAL, remaining))
+
+    def acquire_blocking(self, cost=1):
+        """Blocking variant of acquire for synchronous provider calls"""
+        wait = self.reserve(cost)
+        if wait > 0:
+            logger.info(f"Pacing {self.name}: waiting {wait:.1f}s for {cost} token(s)")
+            time.sleep(wait)
+
+    def record_outcome(self, success, blocked=False):
+        """Adjust the rate from a call outcome: halve on blocks, slow on high error rates, recover on success"""
+        with self._lock:
+            self._refill(time.monotonic())
+            self.outcomes.append(success)
+            error_rate = self.outcomes.count(False) / len(self.outcomes)
+            if blocked:
+                self.rate_factor = max(PACING_MIN_RATE_FACTOR, self.rate_factor * 0.5)
+                self.tokens = min(self.tokens, 0.0)  # Cool down before the next call
+                logger.warning(f"Pacing {self.name}: upstream block detected, rate reduced to {self.rate * 60:.1f}/min")
+            elif len(self.outcomes) >= 5 and error_rate > PACING_ERROR_RATE_THRESHOLD:
+                self.rate_factor = max(PACING_MIN_RATE_FACTOR, self.rate_factor * 0.75)
+                logger.warning(f"Pacing {self.name}: error rate {error_rate:.0%}, rate reduced to {self.rate * 60:.1f}/min")
+            elif success:
+                self.rate_factor = min(1.0, self.rate_factor + PACING_RECOVERY_STEP)
+
+    def stats(self):
+        with self._lock:
+            self._refill(time.monotonic())
+            return {
+                'rate_per_minute': round(self.rate * 60, 2),
+                'configured_rate_per_minute': round(self.base_rate * 60, 2),
+                'burst': self.burst,
+                'available_tokens': round(self.tokens, 2),
+                'error_rate': round(self.outcomes.count(False) / len(self.outcomes), 3) if self.outcomes else 0.0,
+                'waited_seconds': round(self.waited_seconds, 1)
+            }
+
+
+class Pacer:
+    """Hands out shared token buckets per provider and per Instagram session"""
+
+    def __init__(self, limits):
+        self.limits = limits
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def _bucket(self, key, limit_name):
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                rate_per_minute, burst = self.limits[limit_name]
+                bucket = TokenBucket(key, rate_per_minute, burst)
+                self._buckets[key] = bucket
+            return bucket
+
+    def provider(self, name):
+        return self._bucket(name, name)
+
+    def instagram_session(self, ig_sessionid):
+        # Key by a digest so session cookies never show up in logs or metrics
+        digest = hashlib.sha256((ig_sessionid or '').encode('utf-8')).hexdigest()[:12]
+        return self._bucket(f'instagram_session:{digest}', 'instagram_session')
+
+    def stats(self):
+        with self._lock:
+            buckets = dict(self._buckets)
+        return {key: bucket.stats() for key, bucket in buckets.items()}
+
+
+pacer = Pacer(PACING_LIMITS)
+
 # Initialize OpenAI client
 # the newest OpenAI model is "gpt-4o" which was released May 13, 2024.
 # do not change this unless explicitly requested by the user
-openai_client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
+openai_client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"), http_client=provider_clients.sync_client('openai'))
+
+
+def reset_after_fork():
+    """Give a forked worker its own DB and HTTP connections instead of the sockets inherited from the parent"""
+    global openai_client
+    with app.app_context():
+        db.engine.dispose(close=False)
+    provider_clients.reset_after_fork()
+    openai_client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"), http_client=provider_clients.sync_client('openai'))
 
 # Create database tables
 with app.app_context():
     db.create_all()
 
+    # create_all() does not alter existing tables, so add columns introduced after a table was first created
+    def add_missing_columns():
+        """Add newer columns to existing tables if they are missing"""
+        added_columns = {
+            'processing_session': {
+                'job_id': 'INTEGER REFERENCES job (id)',
+                'batch_plan': 'TEXT',
+                'completed_batches': 'TEXT',
+                'updated_at': 'TIMESTAMP'
+            },
+            'job': {
+                'progress': 'TEXT',
+                'priority': 'INTEGER NOT NULL DEFAULT 0'
+            },
+            'lead': {
+                'contact_confidence': 'TEXT'
+            }
+        }
+        try:
+            inspector = db.inspect(db.engine)
+            for table, columns in added_columns.items():
+                existing_columns = {column['name'] for column in inspector.get_columns(table)}
+                for name, column_type in columns.items():
+                    if name not in existing_columns:
+                        db.session.execute(db.text(f'ALTER TABLE {table} ADD COLUMN {name} {column_type}'))
+            db.session.commit()
+        except Exception as e:
+            logger.error(f"Failed to add missing columns: {e}")
+            db.session.rollback()
+
+    add_missing_columns()
+
+    def scrub_finished_job_payloads():
+        """Remove Instagram session cookies left in the payloads of jobs that finished before they were stripped"""
+        try:
+            finished_jobs = Job.query.filter(Job.status.in_(('completed', 'failed')),
+                                             Job.payload.like('%"ig_sessionid"%')).all()
+            for job in finished_jobs:
+                payload = job.get_payload()
+                payload.pop('ig_sessionid', None)
+                job.payload = json.dumps(payload, default=str)
+            db.session.commit()
+            if finished_jobs:
+                logger.info(f"Removed session cookies from {len(finished_jobs)} finished job payloads")
+        except Exception as e:
+            logger.error(f"Failed to scrub finished job payloads: {e}")
+            db.session.rollback()
+
+    scrub_finished_job_payloads()
+
     # Initialize default variable settings (all enabled by default)
     def initialize_variable_settings():
         """Initialize variable settings if they don't exist"""
@@ -143,19 +504,440 @@ with app.app_context():
     
     initialize_admin_user()
 
-# Global storage for processing status (only for status, data is in DB)
-app_data = {
-    'processing_status': None,
-    'processing_progress': {
-        'current_step': '',
-        'total_steps': 0,
-        'completed_steps': 0,
-        'estimated_time_remaining': 0
-    },
-    'start_time': time.time(),  # Track application startup time
-    'stop_requested': False  # Flag to request processing stop
+# Application start time, used for uptime reporting
+APP_START_TIME = time.time()
+
+# Job whose progress the running code reports to; set by the job worker and inherited by tasks and threads
+current_job_id = contextvars.ContextVar('current_job_id', default=None)
+
+JOB_PROGRESS_PERSIST_SECONDS = float(os.environ.get('JOB_PROGRESS_PERSIST_SECONDS', 2))
+JOB_STATE_MAX_ENTRIES = 200  # Finished jobs kept in memory before the oldest are dropped
+JOB_EVENT_BUFFER_SIZE = 500  # Recent events kept per job for event stream subscribers to catch up on
+
+EMPTY_PROGRESS = {
+    'current_step': '',
+    'total_steps': 0,
+    'completed_steps': 0,
+    'estimated_time_remaining': 0
 }
 
+
+class JobStateStore:
+    """Job-scoped progress and state, kept in process and written through to Job.progress.
+
+    Methods take a job_id and fall back to current_job_id, so code running inside a job reports
+    to it without passing the ID around. Readers in other processes see the persisted progress.
+    Progress changes and saved leads are also appended to a per-job event log for event streams.
+    """
+
+    def __init__(self, persist_interval=JOB_PROGRESS_PERSIST_SECONDS):
+        self.persist_interval = persist_interval
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._entries = {}  # job_id -> {'user_id', 'progress', 'state', 'stop_requested', 'finished', 'persisted_at', 'events', 'seq'}
+
+    def _entry(self, job_id):
+        job_id = job_id if job_id is not None else current_job_id.get()
+        entry = self._entries.get(job_id)
+        if entry is None:
+            entry = {'user_id': None, 'progress': dict(EMPTY_PROGRESS), 'state': {},
+                     'stop_requested': False, 'finished': False, 'persisted_at': 0.0,
+                     'events': deque(maxlen=JOB_EVENT_BUFFER_SIZE), 'seq': 0}
+            self._entries[job_id] = entry
+            self._evict()
+        return job_id, entry
+
+    def _emit(self, entry, name, data):
+        """Append an event to the job's log and wake stream subscribers (call under the lock)"""
+        entry['seq'] += 1
+        entry['events'].append((entry['seq'], name, data))
+        self._changed.notify_all()
+
+    def _evict(self):
+        finished = [job_id for job_id, entry in self._entries.items() if entry['finished']]
+        for job_id in finished[:max(0, len(self._entries) - JOB_STATE_MAX_ENTRIES)]:
+            del self._entries[job_id]
+
+    def _due_progress(self, entry, force=False):
+        """Copy of the progress if it is due to be persisted (call under the lock), else None"""
+        now = time.monotonic()
+        if not force and now - entry['persisted_at'] < self.persist_interval:
+            return None
+        entry['persisted_at'] = now
+        return dict(entry['progress'])
+
+    def _persist(self, job_id, progress):
+        """Write progress to the Job row so other processes can read it"""
+        if progress is None or not isinstance(job_id, int):
+            return
+        try:
+            with app.app_context():
+                Job.query.filter_by(id=job_id).update({'progress': json.dumps(progress, default=str)},
+                                                      synchronize_session=False)
+                db.session.commit()
+        except Exception as e:
+            logger.error(f"Failed to persist progress of job {job_id}: {e}")
+            db.session.rollback()
+
+    def start(self, job_id, user_id=None):
+        """Register a job that is about to run in this process"""
+        with self._lock:
+            job_id, entry = self._entry(job_id)
+            entry.update(user_id=user_id, finished=False, stop_requested=False)
+
+    def finish(self, job_id=None):
+        """Mark the job finished and persist its final progress"""
+        with self._lock:
+            job_id, entry = self._entry(job_id)
+            entry['finished'] = True
+            self._emit(entry, 'done', {})
+            progress = self._due_progress(entry, force=True)
+        self._persist(job_id, progress)
+
+    def set_progress(self, progress, job_id=None):
+        """Replace the job's progress"""
+        with self._lock:
+            job_id, entry = self._entry(job_id)
+            entry['progress'] = dict(progress)
+            self._emit(entry, 'snapshot', dict(progress))
+            due = self._due_progress(entry, force=True)
+        self._persist(job_id, due)
+
+    def update_progress(self, job_id=None, **fields):
+        """Set individual progress fields"""
+        with self._lock:
+            job_id, entry = self._entry(job_id)
+            changed = {key: value for key, value in fields.items() if entry['progress'].get(key) != value}
+            entry['progress'].update(changed)
+            if changed:
+                self._emit(entry, 'progress', changed)
+            due = self._due_progress(entry)
+        self._persist(job_id, due)
+
+    def increment_progress(self, key, amount=1, job_id=None):
+        """Add to a numeric progress field and return the new value"""
+        with self._lock:
+            job_id, entry = self._entry(job_id)
+            value = entry['progress'].get(key, 0) + amount
+            entry['progress'][key] = value
+            self._emit(entry, 'progress', {key: value})
+            due = self._due_progress(entry)
+        self._persist(job_id, due)
+        return value
+
+    def progress(self, job_id=None):
+        """Thread-safe copy of a job's progress; jobs running in other processes are read from the DB"""
+        with self._lock:
+            job_id = job_id if job_id is not None else current_job_id.get()
+            entry = self._entries.get(job_id)
+            if entry is not None:
+                return dict(entry['progress'])
+        if isinstance(job_id, int):
+            try:
+                job = Job.query.get(job_id)
+                if job and job.progress:
+                    return job.get_progress()
+            except Exception as e:
+                logger.error(f"Failed to load progress of job {job_id}: {e}")
+        return dict(EMPTY_PROGRESS)
+
+    def publish_leads(self, leads, job_id=None):
+        """Send freshly saved lead rows to the job's event stream subscribers"""
+        with self._lock:
+            job_id = job_id if job_id is not None else current_job_id.get()
+            if job_id is None or not leads:
+                return
+            self._emit(self._entry(job_id)[1], 'leads', leads)
+
+    def snapshot(self, job_id):
+        """(event sequence number, progress copy) for an unfinished job running in this process, or None"""
+        with self._lock:
+            entry = self._entries.get(job_id)
+            if entry is None or entry['finished']:
+                return None
+            return entry['seq'], dict(entry['progress'])
+
+    def wait_events(self, job_id, after_seq, timeout):
+        """Block until the job has events newer than after_seq or the timeout passes.
+
+        Returns (events, gap) where gap is True if older events were already dropped from the
+        buffer, or None if the job is not tracked in this process.
+        """
+        with self._changed:
+            entry = self._entries.get(job_id)
+            if entry is None:
+                return None
+            if entry['seq'] <= after_seq:
+                self._changed.wait_for(lambda: entry['seq'] > after_seq, timeout=timeout)
+            events = [event for event in entry['events'] if event[0] > after_seq]
+            gap = bool(events) and events[0][0] > after_seq + 1
+            return events, gap
+
+    def set_state(self, key, value, job_id=None):
+        with self._lock:
+            self._entry(job_id)[1]['state'][key] = value
+
+    def get_state(self, key, default=None, job_id=None):
+        with self._lock:
+            job_id = job_id if job_id is not None else current_job_id.get()
+            entry = self._entries.get(job_id)
+            return entry['state'].get(key, default) if entry else default
+
+    def request_stop(self, job_id):
+        with self._lock:
+            self._entry(job_id)[1]['stop_requested'] = True
+
+    def stop_requested(self, job_id=None):
+        with self._lock:
+            job_id = job_id if job_id is not None else current_job_id.get()
+            entry = self._entries.get(job_id)
+            return bool(entry and entry['stop_requested'])
+
+    def user_id(self, job_id=None):
+        """User who enqueued a job running in this process"""
+        with self._lock:
+            job_id = job_id if job_id is not None else current_job_id.get()
+            entry = self._entries.get(job_id)
+            return entry.get('user_id') if entry else None
+
+    def latest_job_id(self, user_id, job_type=None):
+        """Most recent job of a user, looked up in the Job table so jobs of every worker are found"""
+        # Background jobs such as pre-drafting never take over the user's progress view
+        query = Job.query.filter(Job.user_id == user_id, Job.priority >= 0)
+        if job_type:
+            query = query.filter_by(job_type=job_type)
+        job = query.order_by(Job.created_at.desc(), Job.id.desc()).first()
+        return job.id if job else None
+
+
+job_state = JobStateStore()
+
+# Durable job queue: routes enqueue jobs, worker threads in any process or host claim them by lease
+JOB_LEASE_SECONDS = int(os.environ.get('JOB_LEASE_SECONDS', 120))
+JOB_HEARTBEAT_SECONDS = int(os.environ.get('JOB_HEARTBEAT_SECONDS', 30))
+JOB_POLL_SECONDS = float(os.environ.get('JOB_POLL_SECONDS', 2))
+JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', 3))
+JOB_WORKER_THREADS = int(os.environ.get('JOB_WORKER_THREADS', 1))
+# Payload entries only needed while a job can still run; removed once it is completed or failed for good
+JOB_SECRET_PAYLOAD_KEYS = ('ig_sessionid',)
+
+
+def strip_job_secrets(job):
+    """Drop JOB_SECRET_PAYLOAD_KEYS from a job's stored payload"""
+    payload = job.get_payload()
+    if any(key in payload for key in JOB_SECRET_PAYLOAD_KEYS):
+        job.payload = json.dumps({key: value for key, value in payload.items() if key not in JOB_SECRET_PAYLOAD_KEYS},
+                                 default=str)
+
+
+class JobQueue:
+    """Enqueues jobs in the Job table and runs them on leased worker threads"""
+
+    def __init__(self):
+        self._handlers = {}  # job_type -> handler(payload, job_id) returning a JSON-serialisable result
+        self._wakeup = threading.Event()
+        self._workers = []
+        self._lock = threading.Lock()
+
+    def register(self, job_type, handler):
+        self._handlers[job_type] = handler
+
+    def enqueue(self, job_type, payload, user_id=None, priority=0):
+        """Store a new job and return its ID"""
+        with app.app_context():
+            job = Job(job_type=job_type, payload=json.dumps(payload, default=str), status='queued', user_id=user_id,
+                      priority=priority)
+            db.session.add(job)
+            db.session.commit()
+            job_id = job.id
+        self._wakeup.set()
+        logger.info(f"Enqueued {job_type} job {job_id}")
+        return job_id
+
+    def claim(self, worker_id):
+        """Lease the highest-priority, then oldest, runnable job to worker_id; returns (job_id, job_type, payload, user_id) or None.
+
+        Expired leases of running jobs are reclaimable, so a killed worker's job is picked up again, unless
+        that was its last attempt: such jobs are marked failed instead. Background jobs (negative priority)
+        run one at a time across all workers, so their own concurrency setting is also the global one.
+        """
+        from datetime import timedelta
+        from sqlalchemy import and_, or_, exists
+        from sqlalchemy.orm import aliased
+
+        with app.app_context():
+            try:
+                now = datetime.utcnow()
+                self._fail_exhausted(now)
+
+                running_job = aliased(Job)
+                background_running = exists().where(running_job.status == 'running', running_job.priority < 0,
+                                                     running_job.id != Job.id)
+                claimable = and_(
+                    or_(Job.status == 'queued',
+                        and_(Job.status == 'running', Job.lease_expires_at < now, Job.attempts < JOB_MAX_ATTEMPTS)),
+                    or_(Job.priority >= 0, ~background_running))
+                # SKIP LOCKED lets concurrent workers pass over rows another worker is claiming (PostgreSQL);
+                # SQLite ignores it and the guarded UPDATE below keeps the claim exclusive
+                job = (Job.query.filter(claimable, Job.job_type.in_(list(self._handlers)))
+                       .order_by(Job.priority.desc(), Job.created_at, Job.id)
+                       .with_for_update(skip_locked=True)
+                       .first())
+                if job is None:
+                    db.session.rollback()
+                    return None
+
+                claimed = Job.query.filter(Job.id == job.id, claimable).update({
+                    'status': 'running',
+                    'lease_owner': worker_id,
+                    'lease_expires_at': now + timedelta(seconds=JOB_LEASE_SECONDS),
+                    'heartbeat_at': now,
+                    'started_at': job.started_at or now,
+                    'attempts': Job.attempts + 1
+                }, synchronize_session=False)
+                db.session.commit()
+                if not claimed:
+                    return None
+                return job.id, job.job_type, job.get_payload(), job.user_id
+            except Exception as e:
+                logger.error(f"Failed to claim job: {e}")
+                db.session.rollback()
+                return None
+
+    def _fail_exhausted(self, now):
+        """Mark running jobs whose lease expired on their last attempt as failed"""
+        exhausted = (Job.query.filter(Job.status == 'running', Job.lease_expires_at < now,
+                                      Job.attempts >= JOB_MAX_ATTEMPTS)
+                     .with_for_update(skip_locked=True)
+                     .all())
+        for job in exhausted:
+            logger.warning(f"Job {job.id} lost its worker on attempt {job.attempts}/{JOB_MAX_ATTEMPTS}, marking it failed")
+            job.status = 'failed'
+            job.error_message = f"Worker lease expired on attempt {job.attempts} of {JOB_MAX_ATTEMPTS}"
+            job.lease_owner = None
+            job.lease_expires_at = None
+            job.finished_at = now
+            strip_job_secrets(job)
+        db.session.commit()
+
+    def heartbeat(self, job_id, worker_id):
+        """Extend the lease on a running job; returns False if another worker has taken it over"""
+        from datetime import timedelta
+
+        with app.app_context():
+            try:
+                now = datetime.utcnow()
+                renewed = Job.query.filter_by(id=job_id, lease_owner=worker_id, status='running').update({
+                    'heartbeat_at': now,
+                    'lease_expires_at': now + timedelta(seconds=JOB_LEASE_SECONDS)
+                }, synchronize_session=False)
+                db.session.commit()
+                return bool(renewed)
+            except Exception as e:
+                logger.error(f"Failed to renew lease on job {job_id}: {e}")
+                db.session.rollback()
+                return True  # Keep working; the next heartbeat retries
+
+    def finish(self, job_id, worker_id, result=None, error=None):
+        """Record the outcome of a job; failed jobs are requeued until JOB_MAX_ATTEMPTS is reached.
+
+        Nothing is written unless worker_id still holds the lease, so a worker that lost its job to another
+        worker cannot overwrite that worker's outcome. Returns whether the outcome was recorded.
+        """
+        with app.app_context():
+            try:
+                # The row lock keeps a concurrent claim from taking the job between this check and the commit
+                job = (Job.query.filter_by(id=job_id, lease_owner=worker_id, status='running')
+                       .with_for_update()
+                       .first())
+                if job is None:
+                    db.session.rollback()
+                    logger.warning(f"Job {job_id} lease was lost before {worker_id} finished it, discarding its outcome")
+                    return False
+                if error is None:
+                    job.status = 'completed'
+                    job.result = json.dumps(result, default=str)
+                elif job.attempts < JOB_MAX_ATTEMPTS:
+                    job.status = 'queued'
+                    job.error_message = error
+                else:
+                    job.status = 'failed'
+                    job.error_message = error
+                job.lease_owner = None
+                job.lease_expires_at = None
+                if job.status in ('completed', 'failed'):
+                    job.finished_at = datetime.utcnow()
+                    strip_job_secrets(job)
+                db.session.commit()
+                return True
+            except Exception as e:
+                logger.error(f"Failed to record outcome of job {job_id}: {e}")
+                db.session.rollback()
+                return False
+
+    def run_one(self, worker_id):
+        """Claim and run a single job; returns False when the queue was empty"""
+        claim = self.claim(worker_id)
+        if claim is None:
+            return False
+        job_id, job_type, payload, user_id = claim
+        logger.info(f"Worker {worker_id} running {job_type} job {job_id}")
+        # Progress reported anywhere below this point belongs to this job
+        context_token = current_job_id.set(job_id)
+        job_state.start(job_id, user_id)
+
+        done = threading.Event()
+
+        def keep_lease():
+            while not done.wait(JOB_HEARTBEAT_SECONDS):
+                if not self.heartbeat(job_id, worker_id):
+                    # Another worker may already be running the job; stop this copy at its next checkpoint
+                    logger.warning(f"Worker {worker_id} lost the lease on job {job_id}, requesting stop")
+                    job_state.request_stop(job_id)
+                    return
+
+        heartbeat_thread = threading.Thread(target=keep_lease, daemon=True)
+        heartbeat_thread.start()
+        try:
+            result = self._handlers[job_type](payload, job_id)
+            self.finish(job_id, worker_id, result=result)
+        except Exception as e:
+            logger.error(f"{job_type} job {job_id} failed: {e}")
+            self.finish(job_id, worker_id, error=str(e))
+        finally:
+            done.set()
+            job_state.finish(job_id)
+            current_job_id.reset(context_token)
+        return True
+
+    def work_forever(self, worker_id):
+        while True:
+            try:
+                if self.run_one(worker_id):
+                    continue
+            except Exception as e:
+                logger.error(f"Worker {worker_id} error: {e}")
+            self._wakeup.wait(JOB_POLL_SECONDS)
+            self._wakeup.clear()
+
+    def start_workers(self, count=JOB_WORKER_THREADS):
+        """Start worker threads in this process (idempotent per process)"""
+        import socket
+
+        with self._lock:
+            self._workers = [thread for thread in self._workers if thread.is_alive()]
+            for index in range(len(self._workers), count):
+                worker_id = f"{socket.gethostname()}:{os.getpid()}:{index}"
+                thread = threading.Thread(target=self.work_forever, args=(worker_id,),
+                                          name=f"job-worker-{index}", daemon=True)
+                thread.start()
+                self._workers.append(thread)
+        logger.info(f"Job workers running in process {os.getpid()}: {len(self._workers)}")
+
+
+job_queue = JobQueue()
+
+
 # Authentication decorators
 def login_required(f):
     """Decorator to require login for protected routes"""
@@ -198,23 +980,6 @@ def is_legacy_user():
 # Legacy APP_PASSWORD removed - no longer needed
 
 
-def deduplicate_profiles(profiles):
-    """Remove duplicate profiles based on hashtag|username key"""
-    seen = set()
-    unique_profiles = []
-    duplicates = set()
-
-    for profile in profiles:
-        key = f"{profile.get('hashtag', '')}|{profile.get('username', '')}"
-        if key in seen:
-            duplicates.add(profile.get('username', ''))
-        else:
-            seen.add(key)
-            unique_profiles.append(profile)
-
-    return unique_profiles, duplicates
-
-
 def clean_caption_for_database(caption):
     """Clean caption text to handle emojis and special characters safely"""
     if not caption:
@@ -234,8 +999,100 @@ def clean_caption_for_database(caption):
         return caption[:1000] if caption else ''  # Truncate as fallback
 
 
-def save_hashtag_username_pairs(profiles, duplicates):
-    """Save deduplicated hashtag-username pairs to database"""
+# Rows per INSERT ... ON CONFLICT statement when bulk upserting hashtag-username pairs
+HASHTAG_PAIR_UPSERT_BATCH_SIZE = 500
+# Bound parameters allowed per statement; SQLite builds before 3.32 stop at 999
+MAX_BOUND_PARAMETERS = {'postgresql': 32767, 'sqlite': 999}
+
+
+def _normalize_hashtag_pair_rows(profiles, duplicates):
+    """Build one row per (hashtag, username), merging repeats with the 'only when present' rules"""
+    rows = {}
+    now = datetime.utcnow()
+
+    for profile in profiles:
+        hashtag = profile.get('hashtag', '')
+        username = profile.get('username', '')
+        if not hashtag or not username:
+            continue
+
+        row = {
+            'hashtag': hashtag,
+            'username': username,
+            'is_duplicate': username in duplicates,
+            'timestamp': profile.get('timestamp'),
+            'post_url': profile.get('post_url'),
+            'beitragstext': clean_caption_for_database(profile.get('caption', '')),
+            'created_at': now
+        }
+
+        existing = rows.get((hashtag, username))
+        if existing:
+            # A repeat within the batch only overwrites fields it actually carries
+            for field in ('timestamp', 'post_url', 'beitragstext'):
+                if row[field]:
+                    existing[field] = row[field]
+            existing['is_duplicate'] = row['is_duplicate']
+        else:
+            rows[(hashtag, username)] = row
+
+    return list(rows.values())
+
+
+def _hashtag_pair_upsert_statement(rows):
+    """Build an INSERT ... ON CONFLICT (hashtag, username) DO UPDATE for the current dialect"""
+    dialect = db.engine.dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        return None
+
+    table = HashtagUsernamePair.__table__
+    stmt = insert(table).values(rows)
+    excluded = stmt.excluded
+
+    # Keep the stored timestamp/post_url/caption unless the new row carries a value
+    return stmt.on_conflict_do_update(
+        index_elements=[table.c.hashtag, table.c.username],
+        set_={
+            'is_duplicate': excluded.is_duplicate,
+            'timestamp': db.func.coalesce(excluded.timestamp, table.c.timestamp),
+            'post_url': db.func.coalesce(db.func.nullif(excluded.post_url, ''), table.c.post_url),
+            'beitragstext': db.func.coalesce(db.func.nullif(excluded.beitragstext, ''), table.c.beitragstext)
+        }
+    )
+
+
+def save_hashtag_username_pairs(profiles, duplicates, batch_size=HASHTAG_PAIR_UPSERT_BATCH_SIZE):
+    """Bulk upsert deduplicated hashtag-username pairs, returns the number of pairs written"""
+    with app.app_context():
+        if db.engine.dialect.name not in ('postgresql', 'sqlite'):
+            return save_hashtag_username_pairs_orm(profiles, duplicates)
+
+        rows = _normalize_hashtag_pair_rows(profiles, duplicates)
+        if rows:
+            # Every row binds one parameter per column, so the statement limit caps the rows per batch
+            batch_size = max(1, min(batch_size, MAX_BOUND_PARAMETERS[db.engine.dialect.name] // len(rows[0])))
+        try:
+            for start in range(0, len(rows), batch_size):
+                batch = rows[start:start + batch_size]
+                db.session.execute(_hashtag_pair_upsert_statement(batch))
+                db.session.commit()
+                logger.debug(f"Upserted hashtag-username pairs {start + 1}-{start + len(batch)} of {len(rows)}")
+
+            logger.info(f"Successfully upserted {len(rows)} hashtag-username pairs to database")
+            return len(rows)
+
+        except Exception as e:
+            logger.error(f"Failed to upsert hashtag-username pairs: {e}")
+            db.session.rollback()
+            raise
+
+
+def save_hashtag_username_pairs_orm(profiles, duplicates):
+    """Save deduplicated hashtag-username pairs one SELECT per pair (fallback for other databases)"""
     saved_pairs = []
     batch_size = 50  # Process in batches for better performance
 
@@ -309,7 +1166,7 @@ def save_hashtag_username_pairs(profiles, duplicates):
             db.session.commit()
             logger.info(f"Successfully saved {len(saved_pairs)} hashtag-username pairs to database")
 
-            return saved_pairs
+            return len(saved_pairs)
 
         except Exception as e:
             logger.error(f"Failed to save hashtag-username pairs: {e}")
@@ -317,196 +1174,455 @@ def save_hashtag_username_pairs(profiles, duplicates):
             raise
 
 
-def call_apify_actor_sync(actor_id, input_data, token):
-    """Call Apify actor using official client - memory optimized streaming version"""
-    # Start tracking this API call
-    call_id = None
+# Number of normalized hashtag profiles written to HashtagUsernamePair per commit
+HASHTAG_PAIR_FLUSH_SIZE = 50
+
+# Upper bound for the hashtag search limit accepted by /process
+DISCOVERY_MAX_SEARCH_LIMIT = 5000
+
+# Usernames held in memory by DiscoveryBuffer before the index spills to disk
+DISCOVERY_BUFFER_MEMORY_LIMIT = 2000
 
-    start_time = time.time()
-    client = ApifyClient(token)
-    
-    # Extract keyword from input_data for fallback hashtag
-    keyword = input_data.get('search', 'unknown')
 
-    # Add random delay before Apify call to avoid anti-spam measures
-    delay = random.uniform(1, 10)
-    logger.info(f"Anti-spam delay: {delay:.1f}s before Apify hashtag search")
-    time.sleep(delay)
+class DiscoveryBuffer:
+    """Bounded-memory username index for hashtag discovery.
 
+    Keeps the latest post (hashtag, timestamp, post URL, caption) per username. Once more than memory_limit
+    usernames are buffered the index is spilled to a temporary SQLite file and the
+    latest-timestamp dedup continues on disk, so memory stays flat for any dataset size.
+    """
+
+    def __init__(self, memory_limit=DISCOVERY_BUFFER_MEMORY_LIMIT):
+        self.memory_limit = memory_limit
+        self._memory = {}  # username -> (hashtag, epoch timestamp or None, post_url, caption)
+        self._conn = None
+        self._path = None
+
+    def _open_spill_file(self):
+        """Create the temporary SQLite spill file"""
+        import sqlite3
+        import tempfile
+
+        fd, self._path = tempfile.mkstemp(prefix='kl_discovery_', suffix='.sqlite')
+        os.close(fd)
+        self._conn = sqlite3.connect(self._path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=OFF')
+        self._conn.execute('PRAGMA synchronous=OFF')
+        self._conn.execute('PRAGMA cache_size=-2048')  # Cap the page cache at ~2 MB
+        self._conn.execute(
+            'CREATE TABLE profiles (username TEXT PRIMARY KEY, hashtag TEXT NOT NULL, ts REAL, post_url TEXT, '
+            'caption TEXT)'
+        )
+        logger.info(f"Discovery buffer exceeded {self.memory_limit} usernames - spilling to {self._path}")
+
+    def _spill(self):
+        """Move the in-memory index to disk, keeping the latest timestamp per username"""
+        if self._conn is None:
+            self._open_spill_file()
+        self._conn.executemany(
+            'INSERT INTO profiles (username, hashtag, ts, post_url, caption) VALUES (?, ?, ?, ?, ?) '
+            'ON CONFLICT(username) DO UPDATE SET hashtag = excluded.hashtag, ts = excluded.ts, '
+            'post_url = excluded.post_url, caption = excluded.caption '
+            'WHERE excluded.ts IS NOT NULL AND (profiles.ts IS NULL OR excluded.ts > profiles.ts)',
+            ((username,) + entry for username, entry in self._memory.items())
+        )
+        self._conn.commit()
+        self._memory.clear()
+
+    def _lookup(self, username):
+        """Return the buffered (hashtag, ts, post_url, caption) for a username, checking memory first"""
+        entry = self._memory.get(username)
+        if entry is not None or self._conn is None:
+            return entry
+        row = self._conn.execute('SELECT hashtag, ts, post_url, caption FROM profiles WHERE username = ?',
+                                 (username,)).fetchone()
+        return tuple(row) if row else None
+
+    def offer(self, username, hashtag, timestamp, post_url=None, caption=None):
+        """Record a post owner; returns True if this post is now the latest one for the username"""
+        ts = timestamp.timestamp() if timestamp else None
+        previous = self._lookup(username)
+        if previous is not None and not (ts is not None and (previous[1] is None or ts > previous[1])):
+            return False
+
+        self._memory[username] = (hashtag, ts, post_url, caption)
+        if len(self._memory) > self.memory_limit:
+            self._spill()
+        return True
+
+    def __len__(self):
+        if self._conn is None:
+            return len(self._memory)
+        self._spill()
+        return self._conn.execute('SELECT COUNT(*) FROM profiles').fetchone()[0]
+
+    def hashtag_counts(self):
+        """Return {hashtag: unique username count} for the final assignments"""
+        if self._conn is None:
+            counts = {}
+            for entry in self._memory.values():
+                counts[entry[0]] = counts.get(entry[0], 0) + 1
+            return counts
+        self._spill()
+        return dict(self._conn.execute('SELECT hashtag, COUNT(*) FROM profiles GROUP BY hashtag'))
+
+    def iter_assignments(self):
+        """Yield (username, hashtag) pairs for the final assignments"""
+        if self._conn is None:
+            for username, entry in list(self._memory.items()):
+                yield username, entry[0]
+            return
+        self._spill()
+        yield from self._conn.execute('SELECT username, hashtag FROM profiles ORDER BY hashtag')
+
+    def iter_records(self):
+        """Yield the latest post of every username as a profile record, ready for save_hashtag_username_pairs"""
+        from datetime import timezone
+
+        if self._conn is None:
+            rows = ((username,) + entry for username, entry in list(self._memory.items()))
+        else:
+            self._spill()
+            rows = self._conn.execute('SELECT username, hashtag, ts, post_url, caption FROM profiles')
+        for username, hashtag, ts, post_url, caption in rows:
+            record = {'username': username, 'hashtag': hashtag}
+            # Only add timestamp, post_url and caption if they exist
+            if ts is not None:
+                record['timestamp'] = datetime.fromtimestamp(ts, tz=timezone.utc)
+            if post_url:
+                record['post_url'] = post_url
+            if caption:
+                record['caption'] = caption
+            yield record
+
+    def close(self):
+        """Drop the in-memory index and delete the spill file"""
+        self._memory.clear()
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+            try:
+                os.remove(self._path)
+            except OSError:
+                pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def parse_post_timestamp(timestamp_str):
+    """Parse an Apify ISO post timestamp, returning None when missing or malformed"""
+    if not timestamp_str:
+        return None
     try:
-        # Run the Actor and wait for it to finish
-        run = client.actor(actor_id).call(run_input=input_data)
+        return datetime.fromisoformat(timestamp_str.replace('Z', '+00:00'))
+    except (ValueError, AttributeError):
+        logger.debug(f"Could not parse timestamp: {timestamp_str}")
+        return None
 
-        # Extreme memory optimization to prevent SIGKILL
-        max_items = 50   # Drastically reduced from 100 to 50
-        batch_size = 10  # Reduced batch size from 20 to 10
-        processing_delay = 0.8  # Increased delay to reduce memory pressure
 
-        dataset = client.dataset(run["defaultDatasetId"])
+def buffer_hashtag_item(item, keyword, buffer):
+    """Offer the posts of one hashtag dataset item to the buffer, which keeps the latest post per username"""
+    import urllib.parse
 
-        # Stream process with immediate username, hashtag, timestamp and post URL extraction
-        username_data_map = {}  # Map username to complete data for deduplication
-        total_processed = 0
+    # Get the hashtag ID from the item
+    hashtag_id = item.get('id') or item.get('ID') or item.get('hashtag') or item.get('name') or keyword
+    hashtag = urllib.parse.unquote(str(hashtag_id))
 
-        # Use smaller chunks and more frequent garbage collection
-        import gc
-        from datetime import datetime
+    for posts_key in ('latestPosts', 'topPosts'):
+        posts = item.get(posts_key)
+        if not isinstance(posts, list):
+            continue
 
-        logger.info(f"Starting streaming extraction with max_items={max_items}")
+        for post in posts:
+            if not isinstance(post, dict):
+                continue
+            username = post.get('ownerUsername')
+            if not username or not isinstance(username, str):
+                continue
 
-        for item in dataset.iterate_items():
-            if total_processed >= max_items:
-                logger.info(f"Reached maximum item limit of {max_items} for memory safety")
-                break
+            # Prefer the latest timestamp if the username was already seen
+            buffer.offer(username, hashtag, parse_post_timestamp(post.get('timestamp')),
+                         post.get('url') or None, post.get('caption') or None)
 
-            # Extract usernames and hashtags from posts
-            if isinstance(item, dict):
-                # Get the hashtag ID from the item
-                hashtag_id = item.get('id') or item.get('ID') or item.get('hashtag') or item.get('name') or keyword
-                
-                # Debug log to see what fields are available
-                if total_processed == 0:
-                    logger.info(f"First item keys: {list(item.keys())}")
-                    logger.info(f"Hashtag ID extracted: {hashtag_id}")
-                
-                # Extract from latestPosts
-                if 'latestPosts' in item and isinstance(item['latestPosts'], list):
-                    for post in item['latestPosts']:
-                        if isinstance(post, dict) and 'ownerUsername' in post:
-                            username = post['ownerUsername']
-                            if username and isinstance(username, str):
-                                # Extract timestamp, URL, and caption
-                                timestamp_str = post.get('timestamp')
-                                post_url = post.get('url')
-                                caption = post.get('caption', '')
-                                
-                                # Debug: Log caption extraction for first few posts
-                                if total_processed < 5:
-                                    logger.info(f"DEBUG LATEST Caption extraction - Post {total_processed + 1}: username={username}, caption_length={len(caption) if caption else 0}, caption_preview={caption[:100] if caption else 'None'}...")
-                                
-                                # Parse timestamp if available
-                                timestamp_obj = None
-                                if timestamp_str:
-                                    try:
-                                        # Parse ISO format timestamp
-                                        timestamp_obj = datetime.fromisoformat(timestamp_str.replace('Z', '+00:00'))
-                                    except (ValueError, AttributeError):
-                                        logger.debug(f"Could not parse timestamp: {timestamp_str}")
-                                
-                                # Store with complete data (prefer latest timestamp if username exists)
-                                if username not in username_data_map or (timestamp_obj and 
-                                    (not username_data_map[username].get('timestamp') or 
-                                     timestamp_obj > username_data_map[username]['timestamp'])):
-                                    username_data_map[username] = {
-                                        'hashtag': hashtag_id,
-                                        'timestamp': timestamp_obj,
-                                        'post_url': post_url,
-                                        'caption': caption
-                                    }
-                                    
-                                    # Debug: Log data mapping for first few profiles (LATEST)
-                                    if total_processed < 3:
-                                        logger.info(f"DEBUG LATEST Data mapping - username={username}, map_caption_length={len(caption) if caption else 0}, map_caption={caption[:50] if caption else 'None'}...")
-
-                # Extract from topPosts
-                if 'topPosts' in item and isinstance(item['topPosts'], list):
-                    for post in item['topPosts']:
-                        if isinstance(post, dict) and 'ownerUsername' in post:
-                            username = post['ownerUsername']
-                            if username and isinstance(username, str):
-                                # Extract timestamp, URL, and caption
-                                timestamp_str = post.get('timestamp')
-                                post_url = post.get('url')
-                                caption = post.get('caption', '')
-                                
-                                # Debug: Log caption extraction for first few posts
-                                if total_processed < 5:
-                                    logger.info(f"DEBUG TOP Caption extraction - Post {total_processed + 1}: username={username}, caption_length={len(caption) if caption else 0}, caption_preview={caption[:100] if caption else 'None'}...")
-                                
-                                # Parse timestamp if available
-                                timestamp_obj = None
-                                if timestamp_str:
-                                    try:
-                                        # Parse ISO format timestamp
-                                        timestamp_obj = datetime.fromisoformat(timestamp_str.replace('Z', '+00:00'))
-                                    except (ValueError, AttributeError):
-                                        logger.debug(f"Could not parse timestamp: {timestamp_str}")
-                                
-                                # Store with complete data (prefer latest timestamp if username exists)
-                                if username not in username_data_map or (timestamp_obj and 
-                                    (not username_data_map[username].get('timestamp') or 
-                                     timestamp_obj > username_data_map[username]['timestamp'])):
-                                    username_data_map[username] = {
-                                        'hashtag': hashtag_id,
-                                        'timestamp': timestamp_obj,
-                                        'post_url': post_url,
-                                        'caption': caption
-                                    }
-                                    
-                                    # Debug: Log data mapping for first few profiles (TOP)
-                                    if total_processed < 3:
-                                        logger.info(f"DEBUG TOP Data mapping - username={username}, map_caption_length={len(caption) if caption else 0}, map_caption={caption[:50] if caption else 'None'}...")
-
-            total_processed += 1
-
-            # Aggressive memory cleanup
-            if total_processed % batch_size == 0:
-                gc.collect()  # Force garbage collection
-                time.sleep(processing_delay)
-                logger.debug(f"Processed {total_processed} items, found {len(username_data_map)} unique usernames")
-
-        # Convert map to list of profile objects with complete data
-        processed_items = []
-        profile_count = 0
-        for username, data in username_data_map.items():
-            profile_data = {
-                'username': username,
-                'hashtag': data['hashtag']
-            }
-            # Only add timestamp, post_url and caption if they exist
-            if data.get('timestamp'):
-                profile_data['timestamp'] = data['timestamp']
-            if data.get('post_url'):
-                profile_data['post_url'] = data['post_url']
-            if data.get('caption'):
-                profile_data['caption'] = data['caption']
-                
-            # Debug: Log profile data construction for first few profiles
-            if profile_count < 3:
-                caption_in_data = data.get('caption', '')
-                caption_in_profile = profile_data.get('caption', '')
-                logger.info(f"DEBUG Profile construction {profile_count + 1}: username={username}, data_caption_length={len(caption_in_data) if caption_in_data else 0}, profile_caption_length={len(caption_in_profile) if caption_in_profile else 0}, caption_match={caption_in_data == caption_in_profile}")
-                
-            processed_items.append(profile_data)
-            profile_count += 1
 
-        # Final cleanup
-        gc.collect()
+async def abuffer_hashtag_profiles(items, keyword, buffer, max_items=None):
+    """Read an async stream of hashtag dataset items into the buffer; returns the number of items read.
+
+    Nothing is persisted here: a later post can still move a username to another hashtag, so pairs are
+    written from buffer.iter_records() once the whole dataset has been read.
+    """
+    total_processed = 0
+
+    async for item in items:
+        if max_items and total_processed >= max_items:
+            logger.info(f"Reached maximum item limit of {max_items}")
+            break
+
+        if isinstance(item, dict):
+            if total_processed == 0:
+                logger.info(f"First item keys: {list(item.keys())}")
+            buffer_hashtag_item(item, keyword, buffer)
+
+        total_processed += 1
+        if total_processed % 100 == 0:
+            logger.debug(f"Processed {total_processed} items")
+
+    logger.info(f"Streaming extraction completed: {total_processed} items read")
+    return total_processed
 
-        # Log successful completion
-        logger.info(f"Streaming extraction completed: {len(username_data_map)} unique usernames from {total_processed} items")
-        return {"items": processed_items}
 
+# Apify runs are started without waiting and awaited by polling with backoff, or woken early by a webhook
+APIFY_TERMINAL_STATUSES = {'SUCCEEDED', 'FAILED', 'TIMED-OUT', 'ABORTED'}
+APIFY_POLL_INITIAL_SECONDS = float(os.environ.get('APIFY_POLL_INITIAL_SECONDS', 2))
+APIFY_POLL_MAX_SECONDS = float(os.environ.get('APIFY_POLL_MAX_SECONDS', 30))
+APIFY_POLL_BACKOFF = 1.5
+APIFY_RUN_TIMEOUT_SECONDS = float(os.environ.get('APIFY_RUN_TIMEOUT_SECONDS', 3600))
+# Public URL of the /apify/webhook endpoint; runs are only polled when unset
+APIFY_WEBHOOK_URL = os.environ.get('APIFY_WEBHOOK_URL')
+APIFY_WEBHOOK_SECRET = os.environ.get('APIFY_WEBHOOK_SECRET')
+APIFY_WEBHOOK_EVENT_TYPES = ['ACTOR.RUN.SUCCEEDED', 'ACTOR.RUN.FAILED', 'ACTOR.RUN.TIMED_OUT', 'ACTOR.RUN.ABORTED']
+
+
+def record_apify_run(run, actor_id, job_id=None):
+    """Insert or update the ApifyRun row for an Apify run object"""
+    try:
+        with app.app_context():
+            apify_run = ApifyRun.query.filter_by(run_id=run['id']).first()
+            if apify_run is None:
+                apify_run = ApifyRun(run_id=run['id'], actor_id=actor_id, job_id=job_id)
+                db.session.add(apify_run)
+            apify_run.status = run.get('status') or apify_run.status
+            apify_run.dataset_id = run.get('defaultDatasetId') or apify_run.dataset_id
+            if apify_run.status in APIFY_TERMINAL_STATUSES and not apify_run.finished_at:
+                apify_run.finished_at = datetime.utcnow()
+            db.session.commit()
     except Exception as e:
-        # Log the failure with detailed error information
-        logger.error(f"Apify hashtag search failed: {e}")
-        return {"items": []}
+        logger.error(f"Failed to record Apify run {run.get('id')}: {e}")
+        db.session.rollback()
 
 
-async def call_perplexity_api(profile_info, api_key):
-    """Call Perplexity API to find contact information using full profile data"""
-    username = profile_info.get('username', '')
+class ApifyRunTracker:
+    """Starts actor runs without blocking and waits for them to reach a terminal status"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._waiters = {}  # run_id -> (event loop, asyncio.Event)
+        self._notified = set()  # run_ids whose webhook arrived before anyone waited on them
+
+    async def start(self, client, actor_id, input_data, job_id=None):
+        """Start an actor run and record its run ID against the job"""
+        webhooks = None
+        if APIFY_WEBHOOK_URL:
+            request_url = APIFY_WEBHOOK_URL
+            if APIFY_WEBHOOK_SECRET:
+                request_url += ('&' if '?' in request_url else '?') + f'secret={APIFY_WEBHOOK_SECRET}'
+            webhooks = [{'event_types': APIFY_WEBHOOK_EVENT_TYPES, 'request_url': request_url}]
+        run = await client.actor(actor_id).start(run_input=input_data, webhooks=webhooks)
+        logger.info(f"Started Apify run {run['id']} of actor {actor_id} for job {job_id}")
+        await asyncio.to_thread(record_apify_run, run, actor_id, job_id)
+        return run
+
+    def notify(self, run_id):
+        """Wake the coroutine waiting on a run; safe to call from any thread"""
+        with self._lock:
+            waiter = self._waiters.get(run_id)
+            if waiter is None:
+                if len(self._notified) < 1000:
+                    self._notified.add(run_id)
+                return
+        loop, event = waiter
+        loop.call_soon_threadsafe(event.set)
+
+    async def wait(self, client, run):
+        """Poll the run with exponential backoff until it finishes, returning the final run object"""
+        run_id = run['id']
+        event = asyncio.Event()
+        with self._lock:
+            self._waiters[run_id] = (asyncio.get_running_loop(), event)
+            if run_id in self._notified:
+                self._notified.discard(run_id)
+                event.set()
+
+        interval = APIFY_POLL_INITIAL_SECONDS
+        deadline = time.monotonic() + APIFY_RUN_TIMEOUT_SECONDS
+        try:
+            while run.get('status') not in APIFY_TERMINAL_STATUSES:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError(f"Apify run {run_id} did not finish within {APIFY_RUN_TIMEOUT_SECONDS:.0f}s")
+                try:
+                    await asyncio.wait_for(event.wait(), timeout=min(interval, remaining))
+                except asyncio.TimeoutError:
+                    interval = min(interval * APIFY_POLL_BACKOFF, APIFY_POLL_MAX_SECONDS)
+                event.clear()
+                run = await client.run(run_id).get() or run
+        finally:
+            with self._lock:
+                self._waiters.pop(run_id, None)
+                self._notified.discard(run_id)
 
-    # Start tracking this API call
-    call_id = None
+        await asyncio.to_thread(record_apify_run, run, run.get('actId', ''))
+        logger.info(f"Apify run {run_id} finished with status {run.get('status')}")
+        return run
 
-    url = "https://api.perplexity.ai/chat/completions"
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json"
-    }
 
-    # Build comprehensive profile information for better search results
+apify_runs = ApifyRunTracker()
+
+
+async def run_apify_actor(client, actor_id, input_data, job_id=None):
+    """Start an actor run, wait for it to finish and return the run; raises unless it succeeded"""
+    run = await apify_runs.start(client, actor_id, input_data, job_id)
+    run = await apify_runs.wait(client, run)
+    if run.get('status') != 'SUCCEEDED':
+        raise RuntimeError(f"Apify run {run['id']} of actor {actor_id} ended with status {run.get('status')}")
+    return run
+
+
+async def aiter_apify_hashtag_items(actor_id, input_data, token, job_id=None):
+    """Run the hashtag search actor with the async client and yield dataset items once the run finishes"""
+    client = provider_clients.apify_async_client(token)
+    apify_bucket = pacer.provider('apify')
+    await apify_bucket.acquire()
+
+    # Awaiting the run leaves the event loop free for progress updates and other lookups
+    try:
+        run = await run_apify_actor(client, actor_id, input_data, job_id)
+    except Exception:
+        apify_bucket.record_outcome(False)
+        raise
+    apify_bucket.record_outcome(True)
+
+    async for item in client.dataset(run["defaultDatasetId"]).iterate_items():
+        yield item
+
+
+async def apersist_hashtag_profiles(records, chunk_size=HASHTAG_PAIR_FLUSH_SIZE, on_chunk=None):
+    """Flush deduplicated profile records (e.g. DiscoveryBuffer.iter_records()) to HashtagUsernamePair in bounded chunks.
+
+    Each chunk is committed from a worker thread before the next one is read, so memory stays bounded
+    and partial results survive a crash. Returns the number of records written.
+    """
+    saved_count = 0
+    chunk = []
+
+    for record in records:
+        chunk.append(record)
+        if len(chunk) >= chunk_size:
+            saved_count += await asyncio.to_thread(save_hashtag_username_pairs, chunk, set())
+            chunk = []
+            if on_chunk:
+                on_chunk(saved_count)
+    if chunk:
+        saved_count += await asyncio.to_thread(save_hashtag_username_pairs, chunk, set())
+        if on_chunk:
+            on_chunk(saved_count)
+
+    logger.info(f"Streamed {saved_count} hashtag-username pairs to database")
+    return saved_count
+
+
+# Contact lookup cache: positive answers, "nothing found" answers and the LRU size cap
+CONTACT_CACHE_TTL_HOURS = float(os.environ.get('CONTACT_CACHE_TTL_HOURS', 720))
+CONTACT_CACHE_NEGATIVE_TTL_HOURS = float(os.environ.get('CONTACT_CACHE_NEGATIVE_TTL_HOURS', 72))
+CONTACT_CACHE_MAX_ENTRIES = int(os.environ.get('CONTACT_CACHE_MAX_ENTRIES', 20000))
+# Eviction scans the whole table, so it runs at most once per interval instead of on every store
+CONTACT_CACHE_EVICT_INTERVAL_SECONDS = float(os.environ.get('CONTACT_CACHE_EVICT_INTERVAL_SECONDS', 300))
+_contact_cache_evict_lock = threading.Lock()
+_contact_cache_evicted_at = 0.0
+
+
+def contact_cache_key(model, profile_description):
+    """Hash the model and exact profile description sent to Perplexity into a cache key"""
+    return hashlib.sha256(f"{model}\n{profile_description}".encode('utf-8')).hexdigest()
+
+
+def lookup_contact_cache(cache_key):
+    """Return the cached contact info for a key, or None on a miss or expired entry"""
+    try:
+        with app.app_context():
+            entry = ContactLookupCache.query.filter_by(cache_key=cache_key).first()
+            if not entry:
+                return None
+            now = datetime.utcnow()
+            if entry.expires_at < now:
+                db.session.delete(entry)
+                db.session.commit()
+                return None
+            entry.last_used_at = now
+            entry.hit_count = (entry.hit_count or 0) + 1
+            response = entry.get_response()
+            db.session.commit()
+            return response
+    except Exception as e:
+        logger.error(f"Contact cache lookup failed: {e}")
+        return None
+
+
+def store_contact_cache(cache_key, username, contact_info):
+    """Cache a Perplexity answer; answers without any contact field use the shorter negative TTL"""
+    from datetime import timedelta
+
+    is_negative = not any(contact_info.get(field) for field in ('email', 'phone', 'website'))
+    ttl_hours = CONTACT_CACHE_NEGATIVE_TTL_HOURS if is_negative else CONTACT_CACHE_TTL_HOURS
+    now = datetime.utcnow()
+    try:
+        with app.app_context():
+            entry = ContactLookupCache.query.filter_by(cache_key=cache_key).first()
+            if not entry:
+                entry = ContactLookupCache(cache_key=cache_key)
+                db.session.add(entry)
+            entry.username = username
+            entry.response = json.dumps(contact_info)
+            entry.is_negative = is_negative
+            entry.created_at = now
+            entry.last_used_at = now
+            entry.expires_at = now + timedelta(hours=ttl_hours)
+            db.session.commit()
+            maybe_evict_contact_cache()
+    except Exception as e:
+        logger.error(f"Failed to store contact cache entry for {username}: {e}")
+        db.session.rollback()
+
+
+def maybe_evict_contact_cache():
+    """Run evict_contact_cache if CONTACT_CACHE_EVICT_INTERVAL_SECONDS have passed since the last run in this process"""
+    global _contact_cache_evicted_at
+    with _contact_cache_evict_lock:
+        now = time.monotonic()
+        if now - _contact_cache_evicted_at < CONTACT_CACHE_EVICT_INTERVAL_SECONDS:
+            return
+        _contact_cache_evicted_at = now
+    evict_contact_cache()
+
+
+def evict_contact_cache():
+    """Drop expired entries, then the least recently used ones above CONTACT_CACHE_MAX_ENTRIES"""
+    ContactLookupCache.query.filter(
+        ContactLookupCache.expires_at < datetime.utcnow()
+    ).delete(synchronize_session=False)
+
+    overflow = ContactLookupCache.query.count() - CONTACT_CACHE_MAX_ENTRIES
+    if overflow > 0:
+        stale_ids = [row.id for row in db.session.query(ContactLookupCache.id)
+                     .order_by(ContactLookupCache.last_used_at.asc()).limit(overflow)]
+        ContactLookupCache.query.filter(ContactLookupCache.id.in_(stale_ids)).delete(synchronize_session=False)
+        logger.info(f"Evicted {len(stale_ids)} least recently used contact cache entries")
+    db.session.commit()
+
+
+# Perplexity models for the cheap and the deep-search contact resolver. The deep tier costs several cheap
+# lookups and would run for most profiles, so it is opt-in: set CONTACT_DEEP_MODEL (e.g. 'sonar-pro') to enable it
+CONTACT_CHEAP_MODEL = os.environ.get('CONTACT_CHEAP_MODEL', 'sonar')
+CONTACT_DEEP_MODEL = os.environ.get('CONTACT_DEEP_MODEL', '')
+
+
+def describe_contact_profile(profile_info):
+    """Build the profile description sent to Perplexity and return it with the known email, phone and website"""
+    username = profile_info.get('username', '')
     full_name = profile_info.get('full_name', '')
     biography = profile_info.get('biography', '')
     followers = profile_info.get('follower_count', 0)
@@ -535,9 +1651,32 @@ async def call_perplexity_api(profile_info, api_key):
     - Phone: {existing_phone if existing_phone else 'Not found'}
     - Website: {existing_website if existing_website else 'Not found'}
     """
+    return profile_description, existing_email, existing_phone, existing_website
+
+
+def lookup_cached_contacts(profile_info, model=CONTACT_CHEAP_MODEL):
+    """Return the cached Perplexity answer for a profile without calling the API, or None"""
+    profile_description = describe_contact_profile(profile_info)[0]
+    return lookup_contact_cache(contact_cache_key(model, profile_description))
+
+
+async def call_perplexity_api(profile_info, api_key, model=CONTACT_CHEAP_MODEL):
+    """Call Perplexity API to find contact information using full profile data.
+
+    Raises on HTTP errors, timeouts and unparseable responses; only answers are cached.
+    """
+    username = profile_info.get('username', '')
+
+    url = "https://api.perplexity.ai/chat/completions"
+    headers = {
+        "Authorization": f"Bearer {api_key}",
+        "Content-Type": "application/json"
+    }
+
+    profile_description, existing_email, existing_phone, existing_website = describe_contact_profile(profile_info)
 
     data = {
-        "model": "sonar",
+        "model": model,
         "messages": [
             {
                 "role": "system",
@@ -552,111 +1691,163 @@ async def call_perplexity_api(profile_info, api_key):
         "stream": False
     }
 
-    async with httpx.AsyncClient(timeout=60.0) as client:
+    # Unchanged profiles get the cached answer (including "nothing found") without an API call
+    cache_key = contact_cache_key(data["model"], profile_description)
+    cached_contact = await asyncio.to_thread(lookup_contact_cache, cache_key)
+    if cached_contact is not None:
+        logger.info(f"Perplexity cache hit for {username}")
+        return {
+            "email": existing_email or cached_contact.get("email", ""),
+            "phone": existing_phone or cached_contact.get("phone", ""),
+            "website": existing_website or cached_contact.get("website", "")
+        }
+
+    client = provider_clients.async_client('perplexity')
+    perplexity_bucket = pacer.provider('perplexity')
+    await perplexity_bucket.acquire()
+    try:
+        response = await client.post(url, headers=headers, json=data)
+        response.raise_for_status()
+        perplexity_bucket.record_outcome(True)
+        result = response.json()
+
         try:
-            response = await client.post(url, headers=headers, json=data)
-            response.raise_for_status()
-            result = response.json()
+            content = result['choices'][0]['message']['content']
+
+            # Try to extract JSON from the response (may contain additional text)
+            # Find the first { and matching } to extract just the JSON part
+            json_start = content.find('{')
+            if json_start != -1:
+                # Find the matching closing brace
+                brace_count = 0
+                json_end = json_start
+                for i, char in enumerate(content[json_start:], json_start):
+                    if char == '{':
+                        brace_count += 1
+                    elif char == '}':
+                        brace_count -= 1
+                        if brace_count == 0:
+                            json_end = i + 1
+                            break
+
+                json_content = content[json_start:json_end]
+                contact_info = json.loads(json_content)
+                await asyncio.to_thread(store_contact_cache, cache_key, username, contact_info)
+
+                # Merge existing contact info with new findings
+                # Prioritize existing data from the lead database
+                merged_contact = {
+                    "email": existing_email or contact_info.get("email", ""),
+                    "phone": existing_phone or contact_info.get("phone", ""),
+                    "website": existing_website or contact_info.get("website", "")
+                }
 
-            try:
-                content = result['choices'][0]['message']['content']
-
-                # Try to extract JSON from the response (may contain additional text)
-                # Find the first { and matching } to extract just the JSON part
-                json_start = content.find('{')
-                if json_start != -1:
-                    # Find the matching closing brace
-                    brace_count = 0
-                    json_end = json_start
-                    for i, char in enumerate(content[json_start:], json_start):
-                        if char == '{':
-                            brace_count += 1
-                        elif char == '}':
-                            brace_count -= 1
-                            if brace_count == 0:
-                                json_end = i + 1
-                                break
-
-                    json_content = content[json_start:json_end]
-                    contact_info = json.loads(json_content)
-
-                    # Merge existing contact info with new findings
-                    # Prioritize existing data from the lead database
-                    merged_contact = {
-                        "email": existing_email or contact_info.get("email", ""),
-                        "phone": existing_phone or contact_info.get("phone", ""),
-                        "website": existing_website or contact_info.get("website", "")
-                    }
-
-                    # Log successful completion
-                    logger.info(f"Perplexity API enrichment for {username}: found {sum(1 for v in contact_info.values() if v)} new fields")
-                    return merged_contact
-                else:
-                    # No JSON found, return existing contact info if available
-                    logger.warning(f"No JSON found in Perplexity response for {username}")
-                    return {
-                        "email": existing_email or "",
-                        "phone": existing_phone or "",
-                        "website": existing_website or ""
-                    }
-            except (json.JSONDecodeError, KeyError) as e:
-                # Log parsing failure
-                logger.error(f"Failed to parse Perplexity response for {username}: {e}")
+                # Log successful completion
+                logger.info(f"Perplexity API enrichment for {username}: found {sum(1 for v in contact_info.values() if v)} new fields")
+                return merged_contact
+            else:
+                # No JSON found, return existing contact info if available
+                logger.warning(f"No JSON found in Perplexity response for {username}")
+                await asyncio.to_thread(store_contact_cache, cache_key, username, {})
                 return {
                     "email": existing_email or "",
                     "phone": existing_phone or "",
                     "website": existing_website or ""
                 }
-        except httpx.HTTPStatusError as e:
-            # Log HTTP error
-            
-            return {
-                "email": existing_email or "",
-                "phone": existing_phone or "",
-                "website": existing_website or ""
-            }
-        except Exception as e:
-            # Log general error
-            logger.error(f"Perplexity API error for {username}: {e}")
-            return {
-                "email": existing_email or "",
-                "phone": existing_phone or "",
-                "website": existing_website or ""
-            }
+        except (json.JSONDecodeError, KeyError) as e:
+            # Log parsing failure; raised like API errors so the lookup is retried instead of treated as empty
+            logger.error(f"Failed to parse Perplexity response for {username}: {e}")
+            raise
+    except httpx.HTTPStatusError as e:
+        # Log HTTP error
+        logger.error(f"Perplexity API HTTP {e.response.status_code} for {username}")
+        perplexity_bucket.record_outcome(False, blocked=e.response.status_code == 429)
+        raise
+    except httpx.HTTPError as e:
+        # Log transport error (timeout, connection reset)
+        logger.error(f"Perplexity API error for {username}: {e}")
+        perplexity_bucket.record_outcome(False)
+        raise
 
 
-def backup_lead_to_backup_table(lead):
-    """Create a backup copy of a lead in the LeadBackup table"""
-    try:
-        backup_lead = LeadBackup(
+# 'delta' stores only changed fields per version in LeadBackupDelta, 'full' copies every column to LeadBackup
+LEAD_BACKUP_MODE = os.environ.get('LEAD_BACKUP_MODE', 'delta')
+
+
+def build_lead_backup(lead):
+    """Build a LeadBackup row mirroring the current state of a lead (not added to the session)"""
+    return LeadBackup(
+        original_lead_id=lead.id,
+        username=lead.username,
+        hashtag=lead.hashtag,
+        full_name=lead.full_name,
+        bio=lead.bio,
+        email=lead.email,
+        phone=lead.phone,
+        website=lead.website,
+        followers_count=lead.followers_count,
+        following_count=lead.following_count,
+        posts_count=lead.posts_count,
+        is_verified=lead.is_verified,
+        is_business=lead.is_business,
+        profile_pic_url=lead.profile_pic_url,
+        is_duplicate=lead.is_duplicate,
+        address_street=lead.address_street,
+        city_name=lead.city_name,
+        zip=lead.zip,
+        latitude=lead.latitude,
+        longitude=lead.longitude,
+        subject=lead.subject,
+        email_body=lead.email_body,
+        sent=lead.sent,
+        sent_at=lead.sent_at,
+        original_created_at=lead.created_at,
+        original_updated_at=lead.updated_at
+    )
+
+
+def build_lead_delta_backups(leads):
+    """Build LeadBackupDelta rows for the leads whose tracked fields changed since their last version.
+
+    Existing history for the whole batch is loaded with one query; leads whose current
+    state equals the reconstructed latest version produce no row at all.
+    """
+    usernames = {lead.username for lead in leads}
+    hashtags = {lead.hashtag for lead in leads}
+    history = {}
+    for delta in LeadBackupDelta.query.filter(
+        LeadBackupDelta.username.in_(usernames),
+        LeadBackupDelta.hashtag.in_(hashtags)
+    ).all():
+        history.setdefault((delta.username, delta.hashtag), []).append(delta)
+
+    rows = []
+    for lead in leads:
+        deltas = history.get((lead.username, lead.hashtag), [])
+        changes = LeadBackupDelta.diff(LeadBackupDelta.fold(deltas), LeadBackupDelta.snapshot(lead))
+        if not changes:
+            continue
+        rows.append(LeadBackupDelta(
             original_lead_id=lead.id,
             username=lead.username,
             hashtag=lead.hashtag,
-            full_name=lead.full_name,
-            bio=lead.bio,
-            email=lead.email,
-            phone=lead.phone,
-            website=lead.website,
-            followers_count=lead.followers_count,
-            following_count=lead.following_count,
-            posts_count=lead.posts_count,
-            is_verified=lead.is_verified,
-            is_business=lead.is_business,
-            profile_pic_url=lead.profile_pic_url,
-            is_duplicate=lead.is_duplicate,
-            address_street=lead.address_street,
-            city_name=lead.city_name,
-            zip=lead.zip,
-            latitude=lead.latitude,
-            longitude=lead.longitude,
-            subject=lead.subject,
-            email_body=lead.email_body,
-            sent=lead.sent,
-            sent_at=lead.sent_at,
-            original_created_at=lead.created_at,
-            original_updated_at=lead.updated_at
-        )
-        db.session.add(backup_lead)
+            version=max((d.version for d in deltas), default=0) + 1,
+            changes=json.dumps(changes, separators=(',', ':'))
+        ))
+    return rows
+
+
+def build_lead_backups(leads):
+    """Build the backup rows for a list of flushed leads according to LEAD_BACKUP_MODE"""
+    if LEAD_BACKUP_MODE == 'full':
+        return [build_lead_backup(lead) for lead in leads]
+    return build_lead_delta_backups(leads)
+
+
+def backup_lead_to_backup_table(lead):
+    """Create a backup of a lead in the backup table"""
+    try:
+        db.session.add_all(build_lead_backups([lead]))
         db.session.commit()
         logger.info(f"Backed up lead {lead.username} to backup table")
         return True
@@ -666,312 +1857,843 @@ def backup_lead_to_backup_table(lead):
         return False
 
 
+def reconstruct_lead_version(username, hashtag, version=None):
+    """Rebuild a lead's tracked fields as of a backup version (latest when version is None)"""
+    deltas = LeadBackupDelta.query.filter_by(username=username, hashtag=hashtag).order_by(LeadBackupDelta.version).all()
+    if not deltas:
+        return None
+    if version is not None and version < 1:
+        return None
+    state = LeadBackupDelta.fold(deltas, version)
+    state['version'] = min(version, deltas[-1].version) if version is not None else deltas[-1].version
+    return state
+
+
+def resolve_source_pairs(usernames, keyword):
+    """Prefetch HashtagUsernamePair rows for a batch and pick the best source post per username.
+
+    Preference order matches the old per-lead lookups: exact keyword match, then a hashtag
+    containing the keyword, then any pair recorded for the username.
+    """
+    pairs = HashtagUsernamePair.query.filter(
+        HashtagUsernamePair.username.in_(usernames)
+    ).order_by(HashtagUsernamePair.id).all()
+
+    best = {}
+    for pair in pairs:
+        if pair.hashtag == keyword:
+            rank = 0
+        elif keyword and keyword in pair.hashtag:
+            rank = 1
+        else:
+            rank = 2
+        current = best.get(pair.username)
+        if current is None or rank < current[0]:
+            best[pair.username] = (rank, pair)
+
+    return {username: pair for username, (rank, pair) in best.items()}
+
+
+def apply_lead_data(lead, lead_data, source_pair):
+    """Copy enriched profile fields and source post data onto a Lead"""
+    lead.full_name = lead_data.get('full_name', '')
+    lead.bio = lead_data.get('biography', '')
+    lead.email = lead_data.get('public_email', '')
+    lead.phone = lead_data.get('contact_phone_number', '')
+    lead.website = lead_data.get('external_url', '')
+    lead.followers_count = lead_data.get('follower_count', 0)
+    lead.following_count = lead_data.get('following_count', 0)
+    lead.posts_count = lead_data.get('media_count', 0)
+    lead.is_verified = lead_data.get('is_verified', False)
+    lead.profile_pic_url = lead_data.get('profile_pic_url', '')
+    lead.address_street = lead_data.get('address_street', '')
+    lead.city_name = lead_data.get('city_name', '')
+    lead.zip = lead_data.get('zip', '')
+    lead.latitude = lead_data.get('latitude')
+    lead.longitude = lead_data.get('longitude')
+    lead.is_duplicate = lead_data.get('is_duplicate', False)
+    if 'contact_confidence' in lead_data:
+        lead.contact_confidence = json.dumps(lead_data['contact_confidence'])
+    lead.source_timestamp = source_pair.timestamp if source_pair else None
+    lead.source_post_url = source_pair.post_url if source_pair else None
+    lead.beitragstext = source_pair.beitragstext if source_pair else None
+
+
+def persist_lead_batch(enriched_leads, keyword):
+    """Upsert a batch of enriched leads and their backups in a single transaction.
+
+    Runs a constant number of statements per batch: one SELECT for existing leads,
+    one for source posts, the flushed inserts/updates, the backup inserts and one commit.
+    """
+    # Last occurrence wins if a username appears twice in the batch
+    leads_by_username = {lead_data['username']: lead_data for lead_data in enriched_leads}
+    usernames = list(leads_by_username)
+
+    existing_leads = {
+        lead.username: lead
+        for lead in Lead.query.filter(Lead.hashtag == keyword, Lead.username.in_(usernames)).all()
+    }
+    source_pairs = resolve_source_pairs(usernames, keyword)
+
+    batch_leads = []
+    for username, lead_data in leads_by_username.items():
+        source_pair = source_pairs.get(username)
+        if not source_pair:
+            logger.warning(f"No hashtag pair found for {username} with keyword '{keyword}'")
+
+        lead = existing_leads.get(username)
+        if lead:
+            apply_lead_data(lead, lead_data, source_pair)
+            lead.updated_at = datetime.utcnow()
+        else:
+            lead = Lead(username=username, hashtag=keyword, is_business=lead_data.get('is_business', False))
+            apply_lead_data(lead, lead_data, source_pair)
+            db.session.add(lead)
+        batch_leads.append(lead)
+
+    # Flush to assign ids for new leads, then back up changed leads in the same transaction
+    db.session.flush()
+    db.session.add_all(build_lead_backups(batch_leads))
+    db.session.commit()
+    job_state.publish_leads([lead.to_dict() for lead in batch_leads])
+
+    logger.info(f"Saved batch of {len(batch_leads)} leads ({len(existing_leads)} updated, {len(batch_leads) - len(existing_leads)} new) for keyword '{keyword}'")
+    return len(batch_leads)
+
+
 def save_leads_incrementally(enriched_leads, keyword, default_product_id=None):
-    """Save leads to database incrementally to prevent data loss"""
+    """Save leads to database incrementally to prevent data loss.
+
+    Returns (saved count, usernames that could not be saved).
+    """
     saved_count = 0
+    failed_usernames = []
+    if not enriched_leads:
+        return saved_count, failed_usernames
+
     try:
         with app.app_context():
-            for lead_data in enriched_leads:
-                try:
-                    # Check if lead already exists
-                    existing_lead = Lead.query.filter_by(
-                        username=lead_data['username'],
-                        hashtag=keyword
-                    ).first()
-
-                    # Lookup source post data from HashtagUsernamePair table
-                    # Try exact keyword match first, then try partial matches for hashtag variations
-                    hashtag_pair = HashtagUsernamePair.query.filter_by(
-                        username=lead_data['username'],
-                        hashtag=keyword
-                    ).first()
-                    
-                    if not hashtag_pair:
-                        # Try partial match - look for hashtags that contain the keyword
-                        hashtag_pair = HashtagUsernamePair.query.filter(
-                            HashtagUsernamePair.username == lead_data['username'],
-                            HashtagUsernamePair.hashtag.like(f'%{keyword}%')
-                        ).first()
-                    
-                    if not hashtag_pair:
-                        # Try reverse match - look for keyword that contains the hashtag
-                        hashtag_pair = HashtagUsernamePair.query.filter(
-                            HashtagUsernamePair.username == lead_data['username']
-                        ).first()
-                    
-                    source_timestamp = hashtag_pair.timestamp if hashtag_pair else None
-                    source_post_url = hashtag_pair.post_url if hashtag_pair else None
-                    source_caption = hashtag_pair.beitragstext if hashtag_pair else None
-                    
-                    # Debug logging to track hashtag matching
-                    if hashtag_pair:
-                        logger.info(f"Found hashtag pair for {lead_data['username']}: stored_hashtag='{hashtag_pair.hashtag}' vs search_keyword='{keyword}', timestamp={source_timestamp}, post_url={source_post_url}, caption={source_caption[:50] if source_caption else 'None'}...")
-                    else:
-                        logger.warning(f"No hashtag pair found for {lead_data['username']} with keyword '{keyword}'")
-
-                    if existing_lead:
-                        # Update existing lead
-                        existing_lead.full_name = lead_data.get('full_name', '')
-                        existing_lead.bio = lead_data.get('biography', '')
-                        existing_lead.email = lead_data.get('public_email', '')
-                        existing_lead.phone = lead_data.get('contact_phone_number', '')
-                        existing_lead.website = lead_data.get('external_url', '')
-                        existing_lead.followers_count = lead_data.get('follower_count', 0)
-                        existing_lead.following_count = lead_data.get('following_count', 0)
-                        existing_lead.posts_count = lead_data.get('media_count', 0)
-                        existing_lead.is_verified = lead_data.get('is_verified', False)
-                        existing_lead.profile_pic_url = lead_data.get('profile_pic_url', '')
-                        existing_lead.address_street = lead_data.get('address_street', '')
-                        existing_lead.city_name = lead_data.get('city_name', '')
-                        existing_lead.zip = lead_data.get('zip', '')
-                        existing_lead.latitude = lead_data.get('latitude')
-                        existing_lead.longitude = lead_data.get('longitude')
-                        existing_lead.is_duplicate = lead_data.get('is_duplicate', False)
-                        existing_lead.source_timestamp = source_timestamp
-                        existing_lead.source_post_url = source_post_url
-                        existing_lead.beitragstext = source_caption
-                        existing_lead.updated_at = datetime.utcnow()
-
-                        # Create backup before updating
-                        backup_lead_to_backup_table(existing_lead)
-
-                        current_lead = existing_lead
-                    else:
-                        # Create new lead
-                        new_lead = Lead(
-                            username=lead_data['username'],
-                            hashtag=keyword,
-                            full_name=lead_data.get('full_name', ''),
-                            bio=lead_data.get('biography', ''),
-                            email=lead_data.get('public_email', ''),
-                            phone=lead_data.get('contact_phone_number', ''),
-                            website=lead_data.get('external_url', ''),
-                            followers_count=lead_data.get('follower_count', 0),
-                            following_count=lead_data.get('following_count', 0),
-                            posts_count=lead_data.get('media_count', 0),
-                            is_verified=lead_data.get('is_verified', False),
-                            is_business=lead_data.get('is_business', False),
-                            profile_pic_url=lead_data.get('profile_pic_url', ''),
-                            address_street=lead_data.get('address_street', ''),
-                            city_name=lead_data.get('city_name', ''),
-                            zip=lead_data.get('zip', ''),
-                            latitude=lead_data.get('latitude'),
-                            longitude=lead_data.get('longitude'),
-                            is_duplicate=lead_data.get('is_duplicate', False),
-                            source_timestamp=source_timestamp,
-                            source_post_url=source_post_url,
-                            beitragstext=source_caption
-                        )
-                        db.session.add(new_lead)
-                        current_lead = new_lead
-
-                    # Commit each lead immediately
-                    db.session.commit()
-
-                    # Create backup after successful save
-                    backup_lead_to_backup_table(current_lead)
-
-                    saved_count += 1
-                    logger.info(f"Saved lead {lead_data['username']} to database")
-
-                except Exception as e:
-                    logger.error(f"Failed to save lead {lead_data.get('username', 'unknown')}: {e}")
-                    db.session.rollback()
-                    continue
+            try:
+                saved_count = persist_lead_batch(enriched_leads, keyword)
+            except Exception as e:
+                # Fall back to one transaction per lead so a single bad row doesn't lose the batch
+                logger.error(f"Batch save failed, retrying lead by lead: {e}")
+                db.session.rollback()
+                for lead_data in enriched_leads:
+                    try:
+                        saved_count += persist_lead_batch([lead_data], keyword)
+                    except Exception as e:
+                        logger.error(f"Failed to save lead {lead_data.get('username', 'unknown')}: {e}")
+                        db.session.rollback()
+                        failed_usernames.append(lead_data.get('username', 'unknown'))
+                        continue
 
             logger.info(f"Incremental save completed: {saved_count} leads saved")
 
     except Exception as e:
         logger.error(f"Error during incremental save: {e}")
+        failed_usernames = [lead_data.get('username', 'unknown') for lead_data in enriched_leads]
 
-    return saved_count
+    return saved_count, failed_usernames
 
 
-def call_apify_profile_enrichment(actor_id, input_data, token):
-    """Call Apify profile enrichment actor - returns profile data directly"""
-    # Start tracking this API call
-    usernames = input_data.get('instagram_ids', [])
-    username_count = len(usernames) if isinstance(usernames, list) else 1
+# How long a cached Apify profile payload is reused before the profile is fetched again
+PROFILE_SNAPSHOT_TTL_HOURS = float(os.environ.get('PROFILE_SNAPSHOT_TTL_HOURS', 168))
+
 
-    call_id = None
+def load_profile_snapshots(usernames):
+    """Return {username: Apify profile item} for cached profiles younger than the TTL"""
+    from datetime import timedelta
 
-    client = ApifyClient(token)
+    if not usernames:
+        return {}
+    cutoff = datetime.utcnow() - timedelta(hours=PROFILE_SNAPSHOT_TTL_HOURS)
+    try:
+        with app.app_context():
+            snapshots = ProfileSnapshot.query.filter(
+                ProfileSnapshot.username.in_(list(usernames)),
+                ProfileSnapshot.fetched_at >= cutoff
+            ).all()
+            return {snapshot.username: snapshot.get_payload() for snapshot in snapshots}
+    except Exception as e:
+        logger.error(f"Failed to load profile snapshots: {e}")
+        return {}
 
-    # Add random delay before Apify call to avoid anti-spam measures
-    delay = random.uniform(1, 10)
-    logger.info(f"Anti-spam delay: {delay:.1f}s before Apify profile enrichment...")
-    time.sleep(delay)
 
+def store_profile_snapshots(profile_map):
+    """Insert or refresh cached Apify profile payloads for the given {username: item} map"""
+    if not profile_map:
+        return
     try:
-        # Run the Actor and wait for it to finish
-        run = client.actor(actor_id).call(run_input=input_data)
+        with app.app_context():
+            now = datetime.utcnow()
+            existing = {
+                snapshot.username: snapshot
+                for snapshot in ProfileSnapshot.query.filter(ProfileSnapshot.username.in_(list(profile_map))).all()
+            }
+            for username, item in profile_map.items():
+                payload = json.dumps(item, default=str)
+                snapshot = existing.get(username)
+                if snapshot:
+                    snapshot.payload = payload
+                    snapshot.fetched_at = now
+                else:
+                    db.session.add(ProfileSnapshot(username=username, payload=payload, fetched_at=now))
+            db.session.commit()
+    except Exception as e:
+        logger.error(f"Failed to store profile snapshots: {e}")
+        db.session.rollback()
+
 
-        # Get the dataset
-        dataset = client.dataset(run["defaultDatasetId"])
+def record_profile_cache_stats(hits, misses):
+    """Add profile snapshot cache hits/misses to the current job progress"""
+    job_state.increment_progress('profile_cache_hits', hits)
+    job_state.increment_progress('profile_cache_misses', misses)
+
+
+async def call_apify_profile_enrichment_async(actor_id, input_data, token, job_id=None):
+    """Call the Apify profile enrichment actor and return the profile data it produced"""
+    usernames = input_data.get('instagram_ids', [])
+    username_count = len(usernames) if isinstance(usernames, list) else 1
+
+    client = provider_clients.apify_async_client(token)
+    apify_bucket = pacer.provider('apify')
+    await apify_bucket.acquire()
+
+    try:
+        run = await run_apify_actor(client, actor_id, input_data, job_id)
+        apify_bucket.record_outcome(True)
 
-        # The profile enrichment API returns profiles directly
         profiles = []
-        for item in dataset.iterate_items():
+        async for item in client.dataset(run["defaultDatasetId"]).iterate_items():
             if isinstance(item, dict):
                 profiles.append(item)
 
-        # Log successful completion
-
         logger.info(f"Profile enrichment API returned {len(profiles)} profiles for {username_count} requested usernames")
         return profiles
 
     except Exception as e:
-        # Log the failure
+        # Raised so the caller can tell a failed fetch from profiles that do not exist
         logger.error(f"Profile enrichment API error: {e}")
-        return []
+        apify_bucket.record_outcome(False)
+        raise
 
 
-async def enrich_profile_batch(usernames, ig_sessionid, apify_token,
-                               perplexity_key, semaphore):
-    """Enrich a batch of profiles with concurrent processing"""
-    async with semaphore:
-        try:
-            # Call Apify profile enrichment actor with correct format
-            instagram_urls = [f"https://www.instagram.com/{username}" for username in usernames]
-            input_data = {
-                "instagram_ids": instagram_urls,
-                "SessionID": ig_sessionid,
-                "proxy": {
-                    "useApifyProxy": True,
-                    "groups": ["RESIDENTIAL"],
-                }
-            }
+def show_pacing_countdown(bucket, remaining_seconds):
+    """Show the time until the pacer releases the next batch in the progress display"""
+    progress = job_state.progress()
+    remaining_seconds = int(remaining_seconds + 0.999)
+    minutes_remaining, seconds_remaining = divmod(remaining_seconds, 60)
+    time_display = f"{minutes_remaining}m {seconds_remaining}s" if minutes_remaining else f"{seconds_remaining}s"
+    batch_info = f" bis Batch {progress['current_batch']}/{progress.get('total_batches', 1)}" if 'current_batch' in progress else ''
+    job_state.update_progress(current_step=f'⏸ Anti-Spam Pause: {time_display}{batch_info}',
+                              pacing_wait_seconds=remaining_seconds)
 
-            # Use dedicated profile enrichment function
-            profile_items = call_apify_profile_enrichment("8WEn9FvZnhE7lM3oA",
-                                                          input_data, apify_token)
-            enriched_profiles = []
-
-            # Create a mapping of username to profile data
-            profile_map = {}
-            for item in profile_items:
-                # The API returns username field directly
-                if 'username' in item:
-                    profile_map[item['username']] = item
-                # Also check URL field as fallback
-                elif 'URL' in item:
-                    url = item['URL']
-                    username_from_url = url.rstrip('/').split('/')[-1]
-                    profile_map[username_from_url] = item
-
-            for username in usernames:
-                profile_info = profile_map.get(username, {})
-
-                # Always try to enrich contact info with Perplexity for missing data
-                perplexity_contact = {}
-                # Check if any contact info is missing (not all fields need to be empty)
-                missing_email = not profile_info.get('public_email')
-                missing_phone = not profile_info.get('contact_phone_number') 
-                missing_website = not profile_info.get('external_url')
-
-                if missing_email or missing_phone or missing_website:
-                    try:
-                        # Update progress to show Perplexity enrichment in progress
-                        current_progress = app_data.get('processing_progress', {})
-                        if 'current_batch' in current_progress:
-                            batch_num = current_progress['current_batch']
-                            total_batches = current_progress.get('total_batches', 1)
-                            current_progress['current_step'] = f'2.1 Erweitere Kontaktdaten mit Perplexity für @{username} (Batch {batch_num}/{total_batches})'
-
-                        # Pass full profile info instead of just username
-                        profile_with_username = dict(profile_info)
-                        profile_with_username['username'] = username
-                        # Add existing contact info to the profile for API context
-                        profile_with_username['email'] = profile_info.get('public_email', '')
-                        profile_with_username['phone'] = profile_info.get('contact_phone_number', '')
-                        profile_with_username['website'] = profile_info.get('external_url', '')
-
-                        perplexity_contact = await call_perplexity_api(
-                            profile_with_username, perplexity_key)
-                        logger.info(f"Perplexity enrichment for {username}: {perplexity_contact}")
-                        logger.info(f"Missing fields for {username}: email={missing_email}, phone={missing_phone}, website={missing_website}")
-                    except Exception as e:
-                        logger.error(f"Perplexity API failed for {username}: {e}")
 
-                # Log the profile info we got from Apify for debugging
-                if profile_info:
-                    logger.info(f"Apify profile data for {username}: found with {profile_info.get('follower_count', 0)} followers")
+ENRICHMENT_SECONDS_PER_BATCH = 15  # Typical Apify + Perplexity time for one batch
+
+
+def estimate_enrichment_seconds(ig_sessionid, profile_count, batch_count):
+    """Estimate enrichment time as batch processing plus the pacer's wait for the session's profile budget"""
+    return int(batch_count * ENRICHMENT_SECONDS_PER_BATCH + pacer.instagram_session(ig_sessionid).estimate_wait(profile_count))
+
+
+# Maximum Perplexity lookups in flight at once
+PERPLEXITY_CONCURRENCY = int(os.environ.get('PERPLEXITY_CONCURRENCY', 4))
+
+# Contact details written out in a bio, matched before any paid lookup
+EMAIL_PATTERN = re.compile(r'[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}')
+# International (+49 30 1234567, 0049-...) and German national (030/1234567, 0171 1234567) numbers
+PHONE_PATTERN = re.compile(r'(?<![\w+])(?:(?:\+|00)[1-9]\d{0,2}[\s./-]?(?:\(0\)[\s./-]?)?|0)'
+                           r'\(?\d{2,5}\)?(?:[\s./-]?\d{2,}){1,4}(?!\w)')
+URL_PATTERN = re.compile(r'(?:https?://|www\.)[^\s<>"\'()]+|\b[a-z0-9-]+(?:\.[a-z0-9-]+)*\.(?:de|com|at|ch|net|org|eu|io|shop|info)(?:/[^\s<>"\'()]*)?\b',
+                         re.IGNORECASE)
+
+# Apify actors report business contact fields under different names
+CONTACT_FIELD_ALIASES = {
+    'email': ('public_email', 'business_email', 'businessEmail', 'email', 'contact_email'),
+    'phone': ('contact_phone_number', 'public_phone_number', 'business_phone_number',
+              'businessPhoneNumber', 'phone', 'phone_number'),
+    'website': ('external_url', 'externalUrl', 'website', 'business_website', 'external_lynx_url'),
+}
+
+
+def extract_field_contacts(profile_info):
+    """Read email, phone and website from the Apify profile fields, including their alternate names"""
+    contacts = {}
+    for field, aliases in CONTACT_FIELD_ALIASES.items():
+        value = next((profile_info.get(alias) for alias in aliases
+                      if isinstance(profile_info.get(alias), str) and profile_info.get(alias).strip()), '')
+        contacts[field] = value.strip() if value else ''
+
+    # Country code and number are split in some business profiles
+    country_code = str(profile_info.get('public_phone_country_code') or '').strip()
+    if contacts['phone'] and country_code and not contacts['phone'].startswith(('+', '00', '0')):
+        contacts['phone'] = f"+{country_code.lstrip('+')} {contacts['phone']}"
+    return contacts
+
+
+def extract_bio_contacts(biography):
+    """Find email, phone and website written out in a bio without any API call"""
+    biography = biography or ''
+    contacts = {'email': '', 'phone': '', 'website': ''}
+    match = EMAIL_PATTERN.search(biography)
+    if match:
+        contacts['email'] = match.group(0).rstrip('.')
+    match = PHONE_PATTERN.search(biography)
+    # Require enough digits to rule out dates, years and postcodes
+    if match and len(re.sub(r'\D', '', match.group(0))) >= 7:
+        contacts['phone'] = match.group(0).strip()
+    # Email domains would otherwise match as websites
+    match = URL_PATTERN.search(EMAIL_PATTERN.sub(' ', biography))
+    if match:
+        contacts['website'] = match.group(0).rstrip('.,;:!?')
+    return contacts
+
+
+def is_plausible_contact(field, value):
+    """Check that a resolved value looks like the field it claims to be"""
+    if field == 'email':
+        return bool(EMAIL_PATTERN.fullmatch(value))
+    if field == 'phone':
+        return 7 <= len(re.sub(r'\D', '', value)) <= 15
+    return bool(URL_PATTERN.fullmatch(value.rstrip('/')))
+
+
+# A wanted contact field counts as resolved once its confidence reaches the threshold
+CONTACT_CONFIDENCE_THRESHOLD = float(os.environ.get('CONTACT_CONFIDENCE_THRESHOLD', 0.7))
+# Fields the cascade keeps resolving for; the others are kept when a tier finds them anyway.
+# Narrowing this (e.g. to 'email') saves paid lookups but leaves phone and website to the free tiers.
+CONTACT_WANTED_FIELDS = tuple(field.strip() for field in
+                              os.environ.get('CONTACT_WANTED_FIELDS', 'email,phone,website').split(',')
+                              if field.strip())
+
+
+class ContactResolverCascade:
+    """Contact resolvers ordered from cheap to expensive, each run only while a wanted field is still weak.
+
+    A resolver is an async callable resolve(profile_info, known, fields, api_key) returning {field: value};
+    known holds the values that already meet the threshold and fields the weak ones it should look for.
+    Every value it returns is scored with the resolver's confidence, halved when the value does not look
+    like the field, and kept if it beats the current value for that field.
+    """
+
+    def __init__(self, threshold=CONTACT_CONFIDENCE_THRESHOLD, wanted_fields=CONTACT_WANTED_FIELDS):
+        self.threshold = threshold
+        self.wanted_fields = wanted_fields
+        self._resolvers = []
+
+    def register(self, name, confidence, resolve, paid=False):
+        """Append a resolver; paid resolvers run under the caller's provider semaphore"""
+        self._resolvers.append((name, confidence, resolve, paid))
+
+    def weak_fields(self, contacts, fields=None):
+        """Wanted fields whose confidence is still below the threshold"""
+        return [field for field in (fields or self.wanted_fields)
+                if (contacts.get(field) or {}).get('confidence', 0) < self.threshold]
+
+    def known_values(self, contacts):
+        """Values that meet the threshold, passed to later resolvers as context"""
+        return {field: entry['value'] for field, entry in contacts.items()
+                if entry.get('value') and entry.get('confidence', 0) >= self.threshold}
+
+    async def resolve(self, profile_info, contacts=None, fields=None, api_key=None, paid_semaphore=None,
+                      before_paid=None):
+        """Run resolvers until no wanted field is weak; returns (contacts, [(name, paid, failed)] per resolver run).
+
+        contacts seeds the result with earlier per-field entries, so re-enrichment only pays for weak fields.
+        before_paid() is called right before the first paid resolver runs. A resolver that raises is logged,
+        marked failed and skipped, so callers can retry the profile later.
+        """
+        contacts = {field: dict(entry) for field, entry in (contacts or {}).items()}
+        resolvers_run = []
+        for name, confidence, resolve, paid in self._resolvers:
+            weak = self.weak_fields(contacts, fields)
+            if not weak:
+                break
+            if paid:
+                if not api_key:
+                    continue
+                if before_paid and not any(run_paid for _, run_paid, _ in resolvers_run):
+                    before_paid()
+            failed = False
+            try:
+                if paid and paid_semaphore is not None:
+                    async with paid_semaphore:
+                        found = await resolve(profile_info, self.known_values(contacts), weak, api_key)
                 else:
-                    logger.info(f"Apify profile data for {username}: not found in response")
-
-                # Try multiple possible field names for follower count
-                follower_count = (
-                    profile_info.get('follower_count', 0) or 
-                    profile_info.get('followers_count', 0) or 
-                    profile_info.get('followers', 0) or 
-                    profile_info.get('followerCount', 0) or 0
-                )
+                    found = await resolve(profile_info, self.known_values(contacts), weak, api_key)
+            except Exception as e:
+                logger.error(f"Contact resolver {name} failed for {profile_info.get('username', '')}: {e}")
+                found = {}
+                failed = True
+            resolvers_run.append((name, paid, failed))
+
+            for field, value in (found or {}).items():
+                value = (value or '').strip() if isinstance(value, str) else ''
+                if field not in CONTACT_FIELD_ALIASES or not value:
+                    continue
+                score = confidence if is_plausible_contact(field, value) else confidence / 2
+                if score > (contacts.get(field) or {}).get('confidence', 0):
+                    contacts[field] = {'value': value, 'confidence': round(score, 2), 'source': name}
+        return contacts, resolvers_run
+
+
+async def resolve_apify_fields(profile_info, known, fields, api_key):
+    return extract_field_contacts(profile_info)
+
+
+async def resolve_bio_contacts(profile_info, known, fields, api_key):
+    return extract_bio_contacts(profile_info.get('biography'))
+
+
+def perplexity_context(profile_info, known):
+    """Profile info with only the confident contact values, so Perplexity searches for the rest"""
+    context = {key: value for key, value in profile_info.items() if key not in
+               {alias for aliases in CONTACT_FIELD_ALIASES.values() for alias in aliases}}
+    context['email'] = known.get('email', '')
+    context['phone'] = known.get('phone', '')
+    context['website'] = known.get('website', '')
+    return context
+
+
+def cached_contact_resolver(model):
+    async def resolve(profile_info, known, fields, api_key):
+        cached = await asyncio.to_thread(lookup_cached_contacts, perplexity_context(profile_info, known), model)
+        return cached or {}
+    return resolve
+
+
+def perplexity_contact_resolver(model):
+    async def resolve(profile_info, known, fields, api_key):
+        return await call_perplexity_api(perplexity_context(profile_info, known), api_key, model)
+    return resolve
+
+
+contact_cascade = ContactResolverCascade()
+contact_cascade.register('apify', 0.95, resolve_apify_fields)
+contact_cascade.register('bio', 0.85, resolve_bio_contacts)
+contact_cascade.register(f'cache:{CONTACT_CHEAP_MODEL}', 0.75, cached_contact_resolver(CONTACT_CHEAP_MODEL))
+if CONTACT_DEEP_MODEL:
+    contact_cascade.register(f'cache:{CONTACT_DEEP_MODEL}', 0.9, cached_contact_resolver(CONTACT_DEEP_MODEL))
+contact_cascade.register(CONTACT_CHEAP_MODEL, 0.75, perplexity_contact_resolver(CONTACT_CHEAP_MODEL), paid=True)
+if CONTACT_DEEP_MODEL:
+    contact_cascade.register(CONTACT_DEEP_MODEL, 0.9, perplexity_contact_resolver(CONTACT_DEEP_MODEL), paid=True)
+
+
+def stored_contact_confidence(lead):
+    """Per-field contact entries of a saved lead; values saved before the cascade count as just confident if plausible"""
+    contacts = lead.get_contact_confidence()
+    for field in CONTACT_FIELD_ALIASES:
+        value = getattr(lead, field) or ''
+        if value and (contacts.get(field) or {}).get('value') != value:
+            contacts[field] = {'value': value,
+                               'confidence': CONTACT_CONFIDENCE_THRESHOLD if is_plausible_contact(field, value) else 0.3,
+                               'source': 'stored'}
+    return contacts
+
+
+def record_contact_extraction_stats(fields_found, calls_avoided):
+    """Add locally extracted contact fields and skipped Perplexity calls to the current job progress"""
+    job_state.increment_progress('local_contact_fields', fields_found)
+    job_state.increment_progress('perplexity_calls_avoided', calls_avoided)
+
+
+async def fetch_profile_batch(usernames, ig_sessionid, apify_token, job_id=None):
+    """Fetch profile payloads for a batch, sending only snapshot cache misses to Apify"""
+    # Reuse cached profile payloads and only send cache misses to Apify
+    profile_map = load_profile_snapshots(usernames)
+    missing_usernames = [username for username in usernames if username not in profile_map]
+    record_profile_cache_stats(len(usernames) - len(missing_usernames), len(missing_usernames))
+    logger.info(f"Profile cache: {len(profile_map)} hits, {len(missing_usernames)} misses for batch {usernames}")
+
+    if missing_usernames:
+        # Every uncached profile is fetched through the Instagram session, so pace by profile count
+        session_bucket = pacer.instagram_session(ig_sessionid)
+        await session_bucket.acquire(len(missing_usernames), on_wait=show_pacing_countdown)
+
+        # Call Apify profile enrichment actor with correct format
+        instagram_urls = [f"https://www.instagram.com/{username}" for username in missing_usernames]
+        input_data = {
+            "instagram_ids": instagram_urls,
+            "SessionID": ig_sessionid,
+            "proxy": {
+                "useApifyProxy": True,
+                "groups": ["RESIDENTIAL"],
+            }
+        }
 
-                following_count = (
-                    profile_info.get('following_count', 0) or 
-                    profile_info.get('followings_count', 0) or 
-                    profile_info.get('following', 0) or 
-                    profile_info.get('followingCount', 0) or 0
-                )
+        # Use dedicated profile enrichment function
+        profile_items = await call_apify_profile_enrichment_async("8WEn9FvZnhE7lM3oA",
+                                                                  input_data, apify_token, job_id)
+
+        # Create a mapping of username to profile data
+        fetched_profiles = {}
+        for item in profile_items:
+            # The API returns username field directly
+            if 'username' in item:
+                fetched_profiles[item['username']] = item
+            # Also check URL field as fallback
+            elif 'URL' in item:
+                url = item['URL']
+                username_from_url = url.rstrip('/').split('/')[-1]
+                fetched_profiles[username_from_url] = item
+
+        # An empty result for a non-empty request is how a throttled or blocked session shows up
+        session_bucket.record_outcome(bool(fetched_profiles), blocked=not fetched_profiles)
+
+        store_profile_snapshots(fetched_profiles)
+        profile_map.update(fetched_profiles)
+
+    return profile_map
+
+
+async def resolve_profile_contacts(usernames, profile_map, perplexity_key, perplexity_semaphore):
+    """Resolve contact fields through the resolver cascade and build lead records in username order"""
+    enriched_profiles = []
+
+    async def resolve_contacts(username):
+        """Run the cascade for one profile; paid tiers share the provider semaphore"""
+        profile_info = dict(profile_map.get(username, {}), username=username)
+
+        def show_paid_lookup():
+            # Update progress to show Perplexity enrichment in progress
+            current_progress = job_state.progress()
+            if 'current_batch' in current_progress:
+                batch_num = current_progress['current_batch']
+                total_batches = current_progress.get('total_batches', 1)
+                job_state.update_progress(current_step=f'2.1 Erweitere Kontaktdaten mit Perplexity für @{username} (Batch {batch_num}/{total_batches})')
+
+        contacts, resolvers_run = await contact_cascade.resolve(
+            profile_info, api_key=perplexity_key, paid_semaphore=perplexity_semaphore, before_paid=show_paid_lookup)
+        logger.info(f"Contact cascade for {username}: {[name for name, _, _ in resolvers_run]} -> "
+                    f"{ {field: entry['confidence'] for field, entry in contacts.items()} }")
+        return contacts, resolvers_run
+
+    # Resolve all profiles concurrently - gather keeps results in username order
+    resolved = await asyncio.gather(*(resolve_contacts(username) for username in usernames))
+
+    # Report what the free tiers found beyond the primary Apify fields and the Perplexity calls that saved
+    found_locally = 0
+    calls_avoided = 0
+    for username, (contacts, resolvers_run) in zip(usernames, resolved):
+        profile_info = profile_map.get(username, {})
+        missing_primary = [field for field, aliases in CONTACT_FIELD_ALIASES.items() if not profile_info.get(aliases[0])]
+        filled_locally = {field for field in missing_primary
+                          if (contacts.get(field) or {}).get('source') in ('apify', 'bio')}
+        found_locally += len(filled_locally)
+        # Before the cascade, Perplexity was asked whenever a primary contact field was empty. The call only
+        # counts as avoided when local extraction confidently filled every such wanted field and no paid tier
+        # ran anyway, not when the cache answered or no API key was set
+        needed_fields = [field for field in missing_primary if field in contact_cascade.wanted_fields]
+        paid = any(run_paid for _, run_paid, _ in resolvers_run)
+        if needed_fields and not paid and all(
+                field in filled_locally and not contact_cascade.weak_fields(contacts, [field])
+                for field in needed_fields):
+            calls_avoided += 1
+    record_contact_extraction_stats(found_locally, calls_avoided)
+    if found_locally or calls_avoided:
+        logger.info(f"Contact cascade: {found_locally} fields found locally, {calls_avoided} Perplexity calls avoided")
+
+    resolved_values = [{field: entry['value'] for field, entry in contacts.items()} for contacts, _ in resolved]
+
+    for username, contacts, (contact_confidence, _) in zip(usernames, resolved_values, resolved):
+        profile_info = profile_map.get(username, {})
+
+        # Log the profile info we got from Apify for debugging
+        if profile_info:
+            logger.info(f"Apify profile data for {username}: found with {profile_info.get('follower_count', 0)} followers")
+        else:
+            logger.info(f"Apify profile data for {username}: not found in response")
+
+        # Try multiple possible field names for follower count
+        follower_count = (
+            profile_info.get('follower_count', 0) or 
+            profile_info.get('followers_count', 0) or 
+            profile_info.get('followers', 0) or 
+            profile_info.get('followerCount', 0) or 0
+        )
 
-                media_count = (
-                    profile_info.get('media_count', 0) or 
-                    profile_info.get('posts_count', 0) or 
-                    profile_info.get('posts', 0) or 
-                    profile_info.get('postsCount', 0) or 0
-                )
+        following_count = (
+            profile_info.get('following_count', 0) or 
+            profile_info.get('followings_count', 0) or 
+            profile_info.get('following', 0) or 
+            profile_info.get('followingCount', 0) or 0
+        )
+
+        media_count = (
+            profile_info.get('media_count', 0) or 
+            profile_info.get('posts_count', 0) or 
+            profile_info.get('posts', 0) or 
+            profile_info.get('postsCount', 0) or 0
+        )
+
+        # Log what we found for debugging
+        logger.info(f"Follower count mapping for {username}: follower_count={follower_count}, following_count={following_count}, media_count={media_count}")
+
+        enriched_profiles.append({
+            'username':
+            username,
+            'full_name':
+            profile_info.get('full_name', ''),
+            'biography':
+            profile_info.get('biography', ''),
+            'public_email':
+            contacts.get('email', ''),
+            'contact_phone_number':
+            contacts.get('phone', ''),
+            'external_url':
+            contacts.get('website', ''),
+            'follower_count':
+            follower_count,
+            'following_count':
+            following_count,
+            'media_count':
+            media_count,
+            'is_verified':
+            profile_info.get('is_verified', False),
+            'profile_pic_url':
+            profile_info.get('profile_pic_url', ''),
+            'address_street':
+            profile_info.get('address_street', ''),
+            'city_name':
+            profile_info.get('city_name', ''),
+            'zip':
+            profile_info.get('zip', ''),
+            'latitude':
+            profile_info.get('latitude'),
+            'longitude':
+            profile_info.get('longitude'),
+            'contact_confidence':
+            contact_confidence,
+            'subject':
+            '',
+            'emailBody':
+            '',
+            'sent':
+            False,
+            'sentAt':
+            None
+        })
+
+    return enriched_profiles
+
+
+def load_enrichment_checkpoint(job_id):
+    """Return (session id, batch plan, completed batch indices) recorded for a job, or None"""
+    if not job_id:
+        return None
+    with app.app_context():
+        processing_session = ProcessingSession.query.filter_by(job_id=job_id).first()
+        if not processing_session or processing_session.batch_plan is None:
+            return None
+        return (processing_session.id, processing_session.get_batch_plan(),
+                processing_session.get_completed_batches())
+
+
+def create_enrichment_checkpoint(job_id, keyword, batches):
+    """Record the planned batches of an enrichment job in ProcessingSession and return its id"""
+    try:
+        with app.app_context():
+            processing_session = ProcessingSession(
+                job_id=job_id,
+                keyword=keyword or '',
+                status='processing',
+                batch_plan=json.dumps(batches),
+                completed_batches=json.dumps([])
+            )
+            db.session.add(processing_session)
+            db.session.commit()
+            return processing_session.id
+    except Exception as e:
+        # Without a checkpoint the run still works, it just cannot resume
+        logger.error(f"Failed to create enrichment checkpoint for job {job_id}: {e}")
+        db.session.rollback()
+        return None
+
+
+def complete_enrichment_batch(checkpoint_id, index, saved_count):
+    """Mark a batch as saved; replaying it after a crash is harmless because lead saves are upserts"""
+    try:
+        with app.app_context():
+            processing_session = ProcessingSession.query.get(checkpoint_id)
+            completed_batches = processing_session.get_completed_batches()
+            if index in completed_batches:
+                return
+            completed_batches.add(index)
+            processing_session.completed_batches = json.dumps(sorted(completed_batches))
+            processing_session.leads_found = (processing_session.leads_found or 0) + saved_count
+            db.session.commit()
+    except Exception as e:
+        logger.error(f"Failed to checkpoint batch {index + 1}: {e}")
+        db.session.rollback()
+
+
+def finish_enrichment_checkpoint(checkpoint_id):
+    """Mark an enrichment run as completed and return the leads saved across all of its attempts"""
+    try:
+        with app.app_context():
+            processing_session = ProcessingSession.query.get(checkpoint_id)
+            processing_session.status = 'completed'
+            processing_session.completed_at = datetime.utcnow()
+            db.session.commit()
+            return processing_session.leads_found or 0
+    except Exception as e:
+        logger.error(f"Failed to finish enrichment checkpoint {checkpoint_id}: {e}")
+        db.session.rollback()
+        return None
+
+
+# Optional post-enrichment stage: queue low-priority drafting for saved leads with an email and no draft yet.
+# Drafts run on a free job worker (JOB_WORKER_THREADS >= 2) while enrichment waits out its anti-spam pauses.
+# Pre-draft batches are merged into one queued job and background jobs run one at a time, so
+# PREDRAFT_CONCURRENCY bounds the leads pre-drafted at once across all workers.
+PREDRAFT_ENABLED = os.environ.get('PREDRAFT_ENABLED', 'false').lower() == 'true'
+PREDRAFT_CONCURRENCY = int(os.environ.get('PREDRAFT_CONCURRENCY', 2))
+PREDRAFT_MAX_LEADS = int(os.environ.get('PREDRAFT_MAX_LEADS', 200))  # Spend cap: leads pre-drafted per enrichment run
+PREDRAFT_JOB_PRIORITY = -10
+
+
+def queue_predrafts(usernames, keyword, limit):
+    """Queue low-priority drafting for saved leads that have an email but no draft; returns leads queued.
+
+    Leads are added to the user's pre-draft job still waiting in the queue, if there is one, so an enrichment
+    run leaves a single pre-draft job behind instead of one per batch.
+    """
+    from sqlalchemy import or_
+
+    user_id = job_state.user_id()
+    with app.app_context():
+        lead_ids = [row.id for row in db.session.query(Lead.id).filter(
+            Lead.hashtag == keyword,
+            Lead.username.in_(usernames),
+            Lead.email.isnot(None), Lead.email != '',
+            or_(Lead.subject.is_(None), Lead.subject == ''),
+            or_(Lead.email_body.is_(None), Lead.email_body == '')
+        ).order_by(Lead.id).limit(limit)]
+        if not lead_ids:
+            return 0
+
+        # The row lock keeps a worker from claiming the job while its lead list grows; a claimed job is left alone
+        pending = (Job.query.filter_by(job_type='drafting', status='queued', priority=PREDRAFT_JOB_PRIORITY,
+                                       user_id=user_id)
+                   .order_by(Job.id)
+                   .with_for_update()
+                   .first())
+        if pending is not None:
+            payload = pending.get_payload()
+            payload['lead_ids'] = sorted(set(payload.get('lead_ids') or []) | set(lead_ids))
+            pending.payload = json.dumps(payload, default=str)
+            db.session.commit()
+            logger.info(f"Added {len(lead_ids)} leads to pre-draft job {pending.id}")
+            return len(lead_ids)
+        db.session.commit()
+
+    job_queue.enqueue('drafting', {
+        'lead_ids': lead_ids,
+        'only_missing': True,
+        'with_email': True,
+        'concurrency': PREDRAFT_CONCURRENCY
+    }, user_id=user_id, priority=PREDRAFT_JOB_PRIORITY)
+    return len(lead_ids)
+
+
+# Batches allowed to wait between pipeline stages; keeps memory bounded while letting stages overlap
+ENRICHMENT_PIPELINE_QUEUE_SIZE = int(os.environ.get('ENRICHMENT_PIPELINE_QUEUE_SIZE', 2))
+
+
+async def run_enrichment_pipeline(batches, ig_sessionid, apify_token, perplexity_key, keyword,
+                                  prepare_leads, on_batch_done, default_product_id=None, skip_batches=()):
+    """Run profile fetch, contact enrichment and persist as concurrent stages joined by bounded queues.
+
+    prepare_leads(leads) annotates a batch before it is saved and on_batch_done(index, saved_count, total_saved)
+    is called after each batch is fully fetched and persisted. Batch indices in skip_batches (already saved by an
+    earlier attempt) are not fetched again. A stage that fails a batch passes None in place of its data, so the
+    batch is not reported as done and a resumed run retries it. Returns (leads saved by this call, failed batch
+    indices).
+    """
+    fetched_queue = asyncio.Queue(maxsize=ENRICHMENT_PIPELINE_QUEUE_SIZE)
+    resolved_queue = asyncio.Queue(maxsize=ENRICHMENT_PIPELINE_QUEUE_SIZE)
+    perplexity_semaphore = asyncio.Semaphore(PERPLEXITY_CONCURRENCY)
+    total_saved = 0
+    failed_batches = []
+    predraft_budget = PREDRAFT_MAX_LEADS if PREDRAFT_ENABLED else 0
+
+    async def fetch_stage():
+        try:
+            for index, batch in enumerate(batches):
+                if index in skip_batches:
+                    continue
+                if job_state.stop_requested():
+                    logger.info(f"Processing stopped by user before fetching batch {index+1}")
+                    break
+                job_state.update_progress(current_batch=index + 1, total_batches=len(batches))
+                try:
+                    profile_map = await fetch_profile_batch(batch, ig_sessionid, apify_token,
+                                                            job_id=f'enrichment:{keyword}')
+                except Exception as e:
+                    logger.error(f"Batch {index+1} profile fetch error: {e}")
+                    profile_map = None
+                await fetched_queue.put((index, batch, profile_map))
+        finally:
+            await fetched_queue.put(None)
+
+    async def contact_stage():
+        try:
+            while True:
+                item = await fetched_queue.get()
+                if item is None:
+                    break
+                index, batch, profile_map = item
+                leads = None
+                if profile_map is not None:
+                    try:
+                        leads = await resolve_profile_contacts(batch, profile_map, perplexity_key,
+                                                               perplexity_semaphore)
+                    except Exception as e:
+                        logger.error(f"Batch {index+1} contact enrichment error: {e}")
+                await resolved_queue.put((index, leads))
+        finally:
+            await resolved_queue.put(None)
 
-                # Log what we found for debugging
-                logger.info(f"Follower count mapping for {username}: follower_count={follower_count}, following_count={following_count}, media_count={media_count}")
-
-                enriched_profiles.append({
-                    'username':
-                    username,
-                    'full_name':
-                    profile_info.get('full_name', ''),
-                    'biography':
-                    profile_info.get('biography', ''),
-                    'public_email':
-                    profile_info.get('public_email', '') or perplexity_contact.get('email', ''),
-                    'contact_phone_number':
-                    profile_info.get('contact_phone_number', '') or perplexity_contact.get('phone', ''),
-                    'external_url':
-                    profile_info.get('external_url', '') or perplexity_contact.get('website', ''),
-                    'follower_count':
-                    follower_count,
-                    'following_count':
-                    following_count,
-                    'media_count':
-                    media_count,
-                    'is_verified':
-                    profile_info.get('is_verified', False),
-                    'profile_pic_url':
-                    profile_info.get('profile_pic_url', ''),
-                    'address_street':
-                    profile_info.get('address_street', ''),
-                    'city_name':
-                    profile_info.get('city_name', ''),
-                    'zip':
-                    profile_info.get('zip', ''),
-                    'latitude':
-                    profile_info.get('latitude'),
-                    'longitude':
-                    profile_info.get('longitude'),
-                    'subject':
-                    '',
-                    'emailBody':
-                    '',
-                    'sent':
-                    False,
-                    'sentAt':
-                    None
-                })
-
-            return enriched_profiles
+    async def persist_stage():
+        nonlocal total_saved, predraft_budget
+        while True:
+            item = await resolved_queue.get()
+            if item is None:
+                break
+            index, leads = item
+            if leads is None:
+                failed_batches.append(index)
+                continue
+            saved_count = 0
+            try:
+                if leads:
+                    prepare_leads(leads)
+                    # Database work runs in a thread so fetch and contact stages keep going meanwhile
+                    saved_count, failed_usernames = await asyncio.to_thread(save_leads_incrementally, leads,
+                                                                            keyword, default_product_id)
+                    total_saved += saved_count
+                    logger.info(f"Batch {index+1}: Saved {saved_count} leads")
+                    if failed_usernames:
+                        logger.error(f"Batch {index+1}: Could not save {failed_usernames}, leaving it for a retry")
+                        failed_batches.append(index)
+                        continue
+                    if saved_count and predraft_budget > 0:
+                        queued = await asyncio.to_thread(queue_predrafts, [lead['username'] for lead in leads],
+                                                         keyword, predraft_budget)
+                        predraft_budget -= queued
+                        if queued:
+                            logger.info(f"Batch {index+1}: Queued {queued} leads for pre-drafting")
+                else:
+                    logger.warning(f"Batch {index+1}: No results to save")
+                on_batch_done(index, saved_count, total_saved)
+            except Exception as e:
+                logger.error(f"Batch {index+1} persist error: {e}")
+                failed_batches.append(index)
 
-        except Exception as e:
-            logger.error(f"Failed to enrich profiles {usernames}: {e}")
-            return []
+    await asyncio.gather(fetch_stage(), contact_stage(), persist_stage())
+    return total_saved, sorted(failed_batches)
 
 
 @app.route('/login', methods=['GET', 'POST'])
@@ -1183,7 +2905,7 @@ def index():
     return render_template('index.html',
                            ig_sessionid=ig_sessionid,
                            leads=leads_dict,
-                           processing_status=app_data['processing_status'],
+                           processing_status=current_processing_status(),
                            email_templates=templates,
                            products=products_dict,
                            default_product_id=default_product_id)
@@ -1195,11 +2917,50 @@ def ping():
     return {"status": "OK"}, 200
 
 
+def current_processing_status():
+    """'Processing...' while the user's latest job is queued or running, else None"""
+    try:
+        job_id = job_state.latest_job_id(session.get('user_id'))
+        job = Job.query.get(job_id) if job_id else None
+        return 'Processing...' if job and job.status in ('queued', 'running') else None
+    except Exception as e:
+        logger.error(f"Failed to read processing status: {e}")
+        return None
+
+
+def user_job_id(job_type=None):
+    """Job ID from the request, or the current user's latest job; None if it belongs to another user"""
+    job_id = request.args.get('job_id', type=int) or (request.get_json(silent=True) or {}).get('job_id')
+    if not job_id:
+        return job_state.latest_job_id(session.get('user_id'), job_type)
+    job = Job.query.get(job_id)
+    if not job or (job.user_id and job.user_id != session.get('user_id')):
+        return None
+    if job_type and job.job_type != job_type:
+        return None
+    return job.id
+
+
+def load_discovery(job_id):
+    """Keyword, product and hashtag variants of a finished discovery job, from memory or the Job table"""
+    discovery = job_state.get_state('discovery', job_id=job_id)
+    if discovery:
+        return discovery
+    job = Job.query.get(job_id) if job_id else None
+    if not job or job.job_type != 'discovery' or job.status != 'completed':
+        return None
+    result = job.get_result() or {}
+    return dict(job.get_payload(), hashtag_variants=result.get('hashtag_variants', []))
+
+
 @app.route('/progress')
 @login_required
 def get_progress():
-    """Get current processing progress"""
-    return jsonify(app_data['processing_progress'])
+    """Get processing progress of a job (?job_id=), defaulting to the user's latest job"""
+    job_id = user_job_id()
+    if not job_id:
+        return jsonify(dict(EMPTY_PROGRESS))
+    return jsonify(dict(job_state.progress(job_id), job_id=job_id))
 
 
 @app.route('/api/leads')
@@ -1224,6 +2985,41 @@ def get_leads_by_keyword():
         return jsonify({"leads": [], "success": False, "error": "Database connection error"}), 500
 
 
+@app.route('/api/leads/<username>/history')
+@login_required
+def get_lead_history(username):
+    """Get the backup version list for a lead and its reconstructed state at a version"""
+    hashtag = request.args.get('hashtag', '').strip()
+    version = request.args.get('version', type=int)
+
+    try:
+        if not hashtag:
+            lead = Lead.query.filter_by(username=username).first()
+            if not lead:
+                return {"error": "Lead not found"}, 404
+            hashtag = lead.hashtag
+
+        deltas = LeadBackupDelta.query.filter_by(username=username, hashtag=hashtag).order_by(LeadBackupDelta.version).all()
+        if not deltas:
+            return {"error": "No backup history for this lead"}, 404
+
+        return jsonify({
+            "success": True,
+            "username": username,
+            "hashtag": hashtag,
+            "versions": [{
+                'version': delta.version,
+                'changed_fields': sorted(json.loads(delta.changes)),
+                'backup_created_at': delta.backup_created_at.isoformat() if delta.backup_created_at else None
+            } for delta in deltas],
+            "state": reconstruct_lead_version(username, hashtag, version)
+        })
+
+    except Exception as e:
+        logger.error(f"Failed to get lead history for {username}: {e}")
+        return {"error": "Failed to get lead history"}, 500
+
+
 @app.route('/api-metrics')
 @login_required
 def get_api_metrics():
@@ -1238,8 +3034,12 @@ def get_api_metrics():
             "system_info": {
                 "log_file_exists": os.path.exists('api_debug.log'),
                 "current_time": datetime.utcnow().isoformat(),
-                "uptime_minutes": int((time.time() - app_data.get('start_time', time.time())) / 60)
-            }
+                "uptime_minutes": int((time.time() - APP_START_TIME) / 60)
+            },
+            "http_pools": provider_clients.stats(),
+            "pacing": pacer.stats(),
+            "drafting": draft_stats.stats(),
+            "event_streams": {"open": stream_slots.open_count(), "limit": stream_slots.limit, "pid": os.getpid()}
         })
 
         return jsonify(metrics_summary)
@@ -1295,6 +3095,24 @@ def get_api_health():
         }), 500
 
 
+@app.route('/apify/webhook', methods=['POST'])
+def apify_webhook():
+    """Receive Apify run-finished webhooks and wake the job waiting on that run"""
+    if APIFY_WEBHOOK_SECRET and not hmac.compare_digest(request.args.get('secret', ''), APIFY_WEBHOOK_SECRET):
+        return jsonify({'error': 'Invalid webhook secret'}), 403
+
+    payload = request.get_json(silent=True) or {}
+    resource = payload.get('resource') if isinstance(payload.get('resource'), dict) else {}
+    run_id = resource.get('id') or (payload.get('eventData') or {}).get('actorRunId')
+    if not run_id:
+        return jsonify({'error': 'Missing run ID'}), 400
+
+    logger.info(f"Apify webhook {payload.get('eventType')} for run {run_id}")
+    # The waiting job re-reads and records the run from the API, so the payload is only a wake-up signal
+    apify_runs.notify(run_id)
+    return jsonify({'success': True})
+
+
 @app.route('/debug-logs')
 @login_required
 def get_debug_logs():
@@ -1362,11 +3180,11 @@ def process_keyword():
     if not keyword:
         return {"error": "Keyword is required"}, 400
 
-    # Validate search limit - further reduced maximum to prevent memory issues
+    # Validate search limit - discovery memory is bounded by DiscoveryBuffer
     try:
         search_limit = int(search_limit)
-        if search_limit < 1 or search_limit > 50:  # Reduced from 100 to 50 for memory safety
-            return {"error": "Search limit must be between 1 and 50"}, 400
+        if search_limit < 1 or search_limit > DISCOVERY_MAX_SEARCH_LIMIT:
+            return {"error": f"Search limit must be between 1 and {DISCOVERY_MAX_SEARCH_LIMIT}"}, 400
     except (ValueError, TypeError):
         return {"error": "Invalid search limit value"}, 400
 
@@ -1378,54 +3196,173 @@ def process_keyword():
     # Get default product ID from session before starting background processing
     default_product_id = session.get('default_product_id')
 
-    # Start processing in background using ThreadPoolExecutor
-    app_data['processing_status'] = 'Processing...'
-    app_data['stop_requested'] = False  # Reset stop flag
+    # Discovery runs on a job worker; the client polls /api/jobs/<job_id> for the hashtag variants
+    job_id = job_queue.enqueue('discovery', {
+        'keyword': keyword,
+        'ig_sessionid': ig_sessionid,
+        'search_limit': search_limit,
+        'default_product_id': default_product_id
+    }, user_id=session.get('user_id'))
 
-    try:
-        # Run hashtag discovery only - no enrichment yet
-        with ThreadPoolExecutor(max_workers=1) as executor:
-            future = executor.submit(discover_hashtags_sync, keyword, ig_sessionid, search_limit)
-            try:
-                hashtag_variants = future.result(timeout=180)  # Reduced to 3 minutes
-            except TimeoutError:
-                logger.error("Hashtag discovery timed out after 3 minutes")
-                app_data['processing_status'] = None
-                return {"error": "Hashtag discovery timed out. Please try with a smaller search limit."}, 408
-
-        # Store hashtag variants in app_data for later enrichment
-        app_data['hashtag_variants'] = hashtag_variants
-        app_data['keyword'] = keyword
-        app_data['ig_sessionid'] = ig_sessionid
-        app_data['search_limit'] = search_limit
-        app_data['default_product_id'] = default_product_id
-        app_data['processing_status'] = 'hashtag_selection'  # New status
-        
-        return {"success": True, "phase": "hashtag_selection", "hashtag_variants": hashtag_variants}
+    return {"success": True, "job_id": job_id, "phase": "hashtag_search"}, 202
 
-    except Exception as e:
-        logger.error(f"Processing failed: {e}")
-        app_data['processing_status'] = None
 
-        # Get any partial results from database before failing
-        try:
-            with app.app_context():
-                partial_leads = Lead.query.filter_by(hashtag=keyword).order_by(Lead.created_at.desc()).all()
-                partial_count = len(partial_leads)
-                if partial_count > 0:
-                    # Return partial results with error information
-                    return {
-                        "error": str(e), 
-                        "partial_success": True,
-                        "leads": [lead.to_dict() for lead in partial_leads],
-                        "partial_count": partial_count
-                    }, 206  # Partial Content status
-                else:
-                    return {"error": str(e)}, 500
-        except Exception as db_error:
-            logger.error(f"Failed to query partial leads: {db_error}")
-            return {"error": str(e)}, 500
+@app.route('/api/jobs/<int:job_id>', methods=['GET'])
+@login_required
+def get_job(job_id):
+    """Get status and result of a background job"""
+    job = Job.query.get(job_id)
+    if not job or (job.user_id and job.user_id != session.get('user_id')):
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job.to_dict())
+
+
+# Seconds between keep-alive comments, and between DB polls for jobs running in another process
+JOB_EVENT_KEEPALIVE_SECONDS = 15
+JOB_EVENT_DB_POLL_SECONDS = float(os.environ.get('JOB_EVENT_DB_POLL_SECONDS', 2))
+# An open event stream pins one gunicorn thread for its lifetime (a draft stream also runs two OpenAI
+# reader threads), so streams are capped per process below gunicorn's `threads` to leave room for requests
+SSE_MAX_STREAMS = int(os.environ.get('SSE_MAX_STREAMS', 12))
+SSE_RETRY_AFTER_SECONDS = 5
+
+
+class StreamSlots:
+    """Counts the event streams open in this process and refuses new ones above a limit"""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self._lock = threading.Lock()
+        self._open = 0
+
+    def acquire(self):
+        with self._lock:
+            if self._open >= self.limit:
+                return False
+            self._open += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self._open = max(0, self._open - 1)
+
+    def open_count(self):
+        with self._lock:
+            return self._open
+
+
+stream_slots = StreamSlots(SSE_MAX_STREAMS)
+
+
+def event_stream_response(stream):
+    """Serve an SSE generator, or a 503 when this process already has SSE_MAX_STREAMS open"""
+    if not stream_slots.acquire():
+        stream.close()
+        logger.warning(f"Refused event stream: {stream_slots.limit} streams already open in process {os.getpid()}")
+        response = jsonify({"error": "Too many open event streams, poll instead"})
+        response.status_code = 503
+        response.headers['Retry-After'] = str(SSE_RETRY_AFTER_SECONDS)
+        return response
+
+    response = app.response_class(stream_with_context(stream), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # Keep reverse proxies from buffering the stream
+    # Runs when the server closes the response, whether the stream finished or the client went away
+    response.call_on_close(stream_slots.release)
+    return response
+
+
+def format_sse(name, data, event_id=None):
+    """Encode one Server-Sent Events message"""
+    message = f"id: {event_id}\n" if event_id is not None else ''
+    return message + f"event: {name}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+def job_event_stream(job_id, last_event_id):
+    """Yield SSE messages for a job: a progress snapshot, then progress deltas, saved leads and a final 'done'.
+
+    Jobs run by this process are followed through the in-memory event log; jobs run elsewhere are
+    followed by polling their persisted progress and the leads saved for their keyword.
+    """
+    local = job_state.snapshot(job_id)
+    if local and last_event_id is not None and last_event_id <= local[0]:
+        seq = last_event_id  # Reconnect: replay what the client missed
+    elif local:
+        seq, progress = local
+        yield format_sse('snapshot', progress, seq)
+    else:
+        seq = None
+
+    sent_progress = {}
+    leads_since = datetime.utcnow()
+    last_sent = time.monotonic()
+    while True:
+        if seq is not None:
+            waited = job_state.wait_events(job_id, seq, JOB_EVENT_KEEPALIVE_SECONDS)
+            if waited is not None:
+                events, gap = waited
+                if gap:
+                    yield format_sse('snapshot', job_state.progress(job_id), seq)
+                for seq, name, data in events:
+                    if name == 'done':
+                        job = Job.query.get(job_id)
+                        db.session.commit()
+                        yield format_sse('done', job.to_dict() if job else {}, seq)
+                        return
+                    yield format_sse(name, data, seq)
+                if not events:
+                    yield ': keepalive\n\n'
+                continue
+
+        # Job is queued or running in another process: follow the Job table
+        job = Job.query.get(job_id)
+        if job is None:
+            return
+        progress = job.get_progress()
+        changed = {key: value for key, value in progress.items() if sent_progress.get(key) != value}
+        if changed:
+            yield format_sse('progress' if sent_progress else 'snapshot', changed if sent_progress else progress)
+            sent_progress = progress
+            last_sent = time.monotonic()
+
+        keyword = job.get_payload().get('keyword')
+        if keyword:
+            saved_leads = (Lead.query.filter(Lead.hashtag == keyword, Lead.updated_at > leads_since)
+                           .order_by(Lead.updated_at).limit(500).all())
+            if saved_leads:
+                leads_since = saved_leads[-1].updated_at
+                yield format_sse('leads', [lead.to_dict() for lead in saved_leads])
+                last_sent = time.monotonic()
+
+        if job.status in ('completed', 'failed'):
+            job_dict = job.to_dict()
+            db.session.commit()
+            yield format_sse('done', job_dict)
+            return
+        db.session.commit()  # End the read transaction so the next poll sees fresh rows
 
+        if time.monotonic() - last_sent >= JOB_EVENT_KEEPALIVE_SECONDS:
+            yield ': keepalive\n\n'
+            last_sent = time.monotonic()
+        time.sleep(JOB_EVENT_DB_POLL_SECONDS)
+
+        # The job may have been claimed by this process in the meantime
+        local = job_state.snapshot(job_id)
+        if local:
+            seq, progress = local
+            yield format_sse('snapshot', progress, seq)
+
+
+@app.route('/api/jobs/<int:job_id>/events')
+@login_required
+def job_events(job_id):
+    """Server-Sent Events stream of a job's progress and newly saved leads"""
+    job = Job.query.get(job_id)
+    if not job or (job.user_id and job.user_id != session.get('user_id')):
+        return jsonify({"error": "Job not found"}), 404
+    db.session.commit()
+
+    last_event_id = request.headers.get('Last-Event-ID', type=int)
+    return event_stream_response(job_event_stream(job_id, last_event_id))
 
 
 @app.route('/emergency-restart', methods=['POST'])
@@ -1447,7 +3384,6 @@ def emergency_restart():
             time.sleep(0.1)  # Give time for response to be sent
             os._exit(1)  # Force exit - Gunicorn will restart the worker
         
-        import threading
         restart_thread = threading.Thread(target=restart_server)
         restart_thread.daemon = True
         restart_thread.start()
@@ -1464,7 +3400,8 @@ def emergency_restart():
 def get_hashtag_variants():
     """Get discovered hashtag variants"""
     try:
-        variants = app_data.get('hashtag_variants', [])
+        discovery = load_discovery(user_job_id('discovery')) or {}
+        variants = discovery.get('hashtag_variants', [])
         if not variants:
             return jsonify({"error": "No hashtag variants found"}), 404
         
@@ -1479,7 +3416,7 @@ def get_hashtag_variants():
         return jsonify({
             'success': True,
             'hashtag_variants': simplified_variants,
-            'keyword': app_data.get('keyword', '')
+            'keyword': discovery.get('keyword', '')
         })
     except Exception as e:
         logger.error(f"Failed to get hashtag variants: {e}")
@@ -1497,16 +3434,20 @@ def continue_enrichment():
         if not selected_hashtags:
             return jsonify({"error": "No hashtags selected"}), 400
         
-        # Get stored data
-        hashtag_variants = app_data.get('hashtag_variants', [])
-        keyword = app_data.get('keyword', '')
-        ig_sessionid = app_data.get('ig_sessionid', '')
-        search_limit = app_data.get('search_limit', 100)
-        default_product_id = app_data.get('default_product_id')
+        # Hashtag variants come from the given discovery job, or the user's latest one
+        discovery = load_discovery(user_job_id('discovery')) or {}
+        hashtag_variants = discovery.get('hashtag_variants', [])
+        keyword = discovery.get('keyword', '')
+        default_product_id = discovery.get('default_product_id')
         
         if not hashtag_variants:
             return jsonify({"error": "No hashtag data found. Please run hashtag search first."}), 400
         
+        # Finished jobs no longer carry the session cookie, so it is resolved from this request like in /process
+        ig_sessionid = session.get('ig_sessionid') or os.environ.get('IG_SESSIONID')
+        if not ig_sessionid:
+            return jsonify({"error": "Instagram Session ID not found. Please provide your Instagram session ID first."}), 400
+        
         # Filter to only selected hashtags
         selected_profiles = []
         for variant in hashtag_variants:
@@ -1520,26 +3461,18 @@ def continue_enrichment():
         
         logger.info(f"Selected {len(selected_profiles)} profiles from {len(selected_hashtags)} hashtags")
         
-        # Reset processing status
-        app_data['processing_status'] = 'Processing...'
-        app_data['stop_requested'] = False
-        
-        # Start enrichment in background
-        with ThreadPoolExecutor(max_workers=1) as executor:
-            future = executor.submit(run_enrichment_process, selected_profiles, ig_sessionid, default_product_id)
-            try:
-                result = future.result(timeout=7200)  # 2 hours for enrichment
-            except TimeoutError:
-                logger.error("Enrichment timed out after 2 hours")
-                app_data['processing_status'] = None
-                return {"error": "Enrichment timed out."}, 408
+        # Enrichment runs on a job worker; the client polls /api/jobs/<job_id> until it completes
+        job_id = job_queue.enqueue('enrichment', {
+            'selected_profiles': selected_profiles,
+            'ig_sessionid': ig_sessionid,
+            'default_product_id': default_product_id,
+            'keyword': keyword
+        }, user_id=session.get('user_id'))
         
-        app_data['processing_status'] = None
-        return {"success": True, "leads": result}
+        return {"success": True, "job_id": job_id, "phase": "profile_enrichment"}, 202
         
     except Exception as e:
         logger.error(f"Failed to continue enrichment: {e}")
-        app_data['processing_status'] = None
         return jsonify({"error": str(e)}), 500
 
 
@@ -1552,607 +3485,243 @@ def discover_hashtags_sync(keyword, ig_sessionid, search_limit):
             return loop.run_until_complete(
                 discover_hashtags_async(keyword, ig_sessionid, search_limit))
         finally:
+            loop.run_until_complete(provider_clients.aclose_loop())
             loop.close()
     except Exception as e:
         logger.error(f"Hashtag discovery failed: {e}")
         raise
 
 
-def run_enrichment_process(selected_profiles, ig_sessionid, default_product_id=None):
+def run_enrichment_process(selected_profiles, ig_sessionid, default_product_id=None, keyword='', job_id=None):
     """Run enrichment process for selected profiles"""
     try:
         loop = asyncio.new_event_loop()
         asyncio.set_event_loop(loop)
         try:
             return loop.run_until_complete(
-                enrich_selected_profiles_async(selected_profiles, ig_sessionid, default_product_id))
+                enrich_selected_profiles_async(selected_profiles, ig_sessionid, default_product_id, keyword, job_id))
         finally:
+            loop.run_until_complete(provider_clients.aclose_loop())
             loop.close()
     except Exception as e:
         logger.error(f"Enrichment process failed: {e}")
         raise
 
 
-def run_async_process(keyword, ig_sessionid, search_limit, default_product_id=None):
-    """Run async processing in a separate thread"""
-    try:
-        # Create new event loop for this thread
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        try:
-            return loop.run_until_complete(
-                process_keyword_async(keyword, ig_sessionid, search_limit, default_product_id))
-        finally:
-            loop.close()
-    except Exception as e:
-        logger.error(f"Async processing failed: {e}")
-        raise
-
-
-async def enrich_selected_profiles_async(selected_profiles, ig_sessionid, default_product_id=None):
-    """Enrich selected profiles only"""
-    apify_token = os.environ.get('APIFY_TOKEN')
-    perplexity_key = os.environ.get('PERPLEXITY_API_KEY')
-    
-    if not all([apify_token, perplexity_key]) or not apify_token.strip() or not perplexity_key.strip():
-        missing_keys = []
-        if not apify_token or not apify_token.strip():
-            missing_keys.append('APIFY_TOKEN')
-        if not perplexity_key or not perplexity_key.strip():
-            missing_keys.append('PERPLEXITY_API_KEY')
-        raise ValueError(f"Missing or empty API tokens: {', '.join(missing_keys)}")
-    
-    # Initialize progress tracking
-    start_time = time.time()
-    batch_size = 3
-    
-    # Filter out existing usernames from database
-    usernames = [p['username'] for p in selected_profiles]
-    username_to_hashtag = {p['username']: p['hashtag'] for p in selected_profiles}
-    
-    with app.app_context():
-        existing_usernames = set()
-        existing_leads = Lead.query.filter(Lead.username.in_(usernames)).all()
-        for lead in existing_leads:
-            existing_usernames.add(lead.username)
-        
-        usernames_to_enrich = [u for u in usernames if u not in existing_usernames]
-        
-        logger.info(f"Selected {len(usernames)} profiles")
-        logger.info(f"Filtered out {len(existing_usernames)} existing usernames")
-        logger.info(f"Will enrich {len(usernames_to_enrich)} new usernames")
-        
-        # Create batches
-        batches = [usernames_to_enrich[i:i + batch_size] for i in range(0, len(usernames_to_enrich), batch_size)]
-        
-        # Update progress
-        app_data['processing_progress'] = {
-            'current_step': f'2. Erweitere {len(usernames_to_enrich)} neue Profile...',
-            'phase': 'profile_enrichment',
-            'total_steps': len(batches),
-            'completed_steps': 0,
-            'estimated_time_remaining': len(batches) * 105,  # 15s processing + 90s pause
-            'total_usernames': len(usernames),
-            'existing_usernames': len(existing_usernames),
-            'usernames_to_enrich': len(usernames_to_enrich)
-        }
-    
-    # Process batches
-    semaphore = asyncio.Semaphore(3)
-    perplexity_semaphore = asyncio.Semaphore(2)
-    total_saved_leads = 0
-    
-    for i, batch in enumerate(batches):
-        if app_data.get('stop_requested', False):
-            logger.info(f"Processing stopped by user during batch {i+1}")
-            break
-            
-        try:
-            app_data['processing_progress']['current_step'] = f'2. Erweitere Profile - Batch {i+1}/{len(batches)}'
-            app_data['processing_progress']['current_batch'] = i + 1
-            app_data['processing_progress']['total_batches'] = len(batches)
-            
-            # Fix the function call to pass correct parameters
-            perplexity_semaphore_unused = perplexity_semaphore  # Keep for consistency even though not used in function
-            result = await enrich_profile_batch(batch, ig_sessionid, apify_token, perplexity_key, semaphore)
-            
-            if isinstance(result, list) and result:
-                # Add hashtag information
-                for lead in result:
-                    lead['hashtag'] = username_to_hashtag.get(lead['username'], 'unknown')
-                    lead['is_duplicate'] = False
-                
-                # Save batch
-                saved_count = save_leads_incrementally(result, app_data.get('keyword', ''), default_product_id)
-                total_saved_leads += saved_count
-                logger.info(f"Batch {i+1}: Saved {saved_count} leads")
-                
-                app_data['processing_progress']['incremental_leads'] = total_saved_leads
-            
-            app_data['processing_progress']['completed_steps'] = i + 1
-            
-            # Anti-spam pause
-            if i < len(batches) - 1:
-                logger.info(f"Anti-spam pause: 90s before batch {i+2}")
-                for remaining in range(90, 0, -15):
-                    app_data['processing_progress']['current_step'] = f'⏸ Anti-Spam Pause: {remaining}s bis Batch {i+2}/{len(batches)}'
-                    await asyncio.sleep(15)
-                    
-        except Exception as e:
-            logger.error(f"Batch {i+1} error: {e}")
-            continue
-    
-    # Final status
-    app_data['processing_progress'] = {
-        'current_step': f'3. Fertig! {total_saved_leads} Leads erfolgreich generiert ✓',
-        'phase': 'completed',
-        'total_steps': 0,
-        'completed_steps': 0,
-        'estimated_time_remaining': 0,
-        'total_leads_generated': total_saved_leads
-    }
-    
-    logger.info(f"Enrichment complete: {total_saved_leads} leads saved")
-    
-    # Get all leads for the selected hashtags
-    with app.app_context():
-        # Extract unique hashtags from selected_profiles
-        hashtags = list(set([p['hashtag'] for p in selected_profiles]))
-        leads = Lead.query.filter(Lead.hashtag.in_(hashtags)).all()
-        return [lead.to_dict() for lead in leads]
-
-
-async def discover_hashtags_async(keyword, ig_sessionid, search_limit):
-    """Discover hashtags only - returns hashtag variants with user counts"""
-    apify_token = os.environ.get('APIFY_TOKEN')
-    
-    if not apify_token or not apify_token.strip():
-        raise ValueError("Missing or empty APIFY_TOKEN")
-    
-    # Update progress tracking
-    app_data['processing_progress'] = {
-        'current_step': f'1. Suche Instagram-Profile für Hashtag #{keyword}...',
-        'phase': 'hashtag_search',
-        'total_steps': 1,
-        'completed_steps': 0,
-        'estimated_time_remaining': 30,
-        'keyword': keyword
-    }
-    
-    # Call Apify to get hashtag data
-    hashtag_input = {
-        "search": keyword,
-        "searchType": "hashtag",
-        "searchLimit": search_limit
-    }
-    
-    try:
-        hashtag_data = call_apify_actor_sync("DrF9mzPPEuVizVF4l", hashtag_input, apify_token)
-        
-        if not hashtag_data or not hashtag_data.get('items'):
-            logger.error(f"No hashtag data returned for keyword: {keyword}")
-            return []
-            
-        hashtag_items = hashtag_data.get('items', [])
-        logger.info(f"Processing {len(hashtag_items)} hashtag items")
-        
-        # Debug: Log first item to see structure including caption
-        if hashtag_items:
-            first_item = hashtag_items[0]
-            caption_preview = first_item.get('caption', '')
-            logger.info(f"First item structure: username={first_item.get('username')}, hashtag={first_item.get('hashtag')}, timestamp={first_item.get('timestamp')}, post_url={first_item.get('post_url')}, caption_length={len(caption_preview) if caption_preview else 0}, caption_preview={caption_preview[:50] if caption_preview else 'None'}...")
-        
-        # Count users per hashtag variant
-        hashtag_counts = {}
-        hashtag_usernames = {}  # Store usernames per hashtag
-        
-        for item in hashtag_items:
-            username = item.get('username')
-            hashtag = item.get('hashtag', keyword)
-            timestamp = item.get('timestamp')
-            post_url = item.get('post_url')
-            caption = item.get('caption', '')  # GET CAPTION FROM ITEM
-            
-            if username:
-                # URL decode the hashtag for display
-                import urllib.parse
-                decoded_hashtag = urllib.parse.unquote(hashtag)
-                
-                if decoded_hashtag not in hashtag_counts:
-                    hashtag_counts[decoded_hashtag] = 0
-                    hashtag_usernames[decoded_hashtag] = []
-                
-                hashtag_counts[decoded_hashtag] += 1
-                # Store complete profile data including timestamp, post_url AND CAPTION
-                hashtag_usernames[decoded_hashtag].append({
-                    'username': username,
-                    'timestamp': timestamp,
-                    'post_url': post_url,
-                    'caption': caption  # INCLUDE CAPTION
-                })
-        
-        # Create hashtag variants list with counts
-        variants = []
-        for hashtag, count in hashtag_counts.items():
-            # Extract just usernames for variant display
-            usernames_only = [user_data['username'] for user_data in hashtag_usernames[hashtag]]
-            variants.append({
-                'hashtag': hashtag,
-                'user_count': count,
-                'usernames': usernames_only
-            })
-        
-        # Sort by user count descending
-        variants.sort(key=lambda x: x['user_count'], reverse=True)
-        
-        # Save hashtag-username pairs to database for tracking
-        all_profiles = []
-        for hashtag, user_data_list in hashtag_usernames.items():
-            for user_data in user_data_list:
-                all_profiles.append({
-                    'username': user_data['username'],
-                    'hashtag': hashtag,
-                    'timestamp': user_data['timestamp'],
-                    'post_url': user_data['post_url'],
-                    'caption': user_data['caption']  # INCLUDE CAPTION IN PROFILES
-                })
-        
-        if all_profiles:
-            try:
-                # Deduplicate and save hashtag-username pairs
-                unique_profiles, duplicates = deduplicate_profiles(all_profiles)
-                saved_pairs = save_hashtag_username_pairs(unique_profiles, duplicates)
-                logger.info(f"Saved {len(saved_pairs)} hashtag-username pairs to database")
-            except Exception as e:
-                logger.error(f"Failed to save hashtag-username pairs: {e}")
-        
-        # Update progress
-        app_data['processing_progress']['completed_steps'] = 1
-        app_data['processing_progress']['current_step'] = f'Hashtag-Suche abgeschlossen - {len(variants)} Varianten gefunden'
-        app_data['processing_progress']['phase'] = 'hashtag_selection'
-        
-        return variants
-        
-    except Exception as e:
-        logger.error(f"Hashtag discovery failed: {e}")
-        app_data['processing_progress']['current_step'] = f'Fehler: {str(e)}'
-        return []
-
-
-async def process_keyword_async(keyword, ig_sessionid, search_limit, default_product_id=None):
-    """Async processing of keyword"""
-    apify_token = os.environ.get('APIFY_TOKEN')
-    perplexity_key = os.environ.get('PERPLEXITY_API_KEY')
-
-    # Initialize progress tracking
-    start_time = time.time()
-
-    if not all([apify_token, perplexity_key
-                ]) or not apify_token.strip() or not perplexity_key.strip():
-        missing_keys = []
-        if not apify_token or not apify_token.strip():
-            missing_keys.append('APIFY_TOKEN')
-        if not perplexity_key or not perplexity_key.strip():
-            missing_keys.append('PERPLEXITY_API_KEY')
-        raise ValueError(
-            f"Missing or empty API tokens: {', '.join(missing_keys)}")
-
-    # Calculate total estimated time including 5-minute anti-spam pauses between batches
-    avg_delay_time = 5.5  # Average of 1-10 seconds
-    hashtag_crawl_time = avg_delay_time + 30  # Hashtag search takes longer
-    profile_batch_time = avg_delay_time + 15  # Per batch (slightly longer for 3 profiles)
-    estimated_batches = search_limit // 3  # 3 profiles per batch
-    pause_time_per_batch = 90  # 90 seconds = 1.5 minutes between batches
-
-    # Total time = hashtag search + (batch processing time + pause time) * (batches - 1) + final batch processing
-    total_batch_and_pause_time = (profile_batch_time + pause_time_per_batch) * max(0, estimated_batches - 1)
-    final_batch_time = profile_batch_time if estimated_batches > 0 else 0
-    total_estimated_time = hashtag_crawl_time + total_batch_and_pause_time + final_batch_time
-
-    # Initialize progress with detailed step tracking
-    app_data['processing_progress'] = {
-        'current_step': '1. Suche Instagram-Profile für Hashtag...',
-        'phase': 'hashtag_search',
-        'total_steps': 1 + estimated_batches,  # 1 hashtag search + N profile batches
-        'completed_steps': 0,
-        'estimated_time_remaining': int(total_estimated_time),
-        'incremental_leads': 0,
-        'keyword': keyword,
-        'final_status': 'processing',
-        'current_batch': 0,
-        'total_batches': estimated_batches,
-        'phase_start_time': time.time()
-    }
-
-    # Step 1: Hashtag crawl - Using correct Apify API format with user-defined limit
-    hashtag_input = {
-        "search": keyword,
-        "searchType": "hashtag",
-        "searchLimit": search_limit
-    }
-    
-    try:
-        # Check if stop was requested before starting
-        if app_data.get('stop_requested', False):
-            logger.info("Processing stopped by user before hashtag search")
-            app_data['processing_progress']['final_status'] = 'stopped'
-            app_data['processing_status'] = None
-            return []
-            
-        app_data['processing_progress']['current_step'] = f'1. Suche Instagram-Profile für Hashtag #{keyword} (ca. {hashtag_crawl_time/60:.1f}min)...'
-        hashtag_data = call_apify_actor_sync("DrF9mzPPEuVizVF4l", hashtag_input,
-                                             apify_token)
-        # Don't increment completed_steps here - will do it after hashtag processing is fully done
-        logger.info(f"Hashtag search completed successfully for #{keyword}")
-
-        # Update time remaining
-        elapsed_time = time.time() - start_time
-        remaining_steps = app_data['processing_progress']['total_steps'] - app_data['processing_progress']['completed_steps']
-        avg_time_per_step = elapsed_time / max(1, app_data['processing_progress']['completed_steps'] + 1)
-        app_data['processing_progress']['estimated_time_remaining'] = int(avg_time_per_step * remaining_steps)
-
-        if not hashtag_data or not hashtag_data.get('items'):
-            logger.error(f"No hashtag data returned for keyword: {keyword}")
-            return []
-    except Exception as e:
-        logger.error(f"Hashtag crawl failed for keyword '{keyword}': {e}")
-        return []
-
-    # The call_apify_actor_sync function already processed and extracted username-hashtag pairs
-    hashtag_items = hashtag_data.get('items', [])
-    logger.info(f"Processing {len(hashtag_items)} hashtag items")
-
-    # Debug: Log the structure of the first item
-    if hashtag_items:
-        logger.debug(f"First item structure: {list(hashtag_items[0].keys()) if isinstance(hashtag_items[0], dict) else type(hashtag_items[0])}")
-        logger.debug(f"First item sample: {str(hashtag_items[0])[:200]}")
-
-    # Use the extracted username-hashtag pairs directly from Apify result
-    profiles = hashtag_items
-
-    # Store count before clearing for logging
-    usernames_count = len(profiles)
-
-    logger.info(f"Found {len(profiles)} profiles")
-
-    # If no profiles found, return empty result
-    if not profiles:
-        logger.warning(f"No profiles found in hashtag data for keyword: {keyword}")
-        logger.info(f"Extracted {usernames_count} unique usernames from hashtag data")
-        return []
-
-    unique_profiles, duplicates = deduplicate_profiles(profiles)
-    logger.info(f"After deduplication: {len(unique_profiles)} unique profiles")
-
-    # Save deduplicated hashtag-username pairs to database
-    try:
-        saved_pairs = save_hashtag_username_pairs(unique_profiles, duplicates)
-        logger.info(f"Saved {len(saved_pairs)} hashtag-username pairs to database")
-    except Exception as e:
-        logger.error(f"Failed to save hashtag-username pairs: {e}")
-        # Continue processing even if saving pairs fails
-
-    # Update progress to show hashtag search completed with counts
-    app_data['processing_progress']['completed_steps'] = 1
-    app_data['processing_progress']['current_step'] = f'1. Hashtag-Suche abgeschlossen - {len(unique_profiles)} Profile gefunden ✓'
-    app_data['processing_progress']['phase'] = 'hashtag_search_complete'
-    app_data['processing_progress']['total_usernames'] = len(unique_profiles)
-    logger.info(f"Progress updated: Step 1 complete, found {len(unique_profiles)} profiles")
-
-    # Brief pause to make transition visible
-    await asyncio.sleep(1)
-
-    # Step 3: Profile enrichment with Instagram anti-spam optimization
-    semaphore = asyncio.Semaphore(3)  # Match batch size for controlled processing
-    perplexity_semaphore = asyncio.Semaphore(2)  # Limit concurrent Perplexity API calls
-
-    # Advanced anti-spam optimization: batch 3 profiles with strategic pauses
-    usernames = [p['username'] for p in unique_profiles]
-    
-    # Create username to hashtag mapping for later use
-    username_to_hashtag = {p['username']: p['hashtag'] for p in unique_profiles}
-    
-    # Filter out usernames that already exist in database
-    with app.app_context():
-        existing_usernames = set()
-        existing_leads = Lead.query.filter(Lead.username.in_(usernames)).all()
-        for lead in existing_leads:
-            existing_usernames.add(lead.username)
-        
-        # Filter out usernames that already exist in database
-        usernames_to_enrich = [u for u in usernames if u not in existing_usernames]
-        
-        logger.info(f"Found {len(usernames)} unique usernames from hashtag search")
-        logger.info(f"Filtered out {len(existing_usernames)} existing usernames from database")
-        logger.info(f"Will enrich {len(usernames_to_enrich)} new usernames")
-        
-        # Update progress with de-duplication info
-        app_data['processing_progress']['total_usernames'] = len(usernames)
-        app_data['processing_progress']['existing_usernames'] = len(existing_usernames)
-        app_data['processing_progress']['usernames_to_enrich'] = len(usernames_to_enrich)
-        
-        # Update progress display to show de-duplication stats
-        app_data['processing_progress']['current_step'] = f'1. Hashtag-Suche abgeschlossen - {len(usernames)} Profile gefunden ({len(existing_usernames)} bereits in Datenbank, {len(usernames_to_enrich)} werden angereichert) ✓'
-        
-        usernames = usernames_to_enrich  # Use filtered list
-    
-    batch_size = 3  # Process 3 profiles at a time with extended pauses between groups
-
-    batches = [
-        usernames[i:i + batch_size]
-        for i in range(0, len(usernames), batch_size)
-    ]
-
-    # Update progress total steps based on actual batches
-    app_data['processing_progress']['total_steps'] = 1 + len(batches)
-
-    # Process batches sequentially to minimize memory usage
-    total_saved_leads = 0
-    import gc
-
-    for i, batch in enumerate(batches):
-        # Check if stop was requested before processing each batch
-        if app_data.get('stop_requested', False):
-            logger.info(f"Processing stopped by user during batch {i+1}")
-            app_data['processing_progress']['final_status'] = 'stopped'
-            app_data['processing_status'] = None
-            # Return any leads saved so far
-            return total_saved_leads
-            
-        try:
-            # Update progress with detailed step information
-            batch_time_estimate = (profile_batch_time + (90 if i < len(batches) - 1 else 0)) / 60  # Convert to minutes
-            profiles_processed = i * batch_size
-            profiles_current_batch = min(len(batch), batch_size)
-            total_profiles_after_batch = profiles_processed + profiles_current_batch
-            app_data['processing_progress']['current_step'] = f'2. Erweitere Profil-Informationen - {profiles_processed}/{len(usernames)} Profile angereichert - Batch {i+1}/{len(batches)} (ca. {batch_time_estimate:.1f}min)'
-            app_data['processing_progress']['phase'] = 'profile_enrichment'
-            app_data['processing_progress']['current_batch'] = i + 1
-            app_data['processing_progress']['total_batches'] = len(batches)
-            logger.info(f"Processing batch {i+1}/{len(batches)} with {len(batch)} usernames")
-
-            # Process one batch at a time
-            result = await enrich_profile_batch(batch, ig_sessionid, apify_token,
-                                              perplexity_key, semaphore)
-
-            if isinstance(result, list) and result:
-                # Mark duplicates and add hashtag information for this batch
-                for lead in result:
-                    if lead['username'] in duplicates:
-                        lead['is_duplicate'] = True
-                    else:
-                        lead['is_duplicate'] = False
-                    # Ensure hashtag is present from unique profiles or extracted IDs.
-                    hashtag = next((p['hashtag'] for p in unique_profiles if p['username'] == lead['username']), keyword)
-                    lead['hashtag'] = hashtag
-
-                # Save this batch immediately to prevent data loss
-                saved_count = save_leads_incrementally(result, keyword, default_product_id=default_product_id)
-                total_saved_leads += saved_count
-                logger.info(f"Batch {i+1}: Saved {saved_count} leads incrementally")
-
-                # Update progress with incremental lead count for frontend - force immediate update
-                app_data['processing_progress']['incremental_leads'] = total_saved_leads
-                app_data['processing_progress']['keyword'] = keyword
-                app_data['processing_progress']['current_step'] = f'2. Batch {i+1}/{len(batches)} abgeschlossen - {total_saved_leads} Leads generiert'
-
-                # Force immediate progress update for UI refresh
-                logger.info(f"UI Refresh Trigger: {total_saved_leads} leads saved for keyword '{keyword}'")
-            else:
-                logger.warning(f"Batch {i+1}: No results or unexpected type: {type(result)}")
-
-            # Update progress after batch completion
-            app_data['processing_progress']['completed_steps'] += 1
-
-            # Recalculate time remaining (including pause time for remaining batches)
-            elapsed_time = time.time() - start_time
-            remaining_batches = len(batches) - (i + 1)  # How many batches still need processing
-            # Calculate pause time with new pattern: 3 batches with 90s pauses, then 180s pause
-            if remaining_batches > 0:
-                remaining_groups = remaining_batches // 3
-                remaining_in_current_group = remaining_batches % 3
-
-                # Calculate total pause time
-                pause_time_remaining = 0
-                # Full groups have 2x90s + 1x180s = 360s
-                pause_time_remaining += remaining_groups * 360
-                # Partial group has only 90s pauses
-                if remaining_in_current_group > 0:
-                    pause_time_remaining += (remaining_in_current_group - 1) * 90
-            else:
-                pause_time_remaining = 0
-
-            if app_data['processing_progress']['completed_steps'] > 0:
-                avg_processing_time_per_step = elapsed_time / app_data['processing_progress']['completed_steps']
-                processing_time_remaining = remaining_batches * avg_processing_time_per_step
-                app_data['processing_progress']['estimated_time_remaining'] = int(processing_time_remaining + pause_time_remaining)
-            else:
-                app_data['processing_progress']['estimated_time_remaining'] = int(total_estimated_time - elapsed_time + pause_time_remaining)
-
-            # Force garbage collection after each batch
-            gc.collect()
-
-            # Advanced Instagram anti-spam protection: 90s pause between batches, 3min pause after 3 batches
-            if i < len(batches) - 1:  # Don't pause after the last batch
-                # Determine pause duration based on batch group position
-                batch_position_in_group = i % 3  # 0, 1, or 2
-                is_end_of_group = (batch_position_in_group == 2) or (i == len(batches) - 2)
-
-                if is_end_of_group and i < len(batches) - 2:  # End of group but not last batch
-                    pause_duration = 180  # 3 minutes between groups
-                    pause_reason = "Extended anti-spam pause between batch groups"
-                else:
-                    pause_duration = 90  # 90 seconds within group
-                    pause_reason = "Standard anti-spam pause"
-
-                logger.info(f"{pause_reason}: Taking {pause_duration}s pause after batch {i+1}. Next batch will start in {pause_duration} seconds...")
+def run_discovery_job(payload, job_id):
+    """Job handler: discover hashtag variants for a keyword"""
+    keyword = payload['keyword']
+    hashtag_variants = discover_hashtags_sync(keyword, payload['ig_sessionid'], payload['search_limit'])
 
-                # Update progress to show pause status with next batch info
-                minutes_left = pause_duration // 60
-                seconds_left = pause_duration % 60
-
-                if pause_duration == 180:
-                    app_data['processing_progress']['current_step'] = f'⏸ Erweiterte Anti-Spam Pause (3min): {minutes_left}m {seconds_left}s bis Batch-Gruppe {(i+2)//3 + 1}'
-                else:
-                    app_data['processing_progress']['current_step'] = f'⏸ Anti-Spam Pause: {minutes_left}m {seconds_left}s bis Batch {i+2}/{len(batches)}'
+    # Serve the variants from memory in this process; other processes read them from the job result
+    state = {key: value for key, value in payload.items() if key not in JOB_SECRET_PAYLOAD_KEYS}
+    job_state.set_state('discovery', dict(state, hashtag_variants=hashtag_variants), job_id=job_id)
+    return {'keyword': keyword, 'hashtag_variants': hashtag_variants}
 
-                # Count down the pause time with progress updates
-                for remaining_seconds in range(pause_duration, 0, -15):  # Update every 15 seconds
-                    minutes_remaining = remaining_seconds // 60
-                    seconds_remaining = remaining_seconds % 60
 
-                    if minutes_remaining > 0:
-                        time_display = f"{minutes_remaining}m {seconds_remaining}s"
-                    else:
-                        time_display = f"{seconds_remaining}s"
+def run_enrichment_job(payload, job_id):
+    """Job handler: enrich the profiles selected from a discovery, resuming from its checkpoint on retries"""
+    selected_profiles = payload['selected_profiles']
+    leads = run_enrichment_process(selected_profiles, payload['ig_sessionid'],
+                                   payload.get('default_product_id'), payload.get('keyword', ''), job_id)
+    return {'lead_count': len(leads), 'hashtags': sorted({p['hashtag'] for p in selected_profiles})}
 
-                    if pause_duration == 180:
-                        app_data['processing_progress']['current_step'] = f'⏸ Erweiterte Anti-Spam Pause (3min): {time_display} bis Batch-Gruppe {(i+2)//3 + 1}'
-                    else:
-                        app_data['processing_progress']['current_step'] = f'⏸ Anti-Spam Pause: {time_display} bis Batch {i+2}/{len(batches)}'
-                    logger.info(f"Pause countdown: {time_display} remaining until next batch")
 
-                    await asyncio.sleep(15)  # Use async sleep to not block the event loop
+job_queue.register('discovery', run_discovery_job)
+job_queue.register('enrichment', run_enrichment_job)
 
-                # Final sleep for any remaining seconds
-                remaining_final = pause_duration % 15
-                if remaining_final > 0:
-                    await asyncio.sleep(remaining_final)
 
-                logger.info(f"90s pause completed. Resuming with batch {i+2}/{len(batches)}")
-            else:
-                logger.info(f"All batches completed. No pause needed after final batch {i+1}")
+async def enrich_selected_profiles_async(selected_profiles, ig_sessionid, default_product_id=None, keyword='',
+                                         job_id=None):
+    """Enrich selected profiles only"""
+    apify_token = os.environ.get('APIFY_TOKEN')
+    perplexity_key = os.environ.get('PERPLEXITY_API_KEY')
+    
+    if not all([apify_token, perplexity_key]) or not apify_token.strip() or not perplexity_key.strip():
+        missing_keys = []
+        if not apify_token or not apify_token.strip():
+            missing_keys.append('APIFY_TOKEN')
+        if not perplexity_key or not perplexity_key.strip():
+            missing_keys.append('PERPLEXITY_API_KEY')
+        raise ValueError(f"Missing or empty API tokens: {', '.join(missing_keys)}")
+    
+    # Initialize progress tracking
+    start_time = time.time()
+    batch_size = 3
+    
+    # Filter out existing usernames from database
+    usernames = [p['username'] for p in selected_profiles]
+    username_to_hashtag = {p['username']: p['hashtag'] for p in selected_profiles}
+    
+    checkpoint = load_enrichment_checkpoint(job_id)
+    if checkpoint:
+        # Resumed job: keep the original plan so batch indices still match the recorded completions
+        checkpoint_id, batches, completed_batches = checkpoint
+        usernames_to_enrich = [username for batch in batches for username in batch]
+        existing_count = len(usernames) - len(usernames_to_enrich)
+        logger.info(f"Resuming enrichment job {job_id}: {len(completed_batches)}/{len(batches)} batches already saved")
+    else:
+        with app.app_context():
+            existing_usernames = set()
+            existing_leads = Lead.query.filter(Lead.username.in_(usernames)).all()
+            for lead in existing_leads:
+                existing_usernames.add(lead.username)
 
-        except Exception as e:
-            logger.error(f"Batch {i+1} processing error: {e}")
-            # Update progress with current saved count even on error
-            app_data['processing_progress']['incremental_leads'] = total_saved_leads
-            app_data['processing_progress']['current_step'] = f'Batch {i+1} failed - {total_saved_leads} leads saved so far'
-            # Continue processing other batches even if one fails
-            continue
+        usernames_to_enrich = [u for u in usernames if u not in existing_usernames]
+        existing_count = len(existing_usernames)
 
-    logger.info(f"Total enrichment complete: {total_saved_leads} leads saved to database")
+        logger.info(f"Selected {len(usernames)} profiles")
+        logger.info(f"Filtered out {len(existing_usernames)} existing usernames")
+        logger.info(f"Will enrich {len(usernames_to_enrich)} new usernames")
 
-    # Show final completion status
-    app_data['processing_progress'] = {
-        'current_step': f'3. Fertig! {total_saved_leads} Leads erfolgreich generiert und gespeichert ✓',
+        # Create batches
+        batches = [usernames_to_enrich[i:i + batch_size] for i in range(0, len(usernames_to_enrich), batch_size)]
+        completed_batches = set()
+        checkpoint_id = create_enrichment_checkpoint(job_id, keyword, batches) if job_id else None
+
+    remaining_usernames = sum(len(batch) for index, batch in enumerate(batches) if index not in completed_batches)
+
+    # Update progress
+    job_state.set_progress({
+        'current_step': f'2. Erweitere {len(usernames_to_enrich)} neue Profile...',
+        'phase': 'profile_enrichment',
+        'total_steps': len(batches),
+        'completed_steps': len(completed_batches),
+        'estimated_time_remaining': estimate_enrichment_seconds(ig_sessionid, remaining_usernames,
+                                                                len(batches) - len(completed_batches)),
+        'total_usernames': len(usernames),
+        'existing_usernames': existing_count,
+        'usernames_to_enrich': len(usernames_to_enrich)
+    })
+    
+    def prepare_leads(leads):
+        for lead in leads:
+            lead['hashtag'] = username_to_hashtag.get(lead['username'], 'unknown')
+            lead['is_duplicate'] = False
+
+    def on_batch_done(index, saved_count, total_saved):
+        if checkpoint_id:
+            complete_enrichment_batch(checkpoint_id, index, saved_count)
+        job_state.increment_progress('completed_steps')
+        remaining_profiles = sum(len(b) for i, b in enumerate(batches[index + 1:], index + 1) if i not in completed_batches)
+        job_state.update_progress(
+            incremental_leads=total_saved,
+            current_step=f'2. Batch {index+1}/{len(batches)} gespeichert - {total_saved} Leads generiert',
+            estimated_time_remaining=estimate_enrichment_seconds(ig_sessionid, remaining_profiles,
+                                                                 len(batches) - (index + 1)))
+
+    # Fetch, contact enrichment and saving overlap across batches
+    total_saved_leads, failed_batches = await run_enrichment_pipeline(
+        batches, ig_sessionid, apify_token, perplexity_key, keyword,
+        prepare_leads, on_batch_done, default_product_id, skip_batches=completed_batches)
+    if failed_batches and not job_state.stop_requested():
+        # Failing the job requeues it; the retry resumes from the checkpoint and only runs the failed batches
+        job_state.update_progress(
+            current_step=f'2. {len(failed_batches)} von {len(batches)} Batches fehlgeschlagen - wird wiederholt',
+            failed_batches=len(failed_batches))
+        raise RuntimeError(f"Enrichment batches {[index + 1 for index in failed_batches]} of {len(batches)} failed, "
+                           f"{total_saved_leads} leads saved by the other batches")
+    if checkpoint_id and not job_state.stop_requested():
+        total_saved_leads = finish_enrichment_checkpoint(checkpoint_id) or total_saved_leads
+    
+    # Final status
+    previous_progress = job_state.progress()
+    job_state.set_progress({
+        'current_step': f'3. Fertig! {total_saved_leads} Leads erfolgreich generiert ✓',
         'phase': 'completed',
         'total_steps': 0,
         'completed_steps': 0,
         'estimated_time_remaining': 0,
         'total_leads_generated': total_saved_leads,
-        'final_status': 'success'
-    }
+        'profile_cache_hits': previous_progress.get('profile_cache_hits', 0),
+        'profile_cache_misses': previous_progress.get('profile_cache_misses', 0),
+        'local_contact_fields': previous_progress.get('local_contact_fields', 0),
+        'perplexity_calls_avoided': previous_progress.get('perplexity_calls_avoided', 0)
+    })
+    
+    logger.info(f"Enrichment complete: {total_saved_leads} leads saved, "
+                f"{previous_progress.get('perplexity_calls_avoided', 0)} Perplexity calls avoided by local extraction")
+    
+    # Get all leads for the selected hashtags
+    with app.app_context():
+        # Extract unique hashtags from selected_profiles
+        hashtags = list(set([p['hashtag'] for p in selected_profiles]))
+        leads = Lead.query.filter(Lead.hashtag.in_(hashtags)).all()
+        return [lead.to_dict() for lead in leads]
+
 
-    # Return dictionary format for API response
-    # Query fresh leads from database to avoid session issues
+async def discover_hashtags_async(keyword, ig_sessionid, search_limit):
+    """Discover hashtags only - returns hashtag variants with user counts"""
+    apify_token = os.environ.get('APIFY_TOKEN')
+    
+    if not apify_token or not apify_token.strip():
+        raise ValueError("Missing or empty APIFY_TOKEN")
+    
+    # Update progress tracking
+    job_state.set_progress({
+        'current_step': f'1. Suche Instagram-Profile für Hashtag #{keyword}...',
+        'phase': 'hashtag_search',
+        'total_steps': 1,
+        'completed_steps': 0,
+        'estimated_time_remaining': 30,
+        'keyword': keyword
+    })
+    
+    # Call Apify to get hashtag data
+    hashtag_input = {
+        "search": keyword,
+        "searchType": "hashtag",
+        "searchLimit": search_limit
+    }
+    
+    def report_streamed(saved_count):
+        job_state.update_progress(
+            current_step=f'1. Suche Instagram-Profile für Hashtag #{keyword} - {saved_count} Beiträge gespeichert...',
+            streamed_profiles=saved_count)
+    
+    buffer = DiscoveryBuffer()
     try:
-        with app.app_context():
-            fresh_leads = Lead.query.filter_by(hashtag=keyword).order_by(Lead.created_at.desc()).all()
-            return [lead.to_dict() for lead in fresh_leads]
+        # The buffer keeps the latest post per username (spilling to disk); pairs are written once it is complete
+        items = aiter_apify_hashtag_items("DrF9mzPPEuVizVF4l", hashtag_input, apify_token,
+                                          job_id=f'discovery:{keyword}')
+        await abuffer_hashtag_profiles(items, keyword, buffer)
+        saved_count = await apersist_hashtag_profiles(buffer.iter_records(), on_chunk=report_streamed)
+        
+        if not saved_count:
+            logger.error(f"No hashtag data returned for keyword: {keyword}")
+            return []
+        
+        # Group usernames per hashtag variant
+        hashtag_usernames = {}
+        for username, hashtag in buffer.iter_assignments():
+            hashtag_usernames.setdefault(hashtag, []).append(username)
+        
+        # Create hashtag variants list with counts
+        variants = []
+        for hashtag, usernames in hashtag_usernames.items():
+            variants.append({
+                'hashtag': hashtag,
+                'user_count': len(usernames),
+                'usernames': usernames
+            })
+        
+        # Sort by user count descending
+        variants.sort(key=lambda x: x['user_count'], reverse=True)
+        
+        # Update progress
+        job_state.update_progress(
+            completed_steps=1,
+            current_step=f'Hashtag-Suche abgeschlossen - {len(variants)} Varianten gefunden',
+            phase='hashtag_selection')
+        
+        return variants
+        
     except Exception as e:
-        logger.error(f"Failed to query leads from database: {e}")
+        logger.error(f"Hashtag discovery failed: {e}")
+        job_state.update_progress(current_step=f'Fehler: {str(e)}')
         return []
+    finally:
+        buffer.close()
 
 
 def parse_prompt_template(template, enabled_vars):
@@ -2177,23 +3746,115 @@ def parse_prompt_template(template, enabled_vars):
     return filtered_template
 
 
-def build_dynamic_prompt_content(lead, prompt_type, has_product):
+# How often a process checks whether another process has saved prompt settings
+PROMPT_CONFIG_CHECK_SECONDS = float(os.environ.get('PROMPT_CONFIG_CHECK_SECONDS', 10))
+
+
+class PromptConfigSnapshot:
+    """Read-only view of SystemPrompt, UserPrompt and VariableSettings.
+
+    settings is the nested dict served to the prompt editors, draft_configs[has_product][prompt_type]
+    holds the parsed system prompt, enabled variables and user template used for drafting, and version
+    is a content hash that doubles as the ETag.
+    """
+    __slots__ = ('settings', 'draft_configs', 'version', 'stamp')
+
+    def __init__(self, settings, draft_configs, stamp):
+        self.settings = settings
+        self.draft_configs = draft_configs
+        self.stamp = stamp
+        self.version = hashlib.sha256(json.dumps(settings, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
+
+class PromptConfigStore:
+    """Prompt configuration loaded once per process and replaced whole when prompts are saved"""
+
+    def __init__(self, check_interval=PROMPT_CONFIG_CHECK_SECONDS):
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._checked_at = 0.0
+        self._check_interval = check_interval
+
+    def _stamp(self):
+        """Row count and latest update per prompt table; changes whenever any process saves prompts"""
+        from sqlalchemy import func
+
+        return tuple(tuple(db.session.query(func.count(model.id), func.max(model.updated_at)).one())
+                     for model in (SystemPrompt, UserPrompt, VariableSettings))
+
+    def _build(self):
+        stamp = self._stamp()
+        settings = {
+            'with_product': {'subject': '', 'body': ''},
+            'without_product': {'subject': '', 'body': ''},
+            'user_templates': {
+                'with_product': {'subject': '', 'body': ''},
+                'without_product': {'subject': '', 'body': ''}
+            },
+            'variable_settings': {
+                'with_product': {'subject': {}, 'body': {}},
+                'without_product': {'subject': {}, 'body': {}}
+            }
+        }
+        for prompt in SystemPrompt.query.all():
+            key = 'with_product' if prompt.has_product else 'without_product'
+            settings[key][prompt.prompt_type] = prompt.system_message
+        for prompt in UserPrompt.query.all():
+            key = 'with_product' if prompt.has_product else 'without_product'
+            settings['user_templates'][key][prompt.prompt_type] = prompt.user_message
+        for setting in VariableSettings.query.all():
+            key = 'with_product' if setting.has_product else 'without_product'
+            settings['variable_settings'][key][setting.prompt_type][setting.variable_name] = setting.is_enabled
+
+        # Templates are parsed once per configuration instead of once per draft
+        draft_configs = {}
+        for has_product in (True, False):
+            key = 'with_product' if has_product else 'without_product'
+            draft_configs[has_product] = {}
+            for prompt_type in ('subject', 'body'):
+                enabled_vars = settings['variable_settings'][key][prompt_type]
+                draft_configs[has_product][prompt_type] = {
+                    'system_prompt': parse_prompt_template(settings[key][prompt_type] or "", enabled_vars),
+                    'enabled_vars': enabled_vars,
+                    'user_message': settings['user_templates'][key][prompt_type] or ''
+                }
+        return PromptConfigSnapshot(settings, draft_configs, stamp)
+
+    def get(self):
+        """Current snapshot (needs an app context); rebuilt if another process changed the prompt tables"""
+        with self._lock:
+            snapshot = self._snapshot
+            check_due = time.monotonic() - self._checked_at >= self._check_interval
+        if snapshot is not None and not check_due:
+            return snapshot
+        if snapshot is not None and self._stamp() == snapshot.stamp:
+            with self._lock:
+                self._checked_at = time.monotonic()
+            return snapshot
+        return self.reload()
+
+    def reload(self):
+        """Rebuild the snapshot from the database; called after prompt settings are saved"""
+        snapshot = self._build()
+        with self._lock:
+            self._snapshot = snapshot
+            self._checked_at = time.monotonic()
+        logger.info(f"Loaded prompt configuration version {snapshot.version}")
+        return snapshot
+
+
+prompt_configs = PromptConfigStore()
+
+
+def load_draft_prompt_config(has_product):
+    """Parsed system prompt, enabled variables and user template for subject and body drafting"""
+    return prompt_configs.get().draft_configs[has_product]
+
+
+def build_dynamic_prompt_content(lead, prompt_config):
     """Build prompt content using dynamic template system"""
     try:
-        # Get variable settings for this configuration
-        variable_settings = VariableSettings.query.filter_by(
-            prompt_type=prompt_type,
-            has_product=has_product
-        ).all()
-        
-        # Create a dictionary of enabled variables
-        enabled_vars = {setting.variable_name: setting.is_enabled for setting in variable_settings}
-        
-        # Get the user prompt template from database
-        user_prompt = UserPrompt.query.filter_by(
-            prompt_type=prompt_type,
-            has_product=has_product
-        ).first()
+        enabled_vars = prompt_config['enabled_vars']
         
         # Always auto-generate structured data from enabled variables
         auto_data_parts = []
@@ -2219,7 +3880,7 @@ def build_dynamic_prompt_content(lead, prompt_type, has_product):
             auto_data_parts.append(f"Post Date: {formatted_date}")
 
         # Add product variables if enabled and available
-        if has_product and lead.selected_product:
+        if lead.selected_product:
             if enabled_vars.get('product_name', True):
                 auto_data_parts.append(f"Product Name: {lead.selected_product.name}")
                 
@@ -2233,8 +3894,9 @@ def build_dynamic_prompt_content(lead, prompt_type, has_product):
         structured_data = "\n".join(auto_data_parts) if auto_data_parts else ""
 
         # If there's user template text, add it to the front
-        if user_prompt and user_prompt.user_message and user_prompt.user_message.strip():
-            return f"{user_prompt.user_message.strip()}\n\n{structured_data}"
+        user_message = prompt_config['user_message']
+        if user_message and user_message.strip():
+            return f"{user_message.strip()}\n\n{structured_data}"
         else:
             return structured_data
         
@@ -2244,7 +3906,152 @@ def build_dynamic_prompt_content(lead, prompt_type, has_product):
         return ""
 
 
+def build_draft_messages(lead, prompt_type, config):
+    """Chat messages for drafting a lead's subject or body from a loaded prompt config"""
+    return [{
+        "role": "system",
+        "content": config[prompt_type]['system_prompt']
+    }, {
+        "role": "user",
+        "content": build_dynamic_prompt_content(lead, config[prompt_type])
+    }]
+
+
+# Completion limits per drafted part
+DRAFT_MAX_TOKENS = {'subject': 100, 'body': 500}
+
+# 'combined' asks for subject and body in one structured response, 'separate' makes one call for each
+DRAFT_GENERATION_MODE = os.environ.get('DRAFT_GENERATION_MODE', 'separate')
+DRAFT_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "email_draft",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "subject": {"type": "string"},
+                "body": {"type": "string"}
+            },
+            "required": ["subject", "body"],
+            "additionalProperties": False
+        }
+    }
+}
+
 
+def build_combined_draft_messages(lead, config):
+    """Messages asking for subject and body in one response, or None if the stored prompt pair can't be merged"""
+    subject_prompt = config['subject']['system_prompt']
+    body_prompt = config['body']['system_prompt']
+    # Each part needs its own instructions, and a prompt that dictates its own output format would fight the schema
+    if not subject_prompt or not body_prompt or any('json' in prompt.lower() for prompt in (subject_prompt, body_prompt)):
+        return None
+
+    subject_content = build_dynamic_prompt_content(lead, config['subject'])
+    body_content = build_dynamic_prompt_content(lead, config['body'])
+    if subject_content == body_content:
+        user_content = subject_content
+    else:
+        user_content = f"Daten für den Betreff:\n{subject_content}\n\nDaten für den E-Mail-Text:\n{body_content}"
+
+    return [{
+        "role": "system",
+        "content": ("Erstelle Betreff (subject) und Text (body) einer E-Mail in einer Antwort.\n\n"
+                    f"Anweisungen für den Betreff:\n{subject_prompt}\n\n"
+                    f"Anweisungen für den E-Mail-Text:\n{body_prompt}")
+    }, {
+        "role": "user",
+        "content": user_content
+    }]
+
+
+class DraftStats:
+    """Latency and token totals per generation mode, so combined and separate drafting can be compared"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._modes = {}
+
+    def record(self, mode, metrics):
+        with self._lock:
+            totals = self._modes.setdefault(mode, {'drafts': 0, 'calls': 0, 'latency_ms': 0, 'first_token_ms': 0,
+                                                   'prompt_tokens': 0, 'completion_tokens': 0})
+            totals['drafts'] += 1
+            # Only streamed drafts see their first token before the whole answer
+            totals['first_token_ms'] += metrics.get('first_token_ms', metrics['latency_ms'])
+            totals['calls'] += metrics['calls']
+            totals['latency_ms'] += metrics['latency_ms']
+            totals['prompt_tokens'] += metrics['prompt_tokens']
+            totals['completion_tokens'] += metrics['completion_tokens']
+
+    def stats(self):
+        with self._lock:
+            return {mode: {
+                'drafts': totals['drafts'],
+                'calls_per_draft': round(totals['calls'] / totals['drafts'], 2),
+                'avg_latency_ms': round(totals['latency_ms'] / totals['drafts']),
+                'avg_first_token_ms': round(totals['first_token_ms'] / totals['drafts']),
+                'avg_prompt_tokens': round(totals['prompt_tokens'] / totals['drafts']),
+                'avg_completion_tokens': round(totals['completion_tokens'] / totals['drafts'])
+            } for mode, totals in self._modes.items()}
+
+
+draft_stats = DraftStats()
+
+
+def generate_draft(lead, prompt_config, mode=DRAFT_GENERATION_MODE):
+    """Draft subject and body for a lead; returns (subject, body, metrics).
+
+    Combined mode falls back to one call per part when the prompts can't be merged or the structured
+    answer is unusable. metrics records the mode actually used, call count, latency and token usage.
+    """
+    started = time.perf_counter()
+    responses = []
+    subject_text = body_text = None
+    used_mode = 'separate'
+
+    combined_messages = build_combined_draft_messages(lead, prompt_config) if mode == 'combined' else None
+    if combined_messages:
+        response = openai_client.chat.completions.create(
+            model="gpt-4o",
+            messages=combined_messages,
+            max_tokens=sum(DRAFT_MAX_TOKENS.values()),
+            temperature=0.7,
+            response_format=DRAFT_RESPONSE_FORMAT
+        )
+        responses.append(response)
+        try:
+            draft = json.loads(response.choices[0].message.content)
+            subject_text = draft['subject'].strip()
+            body_text = draft['body'].strip()
+            used_mode = 'combined'
+        except (json.JSONDecodeError, KeyError, TypeError, AttributeError) as e:
+            logger.warning(f"Combined draft for {lead.username} was not usable, falling back to separate calls: {e}")
+    elif mode == 'combined':
+        logger.info(f"System prompts for {lead.username} can't be merged, using separate calls")
+
+    if used_mode == 'separate':
+        # Generate subject and body using their own prompts
+        for part in ('subject', 'body'):
+            responses.append(openai_client.chat.completions.create(
+                model="gpt-4o",
+                messages=build_draft_messages(lead, part, prompt_config),
+                max_tokens=DRAFT_MAX_TOKENS[part],
+                temperature=0.7
+            ))
+        subject_text = responses[-2].choices[0].message.content.strip()
+        body_text = responses[-1].choices[0].message.content.strip()
+
+    metrics = {
+        'mode': used_mode,
+        'calls': len(responses),
+        'latency_ms': int((time.perf_counter() - started) * 1000),
+        'prompt_tokens': sum(response.usage.prompt_tokens for response in responses if response.usage),
+        'completion_tokens': sum(response.usage.completion_tokens for response in responses if response.usage)
+    }
+    draft_stats.record(used_mode, metrics)
+    return subject_text, body_text, metrics
 
 
 @app.route('/draft-email/<username>', methods=['GET'])
@@ -2264,76 +4071,18 @@ def draft_email(username):
         
         logger.info(f"Generating email for {username}, has_product: {has_product}")
         
-        # Get system prompts from database based on product selection
-        subject_prompt_obj = SystemPrompt.query.filter_by(
-            prompt_type='subject', 
-            has_product=has_product
-        ).first()
-        
-        body_prompt_obj = SystemPrompt.query.filter_by(
-            prompt_type='body', 
-            has_product=has_product
-        ).first()
-        
-        # Get variable settings for dynamic system prompt filtering
-        subject_var_settings = VariableSettings.query.filter_by(
-            prompt_type='subject',
-            has_product=has_product
-        ).all()
-        body_var_settings = VariableSettings.query.filter_by(
-            prompt_type='body', 
-            has_product=has_product
-        ).all()
-        
-        subject_enabled_vars = {setting.variable_name: setting.is_enabled for setting in subject_var_settings}
-        body_enabled_vars = {setting.variable_name: setting.is_enabled for setting in body_var_settings}
-        
-        # Apply template parsing to system prompts
-        raw_subject_prompt = subject_prompt_obj.system_message if subject_prompt_obj else ""
-        raw_body_prompt = body_prompt_obj.system_message if body_prompt_obj else ""
-        
-        final_subject_prompt = parse_prompt_template(raw_subject_prompt, subject_enabled_vars)
-        final_body_prompt = parse_prompt_template(raw_body_prompt, body_enabled_vars)
-        
-        # Build profile content using dynamic template system
-        subject_profile_content = build_dynamic_prompt_content(lead, 'subject', has_product)
-        body_profile_content = build_dynamic_prompt_content(lead, 'body', has_product)
+        # Get system prompts, variable settings and user templates based on product selection
+        prompt_config = load_draft_prompt_config(has_product)
 
         logger.info(f"Making OpenAI API calls for {username}")
 
-        # Generate subject using appropriate prompt
-        subject_response = openai_client.chat.completions.create(
-            model="gpt-4o",
-            messages=[{
-                "role": "system",
-                "content": final_subject_prompt
-            }, {
-                "role": "user",
-                "content": subject_profile_content
-            }],
-            max_tokens=100,
-            temperature=0.7
-        )
-
-        # Generate body using appropriate prompt
-        body_response = openai_client.chat.completions.create(
-            model="gpt-4o",
-            messages=[{
-                "role": "system",
-                "content": final_body_prompt
-            }, {
-                "role": "user",
-                "content": body_profile_content
-            }],
-            max_tokens=500,
-            temperature=0.7
-        )
-
-        # Extract responses
-        subject_text = subject_response.choices[0].message.content.strip()
-        body_text = body_response.choices[0].message.content.strip()
+        # ?mode=combined|separate overrides DRAFT_GENERATION_MODE for comparisons
+        mode = request.args.get('mode', DRAFT_GENERATION_MODE)
+        subject_text, body_text, metrics = generate_draft(lead, prompt_config, mode)
 
-        logger.info(f"Generated content for {username}: subject={len(subject_text)} chars, body={len(body_text)} chars")
+        logger.info(f"Generated content for {username}: subject={len(subject_text)} chars, body={len(body_text)} chars, "
+                    f"{metrics['mode']} mode, {metrics['latency_ms']} ms, "
+                    f"{metrics['prompt_tokens'] + metrics['completion_tokens']} tokens")
 
         # Update lead
         lead.subject = subject_text
@@ -2343,7 +4092,8 @@ def draft_email(username):
 
         return {
             "subject": subject_text,
-            "body": body_text
+            "body": body_text,
+            "metrics": metrics
         }
 
     except Exception as e:
@@ -2351,6 +4101,317 @@ def draft_email(username):
         return {"error": f"Failed to generate email: {str(e)}"}, 500
 
 
+def stream_draft_part(part, messages, events, cancelled):
+    """Stream one drafted part from OpenAI, putting (kind, part, value) tuples on the events queue"""
+    try:
+        stream = openai_client.chat.completions.create(
+            model="gpt-4o",
+            messages=messages,
+            max_tokens=DRAFT_MAX_TOKENS[part],
+            temperature=0.7,
+            stream=True,
+            stream_options={"include_usage": True}
+        )
+        try:
+            for chunk in stream:
+                if cancelled.is_set():
+                    break
+                if chunk.choices and chunk.choices[0].delta.content:
+                    events.put(('delta', part, chunk.choices[0].delta.content))
+                if chunk.usage:
+                    events.put(('usage', part, chunk.usage))
+        finally:
+            stream.close()
+        events.put(('end', part, None))
+    except Exception as e:
+        events.put(('error', part, e))
+
+
+def draft_event_stream(lead_id, username, messages):
+    """Yield SSE messages relaying subject and body token deltas, then save the draft and send 'done'"""
+    events = queue.Queue()
+    cancelled = threading.Event()
+    started = time.perf_counter()
+    first_token_ms = None
+    texts = {part: '' for part in messages}
+    usage = {'prompt_tokens': 0, 'completion_tokens': 0}
+    pending = set(messages)
+
+    # Subject and body stream in parallel
+    for part, part_messages in messages.items():
+        threading.Thread(target=stream_draft_part, args=(part, part_messages, events, cancelled),
+                         daemon=True).start()
+
+    try:
+        yield format_sse('start', {'username': username})
+        while pending:
+            try:
+                kind, part, value = events.get(timeout=JOB_EVENT_KEEPALIVE_SECONDS)
+            except queue.Empty:
+                yield ': keepalive\n\n'
+                continue
+
+            if kind == 'delta':
+                if first_token_ms is None:
+                    first_token_ms = int((time.perf_counter() - started) * 1000)
+                texts[part] += value
+                yield format_sse('delta', {'part': part, 'text': value})
+            elif kind == 'usage':
+                usage['prompt_tokens'] += value.prompt_tokens
+                usage['completion_tokens'] += value.completion_tokens
+            elif kind == 'end':
+                pending.discard(part)
+            else:
+                logger.error(f"Streaming email generation failed for {username}: {value}")
+                yield format_sse('failed', {'error': f"Failed to generate email: {value}"})
+                return
+
+        subject_text = texts['subject'].strip()
+        body_text = texts['body'].strip()
+        lead = Lead.query.get(lead_id)
+        lead.subject = subject_text
+        lead.email_body = body_text
+        lead.updated_at = datetime.utcnow()
+        db.session.commit()
+
+        metrics = dict(usage, mode='stream', calls=len(messages), first_token_ms=first_token_ms or 0,
+                       latency_ms=int((time.perf_counter() - started) * 1000))
+        draft_stats.record('stream', metrics)
+        logger.info(f"Streamed content for {username}: subject={len(subject_text)} chars, body={len(body_text)} chars, "
+                    f"first token after {metrics['first_token_ms']} ms, done after {metrics['latency_ms']} ms")
+        yield format_sse('done', {'subject': subject_text, 'body': body_text, 'metrics': metrics})
+    finally:
+        # Stops the OpenAI streams early when the browser goes away
+        cancelled.set()
+
+
+@app.route('/draft-email/<username>/stream', methods=['GET'])
+@login_required
+def stream_draft_email(username):
+    """Generate an email draft, relaying token deltas over Server-Sent Events as they arrive"""
+    lead = Lead.query.options(db.joinedload(Lead.selected_product)).filter_by(username=username).first()
+    if not lead:
+        logger.error(f"Lead not found: {username}")
+        return {"error": "Lead not found"}, 404
+
+    # Messages are built here so the streaming threads never touch the database session
+    prompt_config = load_draft_prompt_config(lead.selected_product is not None)
+    messages = {part: build_draft_messages(lead, part, prompt_config) for part in ('subject', 'body')}
+
+    return event_stream_response(draft_event_stream(lead.id, username, messages))
+
+
+# Bulk drafting: leads drafted at once, attempts per OpenAI call and leads per commit
+DRAFT_CONCURRENCY = int(os.environ.get('DRAFT_CONCURRENCY', 8))
+DRAFT_MAX_ATTEMPTS = int(os.environ.get('DRAFT_MAX_ATTEMPTS', 3))
+DRAFT_RETRY_BASE_SECONDS = 2.0
+DRAFT_COMMIT_BATCH_SIZE = int(os.environ.get('DRAFT_COMMIT_BATCH_SIZE', 25))
+DRAFT_RETRYABLE_ERRORS = (APIConnectionError, APITimeoutError, InternalServerError, RateLimitError)
+
+
+def select_draft_lead_ids(lead_ids=None, hashtag=None, only_missing=True, with_email=False):
+    """IDs of unsent leads matching a bulk drafting request, in ID order"""
+    from sqlalchemy import or_
+
+    query = db.session.query(Lead.id).filter(Lead.sent.isnot(True))
+    if lead_ids:
+        query = query.filter(Lead.id.in_(lead_ids))
+    if hashtag:
+        query = query.filter(Lead.hashtag == hashtag)
+    if only_missing:
+        query = query.filter(or_(Lead.email_body.is_(None), Lead.email_body == ''))
+    if with_email:
+        query = query.filter(Lead.email.isnot(None), Lead.email != '')
+    return [row.id for row in query.order_by(Lead.id)]
+
+
+def build_draft_requests(lead_ids, prompt_configs):
+    """Build subject and body messages for a chunk of leads; prompt configs are loaded once per run"""
+    with app.app_context():
+        leads = Lead.query.options(db.joinedload(Lead.selected_product)).filter(Lead.id.in_(lead_ids)).all()
+        draft_requests = []
+        for lead in leads:
+            has_product = lead.selected_product is not None
+            if has_product not in prompt_configs:
+                prompt_configs[has_product] = load_draft_prompt_config(has_product)
+            config = prompt_configs[has_product]
+            draft_requests.append((lead.id, lead.username,
+                             build_draft_messages(lead, 'subject', config),
+                             build_draft_messages(lead, 'body', config)))
+        return draft_requests
+
+
+def save_drafts(drafts, only_missing=True):
+    """Write {lead_id: (subject, body)} in one transaction and push the updated rows to the job stream.
+
+    Leads are re-checked under a row lock, so a lead sent, or drafted by hand (with only_missing), while its
+    draft was being generated keeps what it has. Returns the number of drafts written.
+    """
+    from sqlalchemy import or_, update
+
+    if not drafts:
+        return 0
+    now = datetime.utcnow()
+    with app.app_context():
+        eligible = db.session.query(Lead.id).filter(Lead.id.in_(list(drafts)), Lead.sent.isnot(True))
+        if only_missing:
+            eligible = eligible.filter(or_(Lead.email_body.is_(None), Lead.email_body == ''))
+        eligible_ids = [row.id for row in eligible.with_for_update()]
+        if eligible_ids:
+            db.session.execute(update(Lead), [
+                {'id': lead_id, 'subject': drafts[lead_id][0], 'email_body': drafts[lead_id][1], 'updated_at': now}
+                for lead_id in eligible_ids
+            ])
+        db.session.commit()
+        if len(eligible_ids) < len(drafts):
+            logger.info(f"Skipped {len(drafts) - len(eligible_ids)} drafts for leads sent or drafted in the meantime")
+        if eligible_ids:
+            leads = Lead.query.filter(Lead.id.in_(eligible_ids)).all()
+            job_state.publish_leads([lead.to_dict() for lead in leads])
+        return len(eligible_ids)
+
+
+async def acreate_draft_text(client, messages, max_tokens):
+    """One paced chat completion, retried with exponential backoff on rate limits and transient errors"""
+    openai_bucket = pacer.provider('openai')
+    for attempt in range(1, DRAFT_MAX_ATTEMPTS + 1):
+        await openai_bucket.acquire()
+        try:
+            response = await client.chat.completions.create(
+                model="gpt-4o",
+                messages=messages,
+                max_tokens=max_tokens,
+                temperature=0.7
+            )
+            openai_bucket.record_outcome(True)
+            return response.choices[0].message.content.strip()
+        except DRAFT_RETRYABLE_ERRORS as e:
+            openai_bucket.record_outcome(False, blocked=isinstance(e, RateLimitError))
+            if attempt == DRAFT_MAX_ATTEMPTS:
+                raise
+            delay = DRAFT_RETRY_BASE_SECONDS * 2 ** (attempt - 1)
+            logger.warning(f"OpenAI call failed ({e.__class__.__name__}), retrying in {delay:.0f}s "
+                           f"(attempt {attempt}/{DRAFT_MAX_ATTEMPTS})")
+            await asyncio.sleep(delay)
+
+
+async def generate_drafts_async(lead_ids, concurrency=DRAFT_CONCURRENCY, only_missing=True):
+    """Draft subject and body for many leads with bounded concurrency, committing one chunk at a time"""
+    # Retries are handled in acreate_draft_text so they go through the pacer
+    client = AsyncOpenAI(api_key=os.environ.get("OPENAI_API_KEY"), max_retries=0,
+                         http_client=provider_clients.async_client('openai'))
+    semaphore = asyncio.Semaphore(concurrency)
+    prompt_configs = {}
+    drafted = 0
+    failed = 0
+    skipped = 0  # Sent or drafted elsewhere while their draft was generated
+    start_time = time.time()
+
+    job_state.set_progress({
+        'current_step': f'Erstelle E-Mail-Entwürfe für {len(lead_ids)} Leads...',
+        'phase': 'drafting',
+        'total_steps': len(lead_ids),
+        'completed_steps': 0,
+        'estimated_time_remaining': 0,
+        'drafted': 0,
+        'failed': 0
+    })
+
+    async def draft_lead(lead_id, username, subject_messages, body_messages):
+        async with semaphore:
+            subject_text, body_text = await asyncio.gather(
+                acreate_draft_text(client, subject_messages, DRAFT_MAX_TOKENS['subject']),
+                acreate_draft_text(client, body_messages, DRAFT_MAX_TOKENS['body']))
+        logger.info(f"Generated content for {username}: subject={len(subject_text)} chars, body={len(body_text)} chars")
+        return subject_text, body_text
+
+    for start in range(0, len(lead_ids), DRAFT_COMMIT_BATCH_SIZE):
+        if job_state.stop_requested():
+            logger.info(f"Drafting stopped by user after {drafted} drafts")
+            job_state.update_progress(final_status='stopped')
+            break
+
+        draft_requests = await asyncio.to_thread(build_draft_requests, lead_ids[start:start + DRAFT_COMMIT_BATCH_SIZE],
+                                           prompt_configs)
+        results = await asyncio.gather(*(draft_lead(*draft_request) for draft_request in draft_requests),
+                                       return_exceptions=True)
+
+        drafts = {}
+        for (lead_id, username, _, _), result in zip(draft_requests, results):
+            if isinstance(result, Exception):
+                logger.error(f"Email generation failed for {username}: {result}")
+                failed += 1
+            else:
+                drafts[lead_id] = result
+        saved = await asyncio.to_thread(save_drafts, drafts, only_missing)
+        drafted += saved
+        skipped += len(drafts) - saved
+
+        done = drafted + failed + skipped
+        elapsed = time.time() - start_time
+        job_state.update_progress(
+            current_step=f'Entwürfe: {done}/{len(lead_ids)} verarbeitet, {drafted} erstellt',
+            completed_steps=done,
+            drafted=drafted,
+            failed=failed,
+            estimated_time_remaining=int(elapsed / done * (len(lead_ids) - done)) if done else 0)
+    else:
+        job_state.set_progress({
+            'current_step': f'Fertig! {drafted} Entwürfe erstellt ✓',
+            'phase': 'completed',
+            'total_steps': 0,
+            'completed_steps': 0,
+            'estimated_time_remaining': 0,
+            'drafted': drafted,
+            'failed': failed,
+            'final_status': 'success'
+        })
+
+    logger.info(f"Bulk drafting complete: {drafted} drafted, {failed} failed, {skipped} skipped of {len(lead_ids)} leads")
+    return {'total': len(lead_ids), 'drafted': drafted, 'failed': failed, 'skipped': skipped}
+
+
+def run_drafting_job(payload, job_id):
+    """Job handler: draft emails for the leads selected by ID list or filter"""
+    with app.app_context():
+        lead_ids = select_draft_lead_ids(payload.get('lead_ids'), payload.get('hashtag'),
+                                         payload.get('only_missing', True), payload.get('with_email', False))
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        return loop.run_until_complete(
+            generate_drafts_async(lead_ids, payload.get('concurrency') or DRAFT_CONCURRENCY,
+                                  payload.get('only_missing', True)))
+    finally:
+        loop.run_until_complete(provider_clients.aclose_loop())
+        loop.close()
+
+
+job_queue.register('drafting', run_drafting_job)
+
+
+@app.route('/api/drafts/bulk', methods=['POST'])
+@login_required
+def bulk_draft_emails():
+    """Queue email drafting for a list of lead IDs or all leads matching a filter"""
+    data = request.get_json() or {}
+    lead_ids = data.get('lead_ids')
+    if lead_ids is not None and (not isinstance(lead_ids, list) or
+                                 not all(isinstance(lead_id, int) for lead_id in lead_ids)):
+        return jsonify({"error": "lead_ids must be a list of lead IDs"}), 400
+    if not lead_ids and not data.get('hashtag') and not data.get('all'):
+        return jsonify({"error": "Provide lead_ids, a hashtag or all=true"}), 400
+
+    job_id = job_queue.enqueue('drafting', {
+        'lead_ids': lead_ids,
+        'hashtag': data.get('hashtag'),
+        'only_missing': bool(data.get('only_missing', True)),
+        'with_email': bool(data.get('with_email', False))
+    }, user_id=session.get('user_id'))
+
+    return {"success": True, "job_id": job_id, "phase": "drafting"}, 202
+
+
 @app.route('/get-email/<username>')
 @login_required
 def get_email(username):
@@ -2589,8 +4650,6 @@ def clear_data():
         ProcessingSession.query.delete()
         HashtagUsernamePair.query.delete()
         db.session.commit()
-
-        app_data['processing_status'] = None
         return {"success": True}
     except Exception as e:
         logger.error(f"Failed to clear data: {e}")
@@ -2609,63 +4668,11 @@ def clear_data():
 def get_system_prompts():
     """Get system prompts, user prompts, and variable settings"""
     try:
-        # Get all system prompts
-        system_prompts = SystemPrompt.query.all()
-        user_prompts = UserPrompt.query.all()
-        variable_settings = VariableSettings.query.all()
-        
-        # Organize system prompts by type and has_product
-        result = {
-            'with_product': {
-                'subject': '',
-                'body': ''
-            },
-            'without_product': {
-                'subject': '',
-                'body': ''
-            }
-        }
-        
-        for prompt in system_prompts:
-            key = 'with_product' if prompt.has_product else 'without_product'
-            result[key][prompt.prompt_type] = prompt.system_message
-        
-        # Organize user prompts
-        user_templates = {
-            'with_product': {
-                'subject': '',
-                'body': ''
-            },
-            'without_product': {
-                'subject': '',
-                'body': ''
-            }
-        }
-        
-        for prompt in user_prompts:
-            key = 'with_product' if prompt.has_product else 'without_product'
-            user_templates[key][prompt.prompt_type] = prompt.user_message
-        
-        # Organize variable settings
-        variable_settings_result = {
-            'with_product': {
-                'subject': {},
-                'body': {}
-            },
-            'without_product': {
-                'subject': {},
-                'body': {}
-            }
-        }
-        
-        for setting in variable_settings:
-            key = 'with_product' if setting.has_product else 'without_product'
-            variable_settings_result[key][setting.prompt_type][setting.variable_name] = setting.is_enabled
-        
-        result['user_templates'] = user_templates
-        result['variable_settings'] = variable_settings_result
-        
-        return jsonify(result)
+        snapshot = prompt_configs.get()
+        response = jsonify(dict(snapshot.settings, version=snapshot.version))
+        # Clients sending the version back in If-None-Match get a 304 while prompts are unchanged
+        response.set_etag(snapshot.version)
+        return response.make_conditional(request)
     except Exception as e:
         logger.error(f"Failed to get system prompts: {e}")
         return jsonify({"error": "Failed to get system prompts"}), 500
@@ -2752,10 +4759,12 @@ def save_system_prompts():
                     db.session.add(new_setting)
         
         db.session.commit()
+        snapshot = prompt_configs.reload()
         
         return jsonify({
             "success": True,
-            "message": "Prompts and variable settings saved successfully"
+            "message": "Prompts and variable settings saved successfully",
+            "version": snapshot.version
         })
     except Exception as e:
         logger.error(f"Failed to save system prompts: {e}")
@@ -2946,42 +4955,7 @@ def get_workspace_data(lead_id):
         products = Product.query.all()
         
         # Get prompt settings
-        system_prompts = SystemPrompt.query.all()
-        user_prompts = UserPrompt.query.all()
-        variable_settings = VariableSettings.query.all()
-        
-        # Organize prompt settings
-        prompt_settings = {
-            'with_product': {'subject': '', 'body': ''},
-            'without_product': {'subject': '', 'body': ''}
-        }
-        
-        for prompt in system_prompts:
-            key = 'with_product' if prompt.has_product else 'without_product'
-            prompt_settings[key][prompt.prompt_type] = prompt.system_message
-        
-        # Organize user templates
-        user_templates = {
-            'with_product': {'subject': '', 'body': ''},
-            'without_product': {'subject': '', 'body': ''}
-        }
-        
-        for prompt in user_prompts:
-            key = 'with_product' if prompt.has_product else 'without_product'
-            user_templates[key][prompt.prompt_type] = prompt.user_message
-        
-        # Organize variable settings
-        variable_settings_result = {
-            'with_product': {'subject': {}, 'body': {}},
-            'without_product': {'subject': {}, 'body': {}}
-        }
-        
-        for setting in variable_settings:
-            key = 'with_product' if setting.has_product else 'without_product'
-            variable_settings_result[key][setting.prompt_type][setting.variable_name] = setting.is_enabled
-        
-        prompt_settings['user_templates'] = user_templates
-        prompt_settings['variable_settings'] = variable_settings_result
+        prompt_snapshot = prompt_configs.get()
         
         # Get lead dict and add selected product info
         lead_dict = lead.to_dict()
@@ -2994,7 +4968,8 @@ def get_workspace_data(lead_id):
             'success': True,
             'lead': lead_dict,
             'products': [product.to_dict() for product in products],
-            'promptSettings': prompt_settings
+            'promptSettings': prompt_snapshot.settings,
+            'promptVersion': prompt_snapshot.version
         })
         
     except Exception as e:
@@ -3080,10 +5055,12 @@ def save_prompt():
                     db.session.add(new_setting)
         
         db.session.commit()
+        snapshot = prompt_configs.reload()
         
         return jsonify({
             "success": True,
-            "message": "Prompt settings saved successfully"
+            "message": "Prompt settings saved successfully",
+            "version": snapshot.version
         })
         
     except Exception as e:
@@ -3272,4 +5249,5 @@ def inject_user_info():
     }
 
 if __name__ == '__main__':
+    job_queue.start_workers()
     app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
@@ -7,6 +7,7 @@ import qrcode
 import qrcode.constants
 import io
 import base64
+import json
 import secrets
 
 
@@ -180,6 +181,7 @@ class Lead(db.Model):
     email = db.Column(db.String(200))
     phone = db.Column(db.String(50))
     website = db.Column(db.String(200))
+    contact_confidence = db.Column(db.Text)  # JSON {field: {"value", "confidence", "source"}} from the resolver cascade
     followers_count = db.Column(db.Integer, default=0)
     following_count = db.Column(db.Integer, default=0)
     posts_count = db.Column(db.Integer, default=0)
@@ -217,6 +219,10 @@ class Lead(db.Model):
     # Composite unique constraint to prevent duplicates
     __table_args__ = (db.UniqueConstraint('username', 'hashtag', name='unique_username_hashtag'),)
     
+    def get_contact_confidence(self):
+        """Return the per-field contact entries as a dict"""
+        return json.loads(self.contact_confidence) if self.contact_confidence else {}
+    
     def to_dict(self):
         """Convert Lead object to dictionary for JSON serialization"""
         return {
@@ -229,6 +235,7 @@ class Lead(db.Model):
             'email': self.email,
             'phone': self.phone,
             'website': self.website,
+            'contactConfidence': self.get_contact_confidence(),
             'followersCount': self.followers_count,
             'followers_count': self.followers_count,  # Add snake_case alias for compatibility
             'followingCount': self.following_count,
@@ -353,6 +360,211 @@ class LeadBackup(db.Model):
         }
 
 
+class LeadBackupDelta(db.Model):
+    """Change-only backup of Lead data - each version stores just the fields that changed"""
+    id = db.Column(db.Integer, primary_key=True)
+    original_lead_id = db.Column(db.Integer)
+    username = db.Column(db.String(100), nullable=False)
+    hashtag = db.Column(db.String(100), nullable=False)
+    version = db.Column(db.Integer, nullable=False)
+    changes = db.Column(db.Text, nullable=False)  # JSON object of changed field -> new value
+    backup_created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    # Versions are numbered per username/hashtag so history survives /clear re-creating the lead
+    __table_args__ = (db.UniqueConstraint('username', 'hashtag', 'version', name='unique_lead_backup_version'),)
+    
+    TRACKED_FIELDS = (
+        'full_name', 'bio', 'email', 'phone', 'website',
+        'followers_count', 'following_count', 'posts_count',
+        'is_verified', 'is_business', 'profile_pic_url', 'is_duplicate',
+        'source_timestamp', 'source_post_url', 'beitragstext',
+        'address_street', 'city_name', 'zip', 'latitude', 'longitude',
+        'subject', 'email_body', 'sent', 'sent_at', 'selected_product_id'
+    )
+    
+    @classmethod
+    def snapshot(cls, lead):
+        """Return the tracked fields of a lead as a JSON-serializable dict"""
+        state = {}
+        for field in cls.TRACKED_FIELDS:
+            value = getattr(lead, field)
+            state[field] = value.isoformat() if isinstance(value, datetime) else value
+        return state
+    
+    @staticmethod
+    def diff(previous_state, current_state):
+        """Return the fields of current_state whose value differs from previous_state (missing counts as None)"""
+        return {
+            field: value
+            for field, value in current_state.items()
+            if previous_state.get(field) != value
+        }
+    
+    @classmethod
+    def fold(cls, deltas, version=None):
+        """Rebuild the lead state by applying deltas in version order up to and including version"""
+        state = dict.fromkeys(cls.TRACKED_FIELDS)
+        for delta in sorted(deltas, key=lambda d: d.version):
+            if version is not None and delta.version > version:
+                break
+            state.update(json.loads(delta.changes))
+        return state
+    
+    def to_dict(self):
+        """Convert LeadBackupDelta object to dictionary"""
+        return {
+            'id': self.id,
+            'original_lead_id': self.original_lead_id,
+            'username': self.username,
+            'hashtag': self.hashtag,
+            'version': self.version,
+            'changes': json.loads(self.changes),
+            'backup_created_at': self.backup_created_at.isoformat() if self.backup_created_at else None
+        }
+
+
+class ProfileSnapshot(db.Model):
+    """Cached raw Apify profile payloads, shared across keywords and processing runs"""
+    id = db.Column(db.Integer, primary_key=True)
+    username = db.Column(db.String(100), nullable=False, unique=True)
+    payload = db.Column(db.Text, nullable=False)  # JSON profile item as returned by the Apify actor
+    fetched_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    
+    def get_payload(self):
+        """Return the stored Apify profile item as a dict"""
+        try:
+            return json.loads(self.payload)
+        except (json.JSONDecodeError, TypeError):
+            return {}
+    
+    def to_dict(self):
+        """Convert ProfileSnapshot object to dictionary"""
+        return {
+            'id': self.id,
+            'username': self.username,
+            'payload': self.get_payload(),
+            'fetched_at': self.fetched_at.isoformat() if self.fetched_at else None
+        }
+
+
+class ContactLookupCache(db.Model):
+    """Cached Perplexity contact lookups keyed by a hash of the profile description sent"""
+    id = db.Column(db.Integer, primary_key=True)
+    cache_key = db.Column(db.String(64), nullable=False, unique=True)  # sha256 of model + profile description
+    username = db.Column(db.String(100))
+    response = db.Column(db.Text, nullable=False)  # JSON contact info as returned by the API
+    is_negative = db.Column(db.Boolean, default=False, nullable=False)  # True when nothing was found
+    hit_count = db.Column(db.Integer, default=0, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False)
+    last_used_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)  # LRU eviction order
+    
+    def get_response(self):
+        """Return the cached contact info as a dict"""
+        try:
+            return json.loads(self.response)
+        except (json.JSONDecodeError, TypeError):
+            return {}
+    
+    def to_dict(self):
+        """Convert ContactLookupCache object to dictionary"""
+        return {
+            'id': self.id,
+            'username': self.username,
+            'response': self.get_response(),
+            'is_negative': self.is_negative,
+            'hit_count': self.hit_count,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'expires_at': self.expires_at.isoformat() if self.expires_at else None,
+            'last_used_at': self.last_used_at.isoformat() if self.last_used_at else None
+        }
+
+
+class ApifyRun(db.Model):
+    """Apify actor runs started by the app, recorded against the job that started them"""
+    id = db.Column(db.Integer, primary_key=True)
+    run_id = db.Column(db.String(64), nullable=False, unique=True)  # Apify run ID
+    actor_id = db.Column(db.String(100), nullable=False)
+    job_id = db.Column(db.String(200), index=True)  # e.g. 'discovery:<keyword>' or 'enrichment:<keyword>'
+    status = db.Column(db.String(20), nullable=False, default='READY')  # Apify run status
+    dataset_id = db.Column(db.String(64))  # Default dataset the run writes its results to
+    started_at = db.Column(db.DateTime, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime)
+
+    def to_dict(self):
+        """Convert ApifyRun object to dictionary"""
+        return {
+            'id': self.id,
+            'run_id': self.run_id,
+            'actor_id': self.actor_id,
+            'job_id': self.job_id,
+            'status': self.status,
+            'dataset_id': self.dataset_id,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+
+
+class Job(db.Model):
+    """Durable background job queue entry, claimed by workers through a renewable lease"""
+    id = db.Column(db.Integer, primary_key=True)
+    job_type = db.Column(db.String(50), nullable=False)  # 'discovery', 'enrichment' or 'drafting'
+    payload = db.Column(db.Text, nullable=False)  # JSON arguments for the job handler
+    status = db.Column(db.String(20), nullable=False, default='queued', index=True)  # queued, running, completed, failed
+    priority = db.Column(db.Integer, default=0, nullable=False)  # Higher is claimed first; background work is negative
+    result = db.Column(db.Text)  # JSON result returned by the job handler
+    progress = db.Column(db.Text)  # JSON progress snapshot, written through by the worker running the job
+    error_message = db.Column(db.Text)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)  # User who enqueued the job
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    lease_owner = db.Column(db.String(200))  # Worker currently holding the job
+    lease_expires_at = db.Column(db.DateTime)  # Other workers may reclaim the job after this
+    heartbeat_at = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+    def get_payload(self):
+        """Return the job arguments as a dict"""
+        try:
+            return json.loads(self.payload)
+        except (json.JSONDecodeError, TypeError):
+            return {}
+
+    def get_result(self):
+        """Return the job result as a dict, or None while the job has none"""
+        if not self.result:
+            return None
+        try:
+            return json.loads(self.result)
+        except (json.JSONDecodeError, TypeError):
+            return None
+
+    def get_progress(self):
+        """Return the last persisted progress as a dict"""
+        try:
+            return json.loads(self.progress) if self.progress else {}
+        except (json.JSONDecodeError, TypeError):
+            return {}
+
+    def to_dict(self):
+        """Convert Job object to dictionary (the payload is omitted, it may hold session cookies)"""
+        return {
+            'id': self.id,
+            'job_type': self.job_type,
+            'status': self.status,
+            'result': self.get_result(),
+            'error_message': self.error_message,
+            'attempts': self.attempts,
+            'priority': self.priority,
+            'lease_owner': self.lease_owner,
+            'heartbeat_at': self.heartbeat_at.isoformat() if self.heartbeat_at else None,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+
+
 class ProcessingSession(db.Model):
     """Model for tracking processing sessions"""
     id = db.Column(db.Integer, primary_key=True)
@@ -365,6 +577,26 @@ class ProcessingSession(db.Model):
     completed_at = db.Column(db.DateTime)
     error_message = db.Column(db.Text)
     
+    # Enrichment checkpoint: the planned batches and which of them are saved, so a restarted job resumes
+    job_id = db.Column(db.Integer, db.ForeignKey('job.id'), nullable=True, unique=True)
+    batch_plan = db.Column(db.Text)  # JSON list of username batches, fixed when the run starts
+    completed_batches = db.Column(db.Text)  # JSON list of indices into batch_plan that are persisted
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def get_batch_plan(self):
+        """Return the planned username batches as a list of lists"""
+        try:
+            return json.loads(self.batch_plan) if self.batch_plan else []
+        except (json.JSONDecodeError, TypeError):
+            return []
+    
+    def get_completed_batches(self):
+        """Return the set of completed batch indices"""
+        try:
+            return set(json.loads(self.completed_batches)) if self.completed_batches else set()
+        except (json.JSONDecodeError, TypeError):
+            return set()
+    
     def to_dict(self):
         """Convert ProcessingSession object to dictionary"""
         return {
@@ -373,6 +605,9 @@ class ProcessingSession(db.Model):
             'search_limit': self.search_limit,
             'status': self.status,
             'leads_found': self.leads_found,
+            'job_id': self.job_id,
+            'total_batches': len(self.get_batch_plan()),
+            'completed_batches': len(self.get_completed_batches()),
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'completed_at': self.completed_at.isoformat() if self.completed_at else None,
             'error_message': self.error_message
@@ -239,8 +239,8 @@ function optimizeMobileInputs() {
             if (e.target.id === 'searchLimitInput') {
                 if (value < 1) {
                     e.target.value = 1;
-                } else if (value > 50) {
-                    e.target.value = 50;
+                } else if (value > 5000) {
+                    e.target.value = 5000;
                 }
             }
         });
@@ -578,8 +578,8 @@ async function processKeyword() {
     }
     
     // Validate search limit
-    if (searchLimit < 1 || searchLimit > 50) {
-        showToast('Suchlimit muss zwischen 1 und 50 liegen (Speichersicherheit)', 'error');
+    if (searchLimit < 1 || searchLimit > 5000) {
+        showToast('Suchlimit muss zwischen 1 und 5000 liegen', 'error');
         return;
     }
     
@@ -606,9 +606,6 @@ async function processKeyword() {
     // Reset previous lead count for new processing run
     previousLeadCount = 0;
     
-    // Start progress polling
-    const progressInterval = setInterval(updateProgress, 2000);
-    
     try {
         const response = await fetch('/process', {
             method: 'POST',
@@ -616,41 +613,26 @@ async function processKeyword() {
             body: JSON.stringify({ 
                 keyword: keyword,
                 searchLimit: searchLimit
-            }),
-            timeout: 7320000 // 2h 2min timeout to match gunicorn (2h timeout)
+            })
         });
         
-        clearInterval(progressInterval);
-        
         if (response.ok) {
-            const result = await response.json();
-            console.log('Process response:', result); // Debug log
-            if (result.success && result.phase === 'hashtag_selection') {
-                // Handle hashtag selection phase
-                clearInterval(progressInterval);
-                showHashtagSelection(result.hashtag_variants);
-                showToast(`Found ${result.hashtag_variants.length} hashtag variants`, 'success');
-            } else if (result.success && result.leads) {
-                displayResults(result.leads);
-                showToast(`Successfully generated ${result.leads.length} leads`, 'success');
+            const started = await response.json();
+            console.log('Process response:', started); // Debug log
+            // Hashtag discovery runs as a background job - wait for its result
+            const job = await waitForJob(started.job_id);
+            if (job.status === 'completed' && job.result && job.result.hashtag_variants) {
+                currentDiscoveryJobId = job.id;
+                showHashtagSelection(job.result.hashtag_variants);
+                showToast(`Found ${job.result.hashtag_variants.length} hashtag variants`, 'success');
             } else {
-                showToast(result.message || 'No leads found', 'warning');
-            }
-        } else if (response.status === 206) {
-            // Partial success - some leads generated but process failed
-            const result = await response.json();
-            if (result.leads && result.leads.length > 0) {
-                displayResults(result.leads);
-                showToast(`Process partially failed but saved ${result.partial_count} leads. Error: ${result.error}`, 'warning');
-            } else {
-                showToast(`Process failed: ${result.error}`, 'error');
+                showToast(job.error_message || 'Failed to process keyword', 'error');
             }
         } else {
             const error = await response.json();
             showToast(error.error || 'Failed to process keyword', 'error');
         }
     } catch (error) {
-        clearInterval(progressInterval);
         console.error('Processing error:', error);
         if (error.name === 'AbortError') {
             showToast('Anfrage ist abgelaufen. Bitte versuche es mit einem kleineren Suchlimit erneut.', 'error');
@@ -666,6 +648,62 @@ async function processKeyword() {
     }
 }
 
+// Discovery job whose hashtag variants are shown for selection
+let currentDiscoveryJobId = null;
+
+// Job whose progress is shown in the processing status
+let currentJobId = null;
+let currentProgress = {};
+
+// Follow a background job over its Server-Sent Events stream until it has completed or failed
+function waitForJob(jobId) {
+    currentJobId = jobId;
+    currentProgress = {};
+    return new Promise((resolve, reject) => {
+        // EventSource reconnects on its own and resumes from the last event it received
+        const source = new EventSource(`/api/jobs/${jobId}/events`);
+        
+        source.addEventListener('snapshot', (event) => {
+            currentProgress = JSON.parse(event.data);
+            renderProgress(currentProgress);
+        });
+        source.addEventListener('progress', (event) => {
+            Object.assign(currentProgress, JSON.parse(event.data));
+            renderProgress(currentProgress);
+        });
+        source.addEventListener('leads', (event) => {
+            mergeSavedLeads(JSON.parse(event.data));
+        });
+        source.addEventListener('done', (event) => {
+            source.close();
+            resolve(JSON.parse(event.data));
+        });
+        source.onerror = () => {
+            // A refused (503) or dropped stream is not retried by EventSource, so poll the job instead
+            if (source.readyState === EventSource.CLOSED) {
+                pollJob(jobId, (polled) => {
+                    currentProgress = polled;
+                    renderProgress(currentProgress);
+                }).then(resolve, reject);
+            }
+        };
+    });
+}
+
+// Insert or update lead rows pushed by the job stream
+function mergeSavedLeads(savedLeads) {
+    const merged = [...leads];
+    savedLeads.forEach(savedLead => {
+        const index = merged.findIndex(lead => lead.id === savedLead.id);
+        if (index >= 0) {
+            merged[index] = savedLead;
+        } else {
+            merged.unshift(savedLead);
+        }
+    });
+    displayResults(merged);
+}
+
 // Track previous lead count to detect new leads
 let previousLeadCount = 0;
 
@@ -916,34 +954,31 @@ async function continueWithEnrichment() {
     document.getElementById('processingStatus').style.display = 'block';
     document.getElementById('statusText').textContent = '2. Starte Profil-Anreicherung...';
     
-    // Start progress polling
-    const progressInterval = setInterval(updateProgress, 2000);
-    
     try {
         const response = await fetch('/continue-enrichment', {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
             body: JSON.stringify({ 
-                selected_hashtags: selectedHashtags
-            }),
-            timeout: 7320000 // 2h 2min timeout
+                selected_hashtags: selectedHashtags,
+                job_id: currentDiscoveryJobId
+            })
         });
         
-        clearInterval(progressInterval);
-        
         if (response.ok) {
-            const result = await response.json();
-            if (result.success && result.leads) {
-                displayResults(result.leads);
-                showToast(`Successfully generated ${result.leads.length} leads`, 'success');
+            const started = await response.json();
+            // Enrichment runs as a background job - wait for it, then load the saved leads
+            const job = await waitForJob(started.job_id);
+            const leadsResponse = await fetch('/api/leads');
+            const leadsResult = leadsResponse.ok ? await leadsResponse.json() : {};
+            if (leadsResult.leads && leadsResult.leads.length > 0) {
+                displayResults(leadsResult.leads);
             } else {
-                // Even if no new leads, show existing data table
-                if (leads && leads.length > 0) {
-                    displayResults(leads);
-                } else {
-                    document.getElementById('emptyState').style.display = 'block';
-                }
-                showToast(result.message || 'No leads found', 'warning');
+                document.getElementById('emptyState').style.display = 'block';
+            }
+            if (job.status === 'completed') {
+                showToast(`Successfully generated ${job.result.lead_count} leads`, 'success');
+            } else {
+                showToast(job.error_message || 'Failed to enrich profiles', 'error');
             }
         } else {
             const error = await response.json();
@@ -956,7 +991,6 @@ async function continueWithEnrichment() {
             showToast(error.error || 'Failed to enrich profiles', 'error');
         }
     } catch (error) {
-        clearInterval(progressInterval);
         console.error('Enrichment error:', error);
         showToast(`Enrichment error: ${error.message || 'Unknown error'}`, 'error');
     } finally {
@@ -965,73 +999,55 @@ async function continueWithEnrichment() {
     }
 }
 
-// Update progress
-async function updateProgress() {
-    try {
-        const response = await fetch('/progress');
-        if (response.ok) {
-            const progress = await response.json();
-            
-            // Update status display with more detailed information
-            if (progress.current_step && progress.current_step.trim() !== '') {
-                document.getElementById('statusText').textContent = progress.current_step;
-                
-                // Ensure processing status is visible during processing
-                if (progress.phase && progress.phase !== 'completed') {
-                    document.getElementById('processingStatus').style.display = 'block';
-                }
-            }
-            
-
-            // Keep progress display simple - just show basic step information
-            let progressHTML = '';
-            
-            if (progress.total_steps > 0) {
-                const percentage = Math.round((progress.completed_steps / progress.total_steps) * 100);
-                progressHTML += `Fortschritt: ${progress.completed_steps}/${progress.total_steps} (${percentage}%)`;
-            }
-            
-            if (progressHTML) {
-                document.getElementById('progressText').innerHTML = progressHTML;
-            }
-            
-            // Handle incremental lead updates - detect when lead count changes
-            if (progress.incremental_leads !== undefined && progress.keyword) {
-                // Check if we have new leads (count increased) OR if we haven't refreshed yet
-                if (progress.incremental_leads > previousLeadCount || (progress.incremental_leads > 0 && previousLeadCount === 0)) {
-                    console.log(`New leads detected: ${progress.incremental_leads} (was ${previousLeadCount}) for keyword: ${progress.keyword}`);
-                    const newLeadsCount = progress.incremental_leads - previousLeadCount;
-                    previousLeadCount = progress.incremental_leads;
-                    
-                    // Show notification only for significant new leads (batches of 3 or more) and throttle notifications
-                    if (newLeadsCount >= 3) {
-                        const now = Date.now();
-                        // Only show notification if at least 3 seconds have passed since last notification
-                        if (now - lastNotificationTime > 3000) {
-                            const notificationText = `+${newLeadsCount} neue Leads generiert (${progress.incremental_leads} gesamt)`;
-                            showToast(notificationText, 'success');
-                            lastNotificationTime = now;
-                        }
-                    }
-                    
-                    // Always refresh the table when lead count changes
-                    await refreshLeadsTable(progress.keyword);
-                }
-            }
-            
-            // Handle completion status
-            if (progress.final_status === 'success' && progress.total_leads_generated !== undefined) {
-                showToast(`Erfolgreich ${progress.total_leads_generated} Leads generiert!`, 'success');
-                // Reset previous lead count for next run
-                previousLeadCount = 0;
-                resetProcessingUI();
-            } else if (progress.final_status === 'stopped') {
-                showToast('Verarbeitung gestoppt', 'warning');
-                resetProcessingUI();
+// Show job progress pushed by the event stream
+function renderProgress(progress) {
+    // Update status display with more detailed information
+    if (progress.current_step && progress.current_step.trim() !== '') {
+        document.getElementById('statusText').textContent = progress.current_step;
+        
+        // Ensure processing status is visible during processing
+        if (progress.phase && progress.phase !== 'completed') {
+            document.getElementById('processingStatus').style.display = 'block';
+        }
+    }
+    
+    // Keep progress display simple - just show basic step information
+    let progressHTML = '';
+    
+    if (progress.total_steps > 0) {
+        const percentage = Math.round((progress.completed_steps / progress.total_steps) * 100);
+        progressHTML += `Fortschritt: ${progress.completed_steps}/${progress.total_steps} (${percentage}%)`;
+    }
+    
+    if (progressHTML) {
+        document.getElementById('progressText').innerHTML = progressHTML;
+    }
+    
+    // Notify about new leads - the rows themselves arrive as 'leads' events
+    if (progress.incremental_leads !== undefined && progress.incremental_leads > previousLeadCount) {
+        const newLeadsCount = progress.incremental_leads - previousLeadCount;
+        previousLeadCount = progress.incremental_leads;
+        
+        // Show notification only for significant new leads (batches of 3 or more) and throttle notifications
+        if (newLeadsCount >= 3) {
+            const now = Date.now();
+            // Only show notification if at least 3 seconds have passed since last notification
+            if (now - lastNotificationTime > 3000) {
+                showToast(`+${newLeadsCount} neue Leads generiert (${progress.incremental_leads} gesamt)`, 'success');
+                lastNotificationTime = now;
             }
         }
-    } catch (error) {
-        console.error('Progress update error:', error);
+    }
+    
+    // Handle completion status
+    if (progress.final_status === 'success' && progress.total_leads_generated !== undefined) {
+        showToast(`Erfolgreich ${progress.total_leads_generated} Leads generiert!`, 'success');
+        // Reset previous lead count for next run
+        previousLeadCount = 0;
+        resetProcessingUI();
+    } else if (progress.final_status === 'stopped') {
+        showToast('Verarbeitung gestoppt', 'warning');
+        resetProcessingUI();
     }
 }
 
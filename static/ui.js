@@ -408,6 +408,26 @@ async function saveSessionId() {
     }
 }
 
+// Poll a background job until it has completed or failed; used when its event stream is refused or lost
+async function pollJob(jobId, onProgress, intervalMs = 2000) {
+    while (true) {
+        const [jobResponse, progressResponse] = await Promise.all([
+            fetch(`/api/jobs/${jobId}`),
+            fetch(`/progress?job_id=${jobId}`)
+        ]);
+        if (progressResponse.ok && onProgress) {
+            onProgress(await progressResponse.json());
+        }
+        if (jobResponse.ok) {
+            const job = await jobResponse.json();
+            if (job.status === 'completed' || job.status === 'failed') {
+                return job;
+            }
+        }
+        await new Promise(resolve => setTimeout(resolve, intervalMs));
+    }
+}
+
 async function processKeyword() {
     const keyword = document.getElementById('keywordInput').value.trim();
     const searchLimit = parseInt(document.getElementById('searchLimitInput').value) || 25;
@@ -417,8 +437,8 @@ async function processKeyword() {
         return;
     }
     
-    if (searchLimit < 1 || searchLimit > 50) {
-        showToast('Suchlimit muss zwischen 1 und 50 liegen (Speichersicherheit)', 'error');
+    if (searchLimit < 1 || searchLimit > 5000) {
+        showToast('Suchlimit muss zwischen 1 und 5000 liegen', 'error');
         return;
     }
     
@@ -432,55 +452,64 @@ async function processKeyword() {
     runButton.disabled = true;
     runButton.innerHTML = '<i class="fas fa-spinner fa-spin me-2"></i>Verarbeitung...';
     
-    // Start progress polling
-    let progressInterval = null;
-    const updateProgress = async () => {
-        try {
-            const progressResponse = await fetch('/progress');
-            if (progressResponse.ok) {
-                const progress = await progressResponse.json();
-                if (progress.total_steps > 0) {
-                    const percentage = Math.round((progress.completed_steps / progress.total_steps) * 100);
-                    const minutes = Math.floor(progress.estimated_time_remaining / 60);
-                    const seconds = progress.estimated_time_remaining % 60;
-                    statusText.innerHTML = `
-                        ${progress.current_step}<br>
-                        <small>Fortschritt: ${progress.completed_steps}/${progress.total_steps} (${percentage}%)</small><br>
-                        <small>Geschätzte Restzeit: ${minutes}m ${seconds}s</small>
-                    `;
-                }
-            }
-        } catch (error) {
-            console.log('Progress update error:', error);
+    // Render progress pushed by the job's event stream
+    let progress = {};
+    const renderProgress = () => {
+        if (progress.total_steps > 0) {
+            const percentage = Math.round((progress.completed_steps / progress.total_steps) * 100);
+            const minutes = Math.floor((progress.estimated_time_remaining || 0) / 60);
+            const seconds = (progress.estimated_time_remaining || 0) % 60;
+            statusText.innerHTML = `
+                ${progress.current_step}<br>
+                <small>Fortschritt: ${progress.completed_steps}/${progress.total_steps} (${percentage}%)</small><br>
+                <small>Geschätzte Restzeit: ${minutes}m ${seconds}s</small>
+            `;
         }
     };
-    
-    // Poll progress every 2 seconds
-    progressInterval = setInterval(updateProgress, 2000);
-    updateProgress(); // Initial update
+    let source = null;
     
     try {
-        // Add timeout to match backend timeout
-        const controller = new AbortController();
-        const timeoutId = setTimeout(() => controller.abort(), 7320000); // 2h 2min (slightly longer than backend's 2h)
-        
         const response = await fetch('/process', {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json'
             },
-            body: JSON.stringify({ keyword: keyword, searchLimit: searchLimit }),
-            signal: controller.signal
+            body: JSON.stringify({ keyword: keyword, searchLimit: searchLimit })
         });
         
-        clearTimeout(timeoutId);
-        clearInterval(progressInterval); // Stop progress polling
-        
         const result = await response.json();
         
         if (response.ok) {
-            displayResults(result.leads);
-            showToast(`${result.leads.length} Leads erfolgreich verarbeitet`, 'success');
+            const job = await new Promise((resolve, reject) => {
+                source = new EventSource(`/api/jobs/${result.job_id}/events`);
+                source.addEventListener('snapshot', (event) => {
+                    progress = JSON.parse(event.data);
+                    renderProgress();
+                });
+                source.addEventListener('progress', (event) => {
+                    Object.assign(progress, JSON.parse(event.data));
+                    renderProgress();
+                });
+                source.addEventListener('done', (event) => resolve(JSON.parse(event.data)));
+                source.onerror = () => {
+                    // A refused (503) or dropped stream is not retried by EventSource, so poll the job instead
+                    if (source.readyState === EventSource.CLOSED) {
+                        pollJob(result.job_id, (polled) => {
+                            progress = polled;
+                            renderProgress();
+                        }).then(resolve, reject);
+                    }
+                };
+            });
+            
+            if (job.status === 'completed') {
+                const leadsResponse = await fetch(`/api/leads?keyword=${encodeURIComponent(keyword)}`);
+                const leadsResult = await leadsResponse.json();
+                displayResults(leadsResult.leads);
+                showToast(`${(leadsResult.leads || []).length} Leads erfolgreich verarbeitet`, 'success');
+            } else {
+                showToast(job.error_message || 'Processing failed', 'error');
+            }
         } else {
             const errorMessage = result.error || 'Processing failed';
             console.error('Server error response:', result);
@@ -493,9 +522,7 @@ async function processKeyword() {
         }
     } catch (error) {
         console.error('Error processing keyword:', error);
-        if (error.name === 'AbortError') {
-            showToast('Anfrage ist abgelaufen. Bitte versuche es mit einem kleineren Suchlimit erneut.', 'error');
-        } else if (error.message && error.message.includes('fetch')) {
+        if (error.message && error.message.includes('fetch')) {
             showToast('Netzwerkfehler. Bitte überprüfe deine Verbindung und versuche es erneut.', 'error');
         } else {
             showToast(`Verarbeitungsfehler: ${error.message || 'Unbekannter Fehler'}`, 'error');
@@ -506,9 +533,9 @@ async function processKeyword() {
         runButton.disabled = false;
         runButton.innerHTML = '<i class="fas fa-play me-2"></i>Ausführen';
         
-        // Clear progress interval if it exists
-        if (progressInterval) {
-            clearInterval(progressInterval);
+        // Stop following the job stream
+        if (source) {
+            source.close();
         }
     }
 }
@@ -561,7 +561,7 @@ function testModalWidthSystem() {
     }, 1000);
 }
 
-// Handle AI generation
+// Handle AI generation - subject and body stream in token by token
 async function handleWorkspaceAIGeneration() {
     if (!currentWorkspaceUsername) {
         showToast('Fehler: Kein Lead ausgewählt', 'error');
@@ -570,33 +570,99 @@ async function handleWorkspaceAIGeneration() {
     
     const button = document.getElementById('workspaceGenerateEmailBtn');
     const originalText = button.innerHTML;
-    
-    try {
-        button.innerHTML = '<i class="fas fa-spinner fa-spin"></i> Generiere...';
-        button.disabled = true;
+    const fields = {
+        subject: document.getElementById('workspaceEmailSubject'),
+        body: document.getElementById('workspaceEmailContent')
+    };
+    
+    const updateCounts = () => {
+        updateCharacterCount('workspaceEmailSubject', 'workspaceSubjectCharCount', 100);
+        updateCharacterCount('workspaceEmailContent', 'workspaceContentCharCount');
+    };
+    
+    // Streamed deltas replace the current text, which comes back if generation fails
+    const previous = { subject: fields.subject.value, body: fields.body.value };
+    const restorePrevious = () => {
+        fields.subject.value = previous.subject;
+        fields.body.value = previous.body;
+        updateCounts();
+    };
+    
+    button.innerHTML = '<i class="fas fa-spinner fa-spin"></i> Generiere...';
+    button.disabled = true;
+    fields.subject.value = '';
+    fields.body.value = '';
+    updateCounts();
+    
+    const username = currentWorkspaceUsername;
+    await new Promise(resolve => {
+        const source = new EventSource(`/draft-email/${encodeURIComponent(username)}/stream`);
+        let started = false;
         
-        const response = await fetch(`/draft-email/${currentWorkspaceUsername}`);
-        if (response.ok) {
-            const result = await response.json();
-            
-            document.getElementById('workspaceEmailSubject').value = result.subject || '';
-            document.getElementById('workspaceEmailContent').value = result.body || '';
-            
-            updateCharacterCount('workspaceEmailSubject', 'workspaceSubjectCharCount', 100);
-            updateCharacterCount('workspaceEmailContent', 'workspaceContentCharCount');
-            
+        // Close before the server ends the response, otherwise EventSource reconnects and drafts again
+        const finish = () => {
+            source.close();
+            button.innerHTML = originalText;
+            button.disabled = false;
+            resolve();
+        };
+        
+        // Without streaming, the whole draft arrives in one response
+        const draftWithoutStream = async () => {
+            try {
+                const response = await fetch(`/draft-email/${encodeURIComponent(username)}`);
+                const result = await response.json();
+                if (response.ok) {
+                    fields.subject.value = result.subject || '';
+                    fields.body.value = result.body || '';
+                    updateCounts();
+                    showToast('Email-Inhalt erfolgreich generiert!', 'success');
+                } else {
+                    restorePrevious();
+                    showToast(result.error || 'Fehler bei der Email-Generierung', 'error');
+                }
+            } catch (error) {
+                console.error('AI generation error:', error);
+                restorePrevious();
+                showToast('Ein Fehler ist bei der Email-Generierung aufgetreten', 'error');
+            }
+        };
+        
+        source.addEventListener('start', () => {
+            started = true;
+        });
+        source.addEventListener('delta', (event) => {
+            const delta = JSON.parse(event.data);
+            fields[delta.part].value += delta.text;
+            updateCounts();
+        });
+        source.addEventListener('done', (event) => {
+            const result = JSON.parse(event.data);
+            fields.subject.value = result.subject || '';
+            fields.body.value = result.body || '';
+            updateCounts();
             showToast('Email-Inhalt erfolgreich generiert!', 'success');
-        } else {
-            const error = await response.json();
+            finish();
+        });
+        source.addEventListener('failed', (event) => {
+            const error = JSON.parse(event.data);
+            restorePrevious();
             showToast(error.error || 'Fehler bei der Email-Generierung', 'error');
-        }
-    } catch (error) {
-        console.error('AI generation error:', error);
-        showToast('Ein Fehler ist bei der Email-Generierung aufgetreten', 'error');
-    } finally {
-        button.innerHTML = originalText;
-        button.disabled = false;
-    }
+            finish();
+        });
+        source.onerror = () => {
+            source.close();
+            if (!started) {
+                // The server refuses streams (503) when too many are open; fall back to a single request
+                draftWithoutStream().then(finish);
+                return;
+            }
+            console.error('AI generation stream error');
+            restorePrevious();
+            showToast('Ein Fehler ist bei der Email-Generierung aufgetreten', 'error');
+            finish();
+        };
+    });
 }
 
 // Handle save draft